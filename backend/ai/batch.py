@@ -0,0 +1,277 @@
+"""
+Nightly precomputation of AIInsight and AIBudgetRecommendation rows.
+
+``run_ai_batch`` walks users in primary-key chunks of ``AI_BATCH_CHUNK``.  It
+loads each chunk's transactions for the last ``AI_BATCH_LOOKBACK_MONTHS``
+(own and family, as the report sees them) in one query.  The analysis then
+runs on NumPy arrays for the whole chunk at once: bincounts keyed by
+(user, category, month) and the vectorized trend fit from ``ai.kernels``.  No
+per-user query or loop over transactions is involved.  Results replace the
+users' stored insights and their recommendation for the current month, so
+``GET /api/ai/insights`` and ``GET /api/ai/budget/recommendations`` are single
+indexed reads.
+
+Runs are incremental.  ``AIBatchWatermark`` records the user and family
+``DataVersion`` each user's rows were built from, plus the month they were
+built in.  Only users whose versions moved, who joined or left a family, or
+who have not been computed this month are recomputed.  Versions are read
+before the transactions, so a write that lands mid-run is picked up by the
+next run.  ``full=True`` recomputes everyone.
+"""
+import logging
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import aliased
+
+from models import db, AIBatchWatermark, AIBudgetRecommendation, AIInsight, Category, DataVersion, Transaction, User
+from utils.background import PeriodicWorker
+from utils.versioning import SCOPE_FAMILY, SCOPE_USER
+from .config import (
+    MIN_MONTHS_FOR_PREDICTION, NEEDS_CATEGORIES, PREDICTION_MONTHS_AHEAD, SAVINGS_CATEGORIES,
+    UNUSUAL_TRANSACTION_THRESHOLD, WANTS_CATEGORIES
+)
+from .kernels import fit_trends, trend_prediction
+from .services import recommendations_for_allocations
+
+logger = logging.getLogger(__name__)
+
+# Month-over-month change in spending worth an insight
+SPENDING_CHANGE_THRESHOLD = 0.1
+
+
+def _month_number(day):
+    return day.year * 12 + day.month - 1
+
+
+def _month_label(number):
+    return f'{number // 12}-{number % 12 + 1:02d}'
+
+
+def _stale_users(after, limit, month, full):
+    """Next chunk of users needing a run, with the data versions they are computed from."""
+    user_version = aliased(DataVersion)
+    family_version = aliased(DataVersion)
+    current_user_version = func.coalesce(user_version.version, 0)
+    current_family_version = func.coalesce(family_version.version, 0)
+    query = select(
+        User.id, User.family_id, current_user_version, current_family_version
+    ).outerjoin(
+        user_version, and_(user_version.scope == SCOPE_USER, user_version.scope_id == User.id)
+    ).outerjoin(
+        family_version, and_(family_version.scope == SCOPE_FAMILY, family_version.scope_id == User.family_id)
+    ).outerjoin(
+        AIBatchWatermark, AIBatchWatermark.user_id == User.id
+    ).where(User.id > after)
+    if not full:
+        query = query.where(or_(
+            AIBatchWatermark.user_id.is_(None),
+            AIBatchWatermark.month != month,
+            AIBatchWatermark.user_version != current_user_version,
+            AIBatchWatermark.family_version != current_family_version,
+            func.coalesce(AIBatchWatermark.family_id, 0) != func.coalesce(User.family_id, 0)
+        ))
+    return db.session.execute(query.order_by(User.id).limit(limit)).all()
+
+
+def _load_chunk(user_ids, start, end):
+    """(user id, type, amount, category, date) for every transaction each user can see from ``start`` up to ``end``."""
+    viewer = aliased(User)
+    return db.session.execute(
+        select(viewer.id, Transaction.type, Transaction.amount, Category.name, Transaction.date)
+        .select_from(viewer)
+        .join(Transaction, or_(
+            Transaction.user_id == viewer.id,
+            and_(viewer.family_id.isnot(None), Transaction.family_id == viewer.family_id)
+        ))
+        .outerjoin(Category, Transaction.category_id == Category.id)
+        .where(viewer.id.in_(user_ids), Transaction.date >= start, Transaction.date < end)
+    ).all()
+
+
+def analyze_accounts(user_ids, rows, first_month, current_month):
+    """
+    Insights and budget recommendations for every user in ``user_ids`` from
+    their transaction ``rows``, computed column-wise across all users.  Every
+    row must fall between ``first_month`` and ``current_month`` (else
+    ValueError): the flat bincount indices would otherwise spill into the
+    next user's cells.
+    Returns ``{user_id: (insights, recommendations or None)}``.
+    """
+    n_users = len(user_ids)
+    n_months = current_month - first_month + 1
+    user_codes = {user_id: code for code, user_id in enumerate(user_ids)}
+    category_codes = {}
+
+    count = len(rows)
+    users = np.fromiter((user_codes[row[0]] for row in rows), dtype=np.int64, count=count)
+    is_expense = np.fromiter((row[1] == 'expense' for row in rows), dtype=bool, count=count)
+    is_income = np.fromiter((row[1] == 'income' for row in rows), dtype=bool, count=count)
+    amounts = np.fromiter((row[2] or 0.0 for row in rows), dtype=np.float64, count=count)
+    categories = np.fromiter(
+        (category_codes.setdefault(row[3] or 'Uncategorized', len(category_codes)) for row in rows),
+        dtype=np.int64, count=count
+    )
+    months = np.fromiter((_month_number(row[4]) - first_month for row in rows), dtype=np.int64, count=count)
+    if count and (months.min() < 0 or months.max() >= n_months):
+        raise ValueError('Transaction outside the analyzed months')
+    names = sorted(category_codes, key=category_codes.get)
+    n_categories = max(len(names), 1)
+
+    eu, ec, em, ea = users[is_expense], categories[is_expense], months[is_expense], amounts[is_expense]
+    category_totals = np.bincount(eu * n_categories + ec, weights=ea,
+                                  minlength=n_users * n_categories).reshape(n_users, n_categories)
+    month_totals = np.bincount(eu * n_months + em, weights=ea, minlength=n_users * n_months).reshape(n_users, n_months)
+    income_totals = np.bincount(users[is_income], weights=amounts[is_income], minlength=n_users)
+
+    # Unusual expenses: z-score against each user's own mean and deviation
+    expense_count = np.bincount(eu, minlength=n_users)
+    mean = np.bincount(eu, weights=ea, minlength=n_users) / np.maximum(expense_count, 1)
+    variance = np.bincount(eu, weights=ea ** 2, minlength=n_users) / np.maximum(expense_count, 1) - mean ** 2
+    deviation = np.sqrt(np.clip(variance, 0, None))
+    deviation[deviation == 0] = 1.0
+    unusual = np.abs(ea - mean[eu]) / deviation[eu] > UNUSUAL_TRANSACTION_THRESHOLD
+    unusual_count = np.bincount(eu[unusual], minlength=n_users)
+
+    # Trend of every (user, category) over complete months, fitted in one pass
+    cells = (eu * n_categories + ec) * n_months + em
+    series = np.bincount(cells, weights=ea, minlength=n_users * n_categories * n_months)
+    seen = np.bincount(cells, minlength=n_users * n_categories * n_months) > 0
+    complete = n_months - 1
+    observed, slopes, last = fit_trends(series.reshape(-1, n_months)[:, :complete],
+                                        seen.reshape(-1, n_months)[:, :complete])
+    predictable = (observed >= MIN_MONTHS_FOR_PREDICTION).reshape(n_users, n_categories)
+    slopes, last = slopes.reshape(n_users, n_categories), last.reshape(n_users, n_categories)
+
+    def mask(group):
+        return np.array([name in group for name in names] or [False], dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        allocations = {
+            group: np.where(income_totals > 0, category_totals @ mask(members) / income_totals, 0.0)
+            for group, members in (('needs', NEEDS_CATEGORIES), ('wants', WANTS_CATEGORIES),
+                                   ('savings', SAVINGS_CATEGORIES))
+        }
+
+    results = {}
+    for code, user_id in enumerate(user_ids):
+        insights = []
+        total = category_totals[code].sum()
+        if total > 0:
+            top = int(category_totals[code].argmax())
+            share = category_totals[code, top] / total
+            insights.append(('tip', f'{names[top]} is your largest expense',
+                             f'{names[top]} accounts for {share:.0%} of your spending over the last {n_months} months.',
+                             {'category': names[top], 'total': float(category_totals[code, top]), 'share': float(share)}))
+
+        if complete >= 2:
+            last_total, previous_total = month_totals[code, complete - 1], month_totals[code, complete - 2]
+            if previous_total > 0:
+                change = (last_total - previous_total) / previous_total
+                month = _month_label(first_month + complete - 1)
+                data = {'month': month, 'total': float(last_total), 'previous_total': float(previous_total),
+                        'change': float(change)}
+                if change >= SPENDING_CHANGE_THRESHOLD:
+                    insights.append(('negative', f'Spending up {change:.0%} in {month}',
+                                     f'You spent {last_total:.2f} in {month}, up from {previous_total:.2f} the month before.', data))
+                elif change <= -SPENDING_CHANGE_THRESHOLD:
+                    insights.append(('positive', f'Spending down {-change:.0%} in {month}',
+                                     f'You spent {last_total:.2f} in {month}, down from {previous_total:.2f} the month before.', data))
+
+        if unusual_count[code]:
+            insights.append(('alert', f'{unusual_count[code]} unusual transactions',
+                             f'{unusual_count[code]} expenses were far above your usual amounts in the last {n_months} months.',
+                             {'count': int(unusual_count[code]), 'threshold': UNUSUAL_TRANSACTION_THRESHOLD}))
+
+        predicted = np.flatnonzero(predictable[code])
+        if len(predicted):
+            predictions = {names[c]: trend_prediction(last[code, c], slopes[code, c], PREDICTION_MONTHS_AHEAD)
+                           for c in predicted}
+            rising = max(predicted, key=lambda c: slopes[code, c])
+            if slopes[code, rising] > 0:
+                description = f'{names[rising]} is rising by about {slopes[code, rising]:.2f} a month.'
+            else:
+                description = 'None of your regular expenses are trending up.'
+            insights.append(('trend', 'Expense forecast', description, predictions))
+
+        recommendations = None
+        if income_totals[code] > 0:
+            recommendations = recommendations_for_allocations(
+                {group: float(values[code]) for group, values in allocations.items()}
+            )
+        results[user_id] = (insights, recommendations)
+    return results
+
+
+def _store(results, versions, month):
+    """Replace the chunk's insights, current-month recommendations and watermarks."""
+    user_ids = list(results)
+    now = datetime.utcnow()
+    applied = dict(db.session.execute(
+        select(AIBudgetRecommendation.user_id, AIBudgetRecommendation.applied)
+        .where(AIBudgetRecommendation.user_id.in_(user_ids), AIBudgetRecommendation.month == month)
+    ).all())
+
+    db.session.execute(delete(AIInsight).where(AIInsight.user_id.in_(user_ids)))
+    db.session.execute(delete(AIBudgetRecommendation).where(
+        AIBudgetRecommendation.user_id.in_(user_ids), AIBudgetRecommendation.month == month
+    ))
+    db.session.execute(delete(AIBatchWatermark).where(AIBatchWatermark.user_id.in_(user_ids)))
+
+    insights = [{
+        'user_id': user_id, 'type': kind, 'title': title[:100], 'description': description[:255],
+        'data': data, 'created_at': now
+    } for user_id, (rows, _) in results.items() for kind, title, description, data in rows]
+    recommendations = [{
+        'user_id': user_id, 'month': month, 'recommendations': advice,
+        'applied': bool(applied.get(user_id)), 'created_at': now
+    } for user_id, (_, advice) in results.items() if advice is not None]
+    watermarks = [{
+        'user_id': user_id, 'family_id': family_id, 'user_version': user_version,
+        'family_version': family_version, 'month': month, 'computed_at': now
+    } for user_id, (family_id, user_version, family_version) in versions.items()]
+
+    for model, rows in ((AIInsight, insights), (AIBudgetRecommendation, recommendations),
+                        (AIBatchWatermark, watermarks)):
+        if rows:
+            db.session.execute(insert(model), rows)
+    db.session.commit()
+
+
+def run_ai_batch(app, full=False):
+    """Recompute stale users' insights and recommendations. Returns the number of users processed."""
+    config = app.config
+    today = date.today()
+    month = today.strftime('%Y-%m')
+    current_month = _month_number(today)
+    first_month = current_month - config['AI_BATCH_LOOKBACK_MONTHS']
+    start = date(first_month // 12, first_month % 12 + 1, 1)
+    # Transactions dated after this month wait for their own month
+    end = date((current_month + 1) // 12, (current_month + 1) % 12 + 1, 1)
+
+    after, processed = 0, 0
+    while True:
+        chunk = _stale_users(after, config['AI_BATCH_CHUNK'], month, full)
+        if not chunk:
+            break
+        versions = {user_id: (family_id, user_version, family_version)
+                    for user_id, family_id, user_version, family_version in chunk}
+        user_ids = list(versions)
+        results = analyze_accounts(user_ids, _load_chunk(user_ids, start, end), first_month, current_month)
+        _store(results, versions, month)
+        processed += len(user_ids)
+        after = user_ids[-1]
+
+    if processed:
+        logger.info('AI batch recomputed insights for %d users', processed)
+    return processed
+
+
+def init_ai_batch(app):
+    """Create the batch worker; it starts with the first request."""
+    worker = PeriodicWorker(app, 'ai-batch', run_ai_batch, app.config['AI_BATCH_INTERVAL'],
+                            enabled=app.config['AI_BATCH_ENABLED'])
+    app.extensions['ai_batch'] = worker
+    app.before_request(worker.ensure_started)
+    return worker
@@ -0,0 +1,541 @@
+"""
+Automatic transaction categorization, trained and served on the box.
+
+The model is a small fastText-style classifier: each description is reduced to
+lowercase words (digits dropped, they are card and store numbers), and its
+words, word bigrams and character trigrams are hashed into
+``CATEGORIZER_BUCKETS`` embedding rows.  The rows are averaged by an
+``EmbeddingBag`` and a single ``Linear`` layer scores every known category.
+Labels are ``(type, category name)`` pairs limited to the categories the
+app offers every user (``CATEGORIZER_SHARED_CATEGORIES``, names compared
+case-insensitively).  Only transactions filed under those categories are
+trained on, pooled over the whole ledger so a new user gets useful
+suggestions from day one, and users' own category names never reach the
+shared model.  Suggestions are ranked among the user's own categories when
+any of them are known to the model, otherwise among the shared ones.
+
+Training runs on the ``categorizer`` background worker whenever the labelled
+transactions changed since the last model.  The float model is saved to the
+instance folder (and can be exported with ``export_onnx``).  Inference uses a
+dynamically quantized copy: int8 linear weights and 8-bit row-wise
+embeddings.
+
+Serving goes through a ``MicroBatcher``.  Concurrent requests queue their
+rows and a single thread runs them as one forward pass once
+``CATEGORIZER_MAX_BATCH`` rows are waiting or ``CATEGORIZER_MAX_WAIT_MS`` has
+passed.  Bulk requests that fill a batch on their own skip the queue and run
+inline in chunks of ``CATEGORIZER_CHUNK``.  Scores are memoized per normalized
+description, and repeated descriptions within a request are scored once, so
+imports of recurring merchants barely touch the model.
+
+torch is optional: without it the categorizer reports itself unavailable and
+categories have to be chosen by hand, as before.
+
+Imports are categorized through ``POST /api/transactions/categorize`` with
+up to ``CATEGORIZER_MAX_ROWS`` descriptions per request; there is no
+server-side import endpoint, so creating the imported rows is still one
+``POST /api/transactions`` each.
+
+Unverified: the training, quantization, save/load and batched-inference
+code has not been run.  Its tests (tests/test_categorizer.py, marked
+``requires_torch``) skip where torch is not installed, which includes every
+environment this code has been tested in so far.  Run them with torch from
+requirements.txt before relying on the feature.
+"""
+import copy
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import and_, func, or_, select
+
+from models import db, Category, Transaction
+from utils.background import PeriodicWorker
+from utils.cache import TTLCache
+from utils.lookups import _category_map
+from .config import (
+    CATEGORIZER_BATCH_SIZE, CATEGORIZER_BUCKETS, CATEGORIZER_CHUNK, CATEGORIZER_DIM, CATEGORIZER_EPOCHS,
+    CATEGORIZER_LEARNING_RATE, CATEGORIZER_MAX_TRAINING_ROWS, CATEGORIZER_MIN_LABEL_COUNT,
+    CATEGORIZER_MIN_TRAINING_ROWS, CATEGORIZER_SHARED_CATEGORIES, CATEGORIZER_TOP
+)
+
+try:
+    import torch
+    from torch import nn
+except ImportError:  # torch is optional, categories are then chosen by hand
+    torch = None
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r'[^\W\d_]+')
+
+# (type, casefolded name) -> spelling of the shared categories
+_SHARED = {(category_type, name.casefold()): name
+           for category_type, names in CATEGORIZER_SHARED_CATEGORIES.items() for name in names}
+
+
+class CategorizerUnavailable(Exception):
+    """Raised when there is no model to categorize with (no torch, or not trained yet)."""
+
+
+class CategorizerBusy(CategorizerUnavailable):
+    """Raised when a batched prediction doesn't finish within the categorizer's timeout."""
+
+
+def normalize_description(description):
+    """Lowercase words of ``description`` with digits and punctuation dropped."""
+    return ' '.join(_WORD.findall((description or '').lower()))
+
+
+def _bucket(feature):
+    return zlib.crc32(feature.encode('utf-8')) % CATEGORIZER_BUCKETS
+
+
+def description_features(text):
+    """Hashed word, word bigram and character trigram features of a normalized description."""
+    words = text.split()
+    features = {f'w:{word}' for word in words}
+    features.update(f'b:{first} {second}' for first, second in zip(words, words[1:]))
+    for word in words:
+        padded = f'<{word}>'
+        features.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return [_bucket(feature) for feature in features]
+
+
+def _encode(feature_lists):
+    """EmbeddingBag inputs for a batch: flat indices, bag offsets and averaging weights."""
+    lengths = np.fromiter(map(len, feature_lists), dtype=np.int64, count=len(feature_lists))
+    offsets = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    indices = np.fromiter(chain.from_iterable(feature_lists), dtype=np.int64, count=int(lengths.sum()))
+    weights = np.repeat(1.0 / lengths, lengths).astype(np.float32)
+    return torch.from_numpy(indices), torch.from_numpy(offsets), torch.from_numpy(weights)
+
+
+if torch is not None:
+    class CategorizerNet(nn.Module):
+        """Averaged hashed-feature embeddings followed by one linear layer."""
+
+        def __init__(self, n_labels, buckets=CATEGORIZER_BUCKETS, dim=CATEGORIZER_DIM):
+            super().__init__()
+            # 'sum' with per-sample weights of 1/length is a mean that the quantized bag supports too
+            self.embedding = nn.EmbeddingBag(buckets, dim, mode='sum', sparse=True)
+            self.output = nn.Linear(dim, n_labels)
+            nn.init.uniform_(self.embedding.weight, -1.0 / dim, 1.0 / dim)
+            nn.init.zeros_(self.output.weight)
+            nn.init.zeros_(self.output.bias)
+
+        def forward(self, indices, offsets, weights):
+            return self.output(self.embedding(indices, offsets, per_sample_weights=weights))
+
+
+def quantize_net(net):
+    """Inference copy of ``net`` with int8 linear weights and 8-bit row-wise embeddings."""
+    from torch.ao.quantization import default_dynamic_qconfig, float_qparams_weight_only_qconfig, quantize_dynamic
+    try:
+        return quantize_dynamic(copy.deepcopy(net).eval(), {
+            nn.Linear: default_dynamic_qconfig,
+            nn.EmbeddingBag: float_qparams_weight_only_qconfig
+        })
+    except (RuntimeError, AssertionError):
+        logger.warning('Quantized kernels unavailable, serving the float categorizer', exc_info=True)
+        return net.eval()
+
+
+def train_net(feature_lists, targets, weights, n_labels, epochs=CATEGORIZER_EPOCHS,
+              batch_size=CATEGORIZER_BATCH_SIZE, learning_rate=CATEGORIZER_LEARNING_RATE, seed=0):
+    """Fit a ``CategorizerNet`` on hashed features with weighted cross-entropy."""
+    generator = torch.Generator().manual_seed(seed)
+    torch.manual_seed(seed)
+    net = CategorizerNet(n_labels)
+    sparse_optimizer = torch.optim.SparseAdam(list(net.embedding.parameters()), lr=learning_rate)
+    dense_optimizer = torch.optim.Adam(net.output.parameters(), lr=learning_rate)
+    targets = torch.as_tensor(targets, dtype=torch.int64)
+    weights = torch.as_tensor(weights, dtype=torch.float32)
+    loss_fn = nn.CrossEntropyLoss(reduction='none')
+
+    net.train()
+    for _ in range(epochs):
+        order = torch.randperm(len(feature_lists), generator=generator)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            logits = net(*_encode([feature_lists[i] for i in batch.tolist()]))
+            batch_weights = weights[batch]
+            loss = (loss_fn(logits, targets[batch]) * batch_weights).sum() / batch_weights.sum()
+            sparse_optimizer.zero_grad()
+            dense_optimizer.zero_grad()
+            loss.backward()
+            sparse_optimizer.step()
+            dense_optimizer.step()
+    return net.eval()
+
+
+class CategorizerModel:
+    """A trained network, its ``(type, name)`` labels and the ledger watermark it was trained at."""
+
+    def __init__(self, net, labels, watermark=None):
+        self.net = net
+        self.labels = [tuple(label) for label in labels]
+        self.watermark = tuple(watermark) if watermark is not None else None
+        self.inference = quantize_net(net)
+        self.version = 0
+        self.by_type = {}
+        for index, (category_type, name) in enumerate(self.labels):
+            self.by_type.setdefault(category_type, {})[name.casefold()] = index
+
+    @classmethod
+    def train(cls, samples, watermark=None, **options):
+        """
+        Train on ``(description, type, category name, count)`` rows.  Returns
+        None when there is too little labelled data.
+        """
+        label_counts, spellings, pairs = {}, {}, {}
+        for description, category_type, name, count in samples:
+            text = normalize_description(description)
+            if not text or not name:
+                continue
+            key = (category_type, name.strip().casefold())
+            label_counts[key] = label_counts.get(key, 0) + count
+            spelling = spellings.setdefault(key, {})
+            spelling[name.strip()] = spelling.get(name.strip(), 0) + count
+            pairs[(text, key)] = pairs.get((text, key), 0) + count
+
+        keys = sorted(key for key, count in label_counts.items() if count >= CATEGORIZER_MIN_LABEL_COUNT)
+        index = {key: i for i, key in enumerate(keys)}
+        rows = [(text, index[key], count) for (text, key), count in pairs.items() if key in index]
+        if len(rows) < CATEGORIZER_MIN_TRAINING_ROWS or not keys:
+            return None
+
+        features = {}
+        feature_lists = [features.get(text) or features.setdefault(text, description_features(text))
+                         for text, _, _ in rows]
+        net = train_net(feature_lists, [target for _, target, _ in rows],
+                        [1.0 + np.log(count) for _, _, count in rows], len(keys), **options)
+        labels = [(key[0], max(spellings[key], key=spellings[key].get)) for key in keys]
+        return cls(net, labels, watermark)
+
+    def logits(self, feature_lists):
+        with torch.inference_mode():
+            return self.inference(*_encode(feature_lists)).numpy()
+
+    def save(self, path):
+        temporary = f'{path}.tmp'
+        torch.save({
+            'state_dict': self.net.state_dict(),
+            'labels': [list(label) for label in self.labels],
+            'watermark': list(self.watermark) if self.watermark is not None else None,
+            'buckets': CATEGORIZER_BUCKETS,
+            'dim': CATEGORIZER_DIM
+        }, temporary)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        """The model saved at ``path``, or None if there is none compatible with the current settings."""
+        if not os.path.exists(path):
+            return None
+        stored = torch.load(path, weights_only=True)
+        if stored['buckets'] != CATEGORIZER_BUCKETS or stored['dim'] != CATEGORIZER_DIM:
+            return None
+        if any((category_type, name.casefold()) not in _SHARED for category_type, name in stored['labels']):
+            return None  # trained on other labels than the shared categories
+        net = CategorizerNet(len(stored['labels']))
+        net.load_state_dict(stored['state_dict'])
+        return cls(net.eval(), stored['labels'], stored['watermark'])
+
+    def export_onnx(self, path, opset_version=17):
+        """Write the float model as ONNX with inputs ``indices``, ``offsets`` and ``weights``."""
+        torch.onnx.export(
+            self.net, _encode([[1, 2, 3], [4, 5]]), path,
+            input_names=['indices', 'offsets', 'weights'], output_names=['logits'],
+            dynamic_axes={'indices': {0: 'features'}, 'offsets': {0: 'rows'},
+                          'weights': {0: 'features'}, 'logits': {0: 'rows'}},
+            opset_version=opset_version
+        )
+
+
+class MicroBatcher:
+    """
+    Collect rows submitted by concurrent callers and run them through
+    ``forward(model, feature_lists)`` together.  A batch closes when
+    ``max_batch`` rows are waiting or ``max_wait`` seconds after its first
+    request arrived.  The thread starts with the first submission.
+    """
+
+    def __init__(self, forward, max_batch=256, max_wait=0.005):
+        self.forward = forward
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, model, feature_lists):
+        """A Future for the logits of ``feature_lists``, one row each."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='categorizer-batcher', daemon=True)
+                    self._thread.start()
+        future = Future()
+        self._queue.put((model, feature_lists, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        rows = len(batch[0][1])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[1])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # A model swap can land mid-batch; each request is scored by the model it asked for
+            by_model = {}
+            for item in batch:
+                by_model.setdefault(id(item[0]), []).append(item)
+            for items in by_model.values():
+                try:
+                    logits = self.forward(items[0][0], [row for _, rows, _ in items for row in rows])
+                except Exception as e:
+                    for _, _, future in items:
+                        future.set_exception(e)
+                    continue
+                start = 0
+                for _, rows, future in items:
+                    future.set_result(logits[start:start + len(rows)])
+                    start += len(rows)
+
+
+class Categorizer:
+    """The app's categorizer: the current model, the micro-batcher and the memo cache."""
+
+    def __init__(self, model_path, max_batch=256, max_wait=0.005, cache_size=50000, cache_ttl=86400,
+                 timeout=5, threshold=0.6):
+        self.model_path = model_path
+        self.timeout = timeout
+        self.threshold = threshold
+        self.model = None
+        self.memo = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._batcher = MicroBatcher(self._forward, max_batch, max_wait)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._versions = 0
+
+    @property
+    def available(self):
+        return torch is not None
+
+    @staticmethod
+    def _forward(model, feature_lists):
+        return model.logits(feature_lists)
+
+    def install(self, model):
+        with self._lock:
+            self._versions += 1
+            model.version = self._versions
+            self.model = model
+        self.memo.clear()
+
+    def current(self):
+        """The model to predict with, loading a saved one on first use."""
+        if torch is None:
+            raise CategorizerUnavailable('Automatic categorization needs torch installed')
+        if self.model is None and not self._loaded:
+            with self._lock:
+                stored = None if self._loaded else CategorizerModel.load(self.model_path)
+                self._loaded = True
+            if stored is not None and self.model is None:
+                self.install(stored)
+        if self.model is None:
+            raise CategorizerUnavailable('The categorizer has not been trained yet')
+        return self.model
+
+    def _scores(self, model, texts):
+        """Logits per distinct normalized text, from the memo or one batched forward pass."""
+        scores, misses = {}, []
+        for text in dict.fromkeys(texts):
+            cached = self.memo.get((model.version, text))
+            if cached is None:
+                misses.append(text)
+            else:
+                scores[text] = cached
+
+        if misses:
+            features = [description_features(text) for text in misses]
+            if len(misses) >= self._batcher.max_batch:
+                # Already a full batch: queueing would only add latency
+                logits = np.concatenate([
+                    model.logits(features[start:start + CATEGORIZER_CHUNK])
+                    for start in range(0, len(features), CATEGORIZER_CHUNK)
+                ])
+            else:
+                future = self._batcher.submit(model, features)
+                try:
+                    logits = future.result(timeout=self.timeout)
+                except TimeoutError:
+                    # The batch still completes and sets the result on the abandoned future
+                    raise CategorizerBusy('The categorizer is busy, please try again shortly') from None
+            for text, row in zip(misses, logits):
+                scores[text] = row
+                self.memo.set((model.version, text), row)
+        return scores
+
+    def _choices(self, model, identity, category_type):
+        """Label indices of ``category_type`` and which of them can be suggested to this user."""
+        labels = model.by_type.get(category_type, {})
+        own = {name.casefold(): (category_id, name)
+               for (name, kind), category_id in _category_map(identity.user_id).by_name.items()
+               if kind == category_type}
+        known = [(index, *own[key]) for key, index in labels.items() if key in own]
+        if not known:
+            # Nothing in common with the model yet: suggest the shared categories, which get created on use
+            known = [(index, None, _SHARED[(category_type, key)]) for key, index in labels.items()
+                     if (category_type, key) in _SHARED]
+        return np.fromiter(labels.values(), dtype=np.intp, count=len(labels)), known
+
+    def suggest(self, identity, descriptions, category_type='expense', top=CATEGORIZER_TOP):
+        """
+        Up to ``top`` ``{category, category_id, confidence}`` suggestions per
+        description, best first (an empty list for descriptions without words).
+        ``category_id`` is None for categories the user does not have yet.
+        """
+        model = self.current()
+        texts = [normalize_description(description) for description in descriptions]
+        labels, choices = self._choices(model, identity, category_type)
+        rows = [i for i, text in enumerate(texts) if text]
+        suggestions = [[] for _ in texts]
+        if not rows or not choices:
+            return suggestions
+
+        scores = self._scores(model, [texts[i] for i in rows])
+        logits = np.stack([scores[texts[i]] for i in rows])[:, labels]
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        # Confidence is the probability among all categories of the type, ranked within the user's own
+        position = {index: column for column, index in enumerate(labels)}
+        columns = probabilities[:, [position[index] for index, _, _ in choices]]
+        top = min(top, len(choices))
+        best = np.argsort(-columns, axis=1, kind='stable')[:, :top]
+        for i, (row, order) in enumerate(zip(rows, best)):
+            suggestions[row] = [{
+                'category': choices[column][2],
+                'category_id': choices[column][1],
+                'confidence': round(float(columns[i, column]), 4)
+            } for column in order]
+        return suggestions
+
+    def assign(self, identity, description, category_type):
+        """
+        The best suggestion for ``description``, or None when it is not
+        confident enough to file it, or there is no model or it is too busy.
+        """
+        try:
+            suggestions = self.suggest(identity, [description], category_type, top=1)[0]
+        except CategorizerUnavailable:
+            return None
+        if suggestions and suggestions[0]['confidence'] >= self.threshold:
+            return suggestions[0]
+        return None
+
+    def refresh(self):
+        """Retrain when the labelled transactions moved since the current model. Returns whether it did."""
+        watermark = _training_watermark()
+        db.session.rollback()
+        if self.model is not None and self.model.watermark == watermark:
+            return False
+        stored = CategorizerModel.load(self.model_path)
+        self._loaded = True
+        if stored is not None and (stored.watermark == watermark or self.model is None):
+            self.install(stored)
+            if stored.watermark == watermark:
+                return False
+
+        samples = _training_rows(CATEGORIZER_MAX_TRAINING_ROWS)
+        db.session.rollback()
+        started = time.perf_counter()
+        model = CategorizerModel.train(samples, watermark)
+        if model is None:
+            return False
+        model.save(self.model_path)
+        self.install(model)
+        logger.info('Trained categorizer on %d rows, %d categories in %.1fs',
+                    len(samples), len(model.labels), time.perf_counter() - started)
+        return True
+
+
+def _labelled():
+    return (Transaction.description.is_not(None), Transaction.description != '')
+
+
+def _training_watermark():
+    """Count and newest id of labelled transactions; a new model is trained when they move."""
+    count, last = db.session.execute(
+        select(func.count(Transaction.id), func.max(Transaction.id)).where(*_labelled())
+    ).one()
+    return (count, last or 0)
+
+
+def _training_rows(limit):
+    """
+    The most frequent ``(description, type, category name, count)``
+    combinations filed under a shared category, with its shared spelling.
+    """
+    count = func.count(Transaction.id)
+    name = func.lower(Category.name)
+    shared = or_(*(
+        and_(Transaction.type == category_type, name.in_([key.lower() for key in names]))
+        for category_type, names in CATEGORIZER_SHARED_CATEGORIES.items()
+    ))
+    rows = db.session.execute(
+        select(Transaction.description, Transaction.type, name, count)
+        .join(Category, Category.id == Transaction.category_id)
+        .where(*_labelled(), shared)
+        .group_by(Transaction.description, Transaction.type, name)
+        .order_by(count.desc())
+        .limit(limit)
+    ).all()
+    return [(description, category_type, _SHARED[(category_type, key.casefold())], total)
+            for description, category_type, key, total in rows if (category_type, key.casefold()) in _SHARED]
+
+
+def refresh_categorizer(app):
+    return app.extensions['categorizer'].refresh()
+
+
+def init_categorizer(app):
+    """Create the app's categorizer and its training worker; the worker starts with the first request."""
+    config = app.config
+    categorizer = Categorizer(
+        config['CATEGORIZER_MODEL_PATH'] or os.path.join(app.instance_path, 'categorizer.pt'),
+        max_batch=config['CATEGORIZER_MAX_BATCH'],
+        max_wait=config['CATEGORIZER_MAX_WAIT_MS'] / 1000,
+        cache_size=config['CATEGORIZER_CACHE_SIZE'],
+        cache_ttl=config['CATEGORIZER_CACHE_TTL'],
+        threshold=config['CATEGORIZER_ASSIGN_THRESHOLD']
+    )
+    app.extensions['categorizer'] = categorizer
+    worker = PeriodicWorker(app, 'categorizer', refresh_categorizer, config['CATEGORIZER_RETRAIN_INTERVAL'],
+                            enabled=config['CATEGORIZER_ENABLED'] and torch is not None)
+    app.extensions['categorizer_worker'] = worker
+    app.before_request(worker.ensure_started)
+    return categorizer
@@ -51,6 +51,10 @@ FAMILY_MEMBER_WEIGHTS = {
     'dependent': 0.8,
     'special_needs': 1.3
 }
+FAMILY_OPTIMIZER_LOOKBACK_MONTHS = 6  # Complete months of spending the optimizer anchors on
+FAMILY_OPTIMIZER_CUT_SEGMENTS = ((0.1, 1.0), (0.15, 3.0), (0.75, 10.0))  # (share of history, relative cost) of deeper cuts
+FAMILY_OPTIMIZER_RAISE_COST = 2.0  # Relative cost of raising a category above its history
+FAMILY_OPTIMIZER_SAVINGS_RAISE_COST = 0.1  # Raising savings is cheap, so leftover budget goes there
 
 # AI Chat Settings
 CHAT_SYSTEM_PROMPT = """You are a knowledgeable financial advisor AI. Use the provided context to give specific, 
@@ -72,4 +76,35 @@ NOTIFICATION_PRIORITIES = {
 # Savings Plan Settings
 DEFAULT_SAVINGS_PERCENTAGE = 0.2  # Default 20% savings rate
 AGGRESSIVE_SAVINGS_PERCENTAGE = 0.4  # For accelerated goals
-CONSERVATIVE_SAVINGS_PERCENTAGE = 0.1  # For more relaxed goals 
\ No newline at end of file
+CONSERVATIVE_SAVINGS_PERCENTAGE = 0.1  # For more relaxed goals 
+
+# Savings Simulation Settings
+SAVINGS_SIMULATION_PATHS = 100_000  # Monte Carlo paths per request
+SAVINGS_SIMULATION_MAX_CELLS = 2_400_000  # paths x months cap; far-off targets get fewer paths
+SAVINGS_SIMULATION_PERCENTILES = (10, 50, 90)  # Percentile bands reported
+SAVINGS_SIMULATION_BANDS = 24  # Months (evenly spaced) with percentile bands
+SAVINGS_SIMULATION_BINS = 4096  # Histogram resolution for percentiles
+SAVINGS_SIMULATION_LOOKBACK_MONTHS = 24  # Complete months of history sampled
+SAVINGS_SIMULATION_MIN_MONTHS = 3  # Months of history needed to simulate
+SAVINGS_SIMULATION_HORIZON_MONTHS = 60  # Simulated months when there is no target date
+
+# Transaction Categorizer Settings
+CATEGORIZER_BUCKETS = 2 ** 17  # Hashed feature buckets (embedding rows)
+CATEGORIZER_DIM = 32  # Embedding width
+CATEGORIZER_EPOCHS = 5  # Passes over the training rows per retrain
+CATEGORIZER_BATCH_SIZE = 256  # Training minibatch
+CATEGORIZER_LEARNING_RATE = 0.02
+CATEGORIZER_MAX_TRAINING_ROWS = 200_000  # Most frequent distinct (description, category) pairs trained on
+CATEGORIZER_MIN_TRAINING_ROWS = 20  # Distinct labelled descriptions needed to train at all
+CATEGORIZER_MIN_LABEL_COUNT = 3  # Transactions a category needs to be learned
+CATEGORIZER_CHUNK = 4096  # Rows per forward pass for bulk requests
+CATEGORIZER_TOP = 3  # Suggestions returned per description
+# The only labels the shared model learns: the categories the app offers every user
+# (frontend/src/utils/constants.js) and the budget groups above.  Users' own
+# category names never leave their account.
+CATEGORIZER_SHARED_CATEGORIES = {
+    'expense': ['EMI', 'Hospital', 'Emergency Fund and Targets', 'Rent', 'Shopping', 'Travel', 'Subscriptions',
+                'Household', 'Food', 'Entertainment', 'Others', 'Investments',
+                *NEEDS_CATEGORIES, *WANTS_CATEGORIES, *SAVINGS_CATEGORIES],
+    'income': ['Salary', 'Business', 'Freelance', 'Rental', 'Others']
+}
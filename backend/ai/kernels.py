@@ -0,0 +1,288 @@
+"""
+Vectorized analytics kernels and the process pool that runs them.
+
+Transactions are encoded once into compact column arrays (``TransactionArrays``):
+amounts as float64, and category and calendar month as int32 codes.  The
+kernels work on those arrays with NumPy alone, so they are cheap to ship to
+another process.
+
+``AnalyticsPool`` keeps warm worker processes.  To run a kernel it copies the
+arrays into one ``multiprocessing.shared_memory`` block and sends only the
+block's name and layout.  The worker maps the arrays in place, with no
+pickling of transaction lists, and returns a small summary.  CPU-bound
+analyses then run in parallel instead of queueing behind the Flask worker's
+GIL.  With ``ANALYTICS_PROCESSES = 0`` kernels run inline.
+
+The workers are forked when the app is created, while the process still has
+a single thread.  Forking later, next to the background workers and request
+threads, could hand a child a lock some other thread was holding.  If the
+pool breaks it is therefore not re-forked: kernels run inline until the app
+restarts.  A process that inherits the pool by forking (a pre-forking server
+that loads the app in its master) gets a fresh pool on first use if it is
+still single-threaded, and runs inline otherwise.
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TransactionArrays = namedtuple('TransactionArrays', ['amounts', 'category_codes', 'months', 'categories'])
+
+_ARRAY_FIELDS = (('amounts', np.float64), ('category_codes', np.int32), ('months', np.int32))
+
+
+def _parse_month(value):
+    """Months since year 0 of a date, datetime or ISO date string."""
+    if isinstance(value, str):
+        return int(value[:4]) * 12 + int(value[5:7]) - 1
+    return value.year * 12 + value.month - 1
+
+
+def encode_transactions(amounts, categories, dates):
+    """Column arrays for parallel sequences of amounts, category names and dates."""
+    codes = {}
+    category_codes = np.fromiter(
+        (codes.setdefault(c, len(codes)) for c in categories), dtype=np.int32, count=len(categories)
+    )
+    names = [None] * len(codes)
+    for name, code in codes.items():
+        names[code] = name
+    return TransactionArrays(
+        np.asarray(amounts, dtype=np.float64),
+        category_codes,
+        np.fromiter((_parse_month(d) for d in dates), dtype=np.int32, count=len(dates)),
+        names
+    )
+
+
+def spending_kernel(amounts, category_codes, months, n_categories, threshold):
+    """Totals, per-category sums and the indices of unusual amounts (|z| > threshold)."""
+    if len(amounts) == 0:
+        return {'total': 0.0, 'mean': 0.0, 'category_totals': [0.0] * n_categories, 'unusual': []}
+    mean = float(amounts.mean())
+    std = float(amounts.std())
+    # StandardScaler leaves the scale at 1 for constant input
+    z_scores = (amounts - mean) / (std if std > 0 else 1.0)
+    return {
+        'total': float(amounts.sum()),
+        'mean': mean,
+        'category_totals': np.bincount(category_codes, weights=amounts, minlength=n_categories).tolist(),
+        'unusual': np.flatnonzero(np.abs(z_scores) > threshold).tolist()
+    }
+
+
+def fit_trends(totals, seen):
+    """
+    Least-squares slope and last value of every row of ``totals`` at once.
+
+    Only the columns marked in ``seen`` count, numbered 0, 1, ... in order, as
+    ``np.polyfit`` over each row's observed values would.  Returns
+    ``(observed_count, slope, last_value)`` arrays.
+    """
+    observed = seen.sum(axis=1)
+    x = np.where(seen, np.cumsum(seen, axis=1) - 1, 0).astype(np.float64)
+    y = np.where(seen, totals, 0.0)
+    sum_x, sum_y = x.sum(axis=1), y.sum(axis=1)
+    numerator = observed * (x * y).sum(axis=1) - sum_x * sum_y
+    denominator = observed * (x * x).sum(axis=1) - sum_x ** 2
+    slope = np.divide(numerator, denominator, out=np.zeros(len(totals)), where=denominator > 0)
+    last_column = seen.shape[1] - 1 - np.argmax(seen[:, ::-1], axis=1)
+    return observed, slope, totals[np.arange(len(totals)), last_column]
+
+
+def trend_prediction(last_amount, trend, months_ahead):
+    return {
+        'current_monthly': float(last_amount),
+        'trend': float(trend),
+        'predicted_next_months': [max(0.0, float(last_amount + trend * i)) for i in range(1, months_ahead + 1)]
+    }
+
+
+def prediction_kernel(amounts, category_codes, months, n_categories, months_ahead, min_months):
+    """Linear-trend forecast of each category's monthly totals, for categories with enough months."""
+    if len(amounts) == 0:
+        return {}
+    first_month = int(months.min())
+    span = int(months.max()) - first_month + 1
+    totals = np.zeros((n_categories, span))
+    np.add.at(totals, (category_codes, months - first_month), amounts)
+    seen = np.zeros((n_categories, span), dtype=bool)
+    seen[category_codes, months - first_month] = True
+
+    observed, slopes, last = fit_trends(totals, seen)
+    return {
+        int(code): trend_prediction(last[code], slopes[code], months_ahead)
+        for code in np.flatnonzero(observed >= min_months)
+    }
+
+
+KERNELS = {
+    'spending': spending_kernel,
+    'prediction': prediction_kernel
+}
+
+
+def _run_shared(kernel, block_name, layout, kwargs):
+    """Worker entry point: map the arrays out of shared memory and run ``kernel``."""
+    # Pool workers share the parent's resource tracker, so attaching registers nothing new
+    block = shared_memory.SharedMemory(name=block_name)
+    arrays = None
+    try:
+        arrays = {
+            field: np.ndarray((length,), dtype=dtype, buffer=block.buf, offset=offset)
+            for field, dtype, length, offset in layout
+        }
+        return KERNELS[kernel](**arrays, **kwargs)
+    finally:
+        del arrays
+        block.close()
+
+
+def _warm():
+    return True
+
+
+def summarize_spending(summary, arrays):
+    """Shape a spending kernel result like analyze_spending_patterns (minus unusual rows)."""
+    return {
+        'total_spent': summary['total'],
+        'average_per_transaction': summary['mean'],
+        'category_breakdown': dict(zip(arrays.categories, summary['category_totals']))
+    }
+
+
+def name_predictions(predictions, arrays):
+    return {arrays.categories[code]: prediction for code, prediction in predictions.items()}
+
+
+def add_commitments(predictions, committed):
+    """
+    Raise named predictions to the amounts recurring rules already commit
+    each category to (``{category: [amount per month ahead]}``).  Categories
+    with too little history for a trend are forecast from their rules alone.
+    """
+    for category, amounts in committed.items():
+        prediction = predictions.get(category)
+        if prediction is None:
+            prediction = predictions[category] = trend_prediction(amounts[0], 0.0, len(amounts))
+        prediction['predicted_next_months'] = [
+            max(predicted, amount) for predicted, amount in zip(prediction['predicted_next_months'], amounts)
+        ]
+        prediction['committed_next_months'] = amounts
+    return predictions
+
+
+class AnalyticsPool:
+    """Warm process pool for the kernels above; falls back to inline execution."""
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._executor = None
+        self._pid = None  # process that created the executor
+        self._lock = threading.Lock()
+        self._broken = False
+
+    def _get_executor(self):
+        """This process's executor, created on first use, or None to run inline."""
+        with self._lock:
+            if self._executor is not None and self._pid != os.getpid():
+                # Inherited across a fork (a pre-forking server that loaded the app first): the
+                # executor's manager thread stayed in the parent, so nothing submitted here would
+                # ever complete.  Fork a fresh pool only while this process has no other threads.
+                self._executor = None
+                if threading.active_count() > 1:
+                    logger.warning('Analytics pool inherited by process %d; running kernels inline', os.getpid())
+                    self._broken = True
+            if self._broken or not self.processes:
+                return None
+            if self._executor is None:
+                if sys.platform != 'win32':
+                    # Start the tracker before forking so workers share it instead of each starting
+                    # their own, which would report every attached block as leaked
+                    resource_tracker.ensure_running()
+                # fork keeps worker start-up cheap and never re-imports the app module
+                context = multiprocessing.get_context('fork' if sys.platform.startswith('linux') else None)
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+
+    def warm(self, wait=True):
+        """Start the worker processes now instead of on the first report."""
+        executor = self._get_executor()
+        if executor is None:
+            return
+        futures = [executor.submit(_warm) for _ in range(self.processes)]
+        if wait:
+            for future in futures:
+                future.result()
+
+    @property
+    def inline(self):
+        return not self.processes or self._broken
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def run(self, kernel, arrays, **kwargs):
+        """Run ``KERNELS[kernel]`` over ``arrays`` (a TransactionArrays) and return its result."""
+        kwargs['n_categories'] = len(arrays.categories)
+        columns = {field: np.ascontiguousarray(getattr(arrays, field), dtype=dtype) for field, dtype in _ARRAY_FIELDS}
+        executor = None if len(arrays.amounts) == 0 else self._get_executor()
+        if executor is None:
+            return KERNELS[kernel](**columns, **kwargs)
+
+        layout, offset = [], 0
+        for field, dtype in _ARRAY_FIELDS:
+            offset = -(-offset // 8) * 8  # keep every array 8-byte aligned
+            layout.append((field, np.dtype(dtype).str, len(columns[field]), offset))
+            offset += columns[field].nbytes
+
+        block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            for field, dtype, length, start in layout:
+                np.ndarray((length,), dtype=dtype, buffer=block.buf, offset=start)[:] = columns[field]
+            try:
+                return executor.submit(_run_shared, kernel, block.name, layout, kwargs).result()
+            except BrokenProcessPool:
+                # Re-forking now would copy the locks of every running thread into the new workers
+                logger.warning('Analytics pool broke; running %s and later kernels inline until restart', kernel)
+                self._broken = True
+                self.shutdown()
+                return KERNELS[kernel](**columns, **kwargs)
+        finally:
+            block.close()
+            block.unlink()
+
+
+def init_analytics_pool(app):
+    """
+    Create the app's analytics pool and fork its processes.  Call while the
+    app is being set up, before any background worker or request thread runs.
+    """
+    pool = AnalyticsPool(app.config['ANALYTICS_PROCESSES'])
+    app.extensions['analytics_pool'] = pool
+    pool.warm()
+    return pool
+
+
+def current_pool():
+    """The app's analytics pool, or an inline one outside an app."""
+    from flask import current_app, has_app_context
+    if has_app_context() and 'analytics_pool' in current_app.extensions:
+        return current_app.extensions['analytics_pool']
+    return INLINE
+
+
+INLINE = AnalyticsPool(0)
@@ -0,0 +1,275 @@
+"""
+Family budget optimizer.
+
+Splits a monthly budget over family members x categories with a linear
+program, solved by scipy's HiGHS backend:
+
+* Every category is anchored at its average monthly spend over the last
+  FAMILY_OPTIMIZER_LOOKBACK_MONTHS.  Cutting a category costs more the deeper
+  the cut goes (FAMILY_OPTIMIZER_CUT_SEGMENTS is a convex, piecewise-linear
+  stand-in for a quadratic penalty).  The cost is relative to the
+  category's size and scaled by the FAMILY_MEMBER_WEIGHTS weight of the
+  members who spend in it, so cuts spread over many categories and reach
+  the ones that matter to weighted members last.
+* Raising a category above its history costs FAMILY_OPTIMIZER_RAISE_COST.
+  Savings categories are the cheapest to raise, so leftover money is saved.
+* BUDGET_RULES caps needs and wants and puts a floor under savings, as
+  shares of the total.  Breaking a rule costs more than any reallocation,
+  so the rules only give way when the category minimums make them
+  impossible.
+* Per-category minimums are hard constraints.
+
+No constraint involves a single member, so per-member columns would all be
+parallel within a category and would only slow the solver down.  The
+program therefore decides each category's total.  ``split_cuts`` then
+shares each cut among the category's members in closed form: heavier
+members lose a smaller fraction of their spend.  Raises follow each
+member's share of the category's history.  That is four columns and one
+row per category, so hundreds of categories solve in milliseconds.  Spend
+with no member attached is shared out by member weight.
+
+``load_budget_model`` caches the history and constraint matrix per family,
+revalidated by data version (see utils.versioning).  What-if calls that
+change the total, the minimums or the member roles therefore skip the
+database and only rebuild the cost, bound and right-hand-side vectors.
+"""
+from datetime import date
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+from sqlalchemy import func
+
+from config import Config
+from models import db, Category, Transaction
+from utils.cache import TTLCache
+from utils.versioning import (
+    load_scope_versions, SCOPE_FAMILY, SCOPE_FAMILY_CATEGORIES, SCOPE_USER, SCOPE_USER_CATEGORIES
+)
+from .config import (
+    BUDGET_RULES, FAMILY_MEMBER_WEIGHTS, NEEDS_CATEGORIES, SAVINGS_CATEGORIES,
+    FAMILY_OPTIMIZER_CUT_SEGMENTS, FAMILY_OPTIMIZER_RAISE_COST, FAMILY_OPTIMIZER_SAVINGS_RAISE_COST,
+    FAMILY_OPTIMIZER_LOOKBACK_MONTHS
+)
+
+NEEDS, WANTS, SAVINGS = 0, 1, 2
+GROUPS = ('needs', 'wants', 'savings')
+DEFAULT_SAVINGS_CATEGORY = 'Savings'
+
+_NEEDS = {name.lower() for name in NEEDS_CATEGORIES}
+_SAVINGS = {name.lower() for name in SAVINGS_CATEGORIES}
+
+budget_model_cache = TTLCache(maxsize=Config.FAMILY_BUDGET_CACHE_SIZE, ttl=Config.FAMILY_BUDGET_CACHE_TTL)
+
+
+class BudgetInfeasible(ValueError):
+    """The category minimums add up to more than the budget."""
+
+
+def member_weight(member):
+    """Weight of a ``{role, special_needs}`` member from FAMILY_MEMBER_WEIGHTS."""
+    weight = 1.0
+    if member.get('role') == 'primary_earner':
+        weight *= FAMILY_MEMBER_WEIGHTS['primary_earner']
+    elif member.get('role') == 'dependent':
+        weight *= FAMILY_MEMBER_WEIGHTS['dependent']
+    if member.get('special_needs'):
+        weight *= FAMILY_MEMBER_WEIGHTS['special_needs']
+    return weight
+
+
+def category_group(name):
+    name = name.lower()
+    if name in _NEEDS:
+        return NEEDS
+    if name in _SAVINGS:
+        return SAVINGS
+    return WANTS
+
+
+def split_cuts(anchors, weights, cuts):
+    """
+    Share each category's cut among members (rows of ``anchors``).  Member m
+    loses the fraction min(1, level / weight_m) of its spend, where the level
+    is set per category so that the losses add up to the cut.
+    """
+    order = np.argsort(weights, kind='stable')
+    weight = weights[order][:, None]
+    spend = anchors[order]
+    columns = np.arange(spend.shape[1])
+
+    # Once the level reaches a member's weight, every lighter member is cut entirely
+    full = np.cumsum(spend, axis=0)
+    partial = np.cumsum((spend / weight)[::-1], axis=0)[::-1]
+    reached = np.vstack([np.zeros((1, len(columns))), full[:-1]]) + weight * partial
+    emptied = (reached <= cuts).sum(axis=0)
+
+    done = np.where(emptied > 0, full[np.maximum(emptied - 1, 0), columns], 0.0)
+    rest = partial[np.minimum(emptied, len(weight) - 1), columns]
+    level = np.full(len(columns), np.inf)
+    np.divide(cuts - done, rest, out=level, where=(emptied < len(weight)) & (rest > 0))
+
+    result = np.empty_like(spend)
+    result[order] = spend * np.minimum(1.0, level / weight)
+    return result
+
+
+class BudgetModel:
+    """
+    The constraint matrix for one family's categories plus its members'
+    history, built once and solved for any total, minimums and weights.
+
+    ``spend`` is each member's average monthly spend per category and
+    ``shared`` the spend per category with no member attached.
+    """
+
+    def __init__(self, member_ids, categories, spend, shared):
+        self.member_ids = list(member_ids)
+        self.categories = list(categories)
+        self.groups = np.array([category_group(name) for name in self.categories], dtype=np.intp)
+        self.spend = np.asarray(spend, dtype=np.float64).reshape(len(self.member_ids), len(self.categories))
+        self.shared = np.asarray(shared, dtype=np.float64)
+
+        n_categories = len(self.categories)
+        segments = len(FAMILY_OPTIMIZER_CUT_SEGMENTS)
+        self.n_cuts = segments * n_categories
+        changes = self.n_cuts + n_categories
+        n_columns = changes + len(GROUPS)
+
+        # Columns: cut segments (segment-major), one raise per category, one slack per rule.
+        # A cut lowers its category by one unit, a raise increases it.
+        column_category = np.concatenate([np.tile(np.arange(n_categories), segments), np.arange(n_categories)])
+        column_sign = np.concatenate([-np.ones(self.n_cuts), np.ones(n_categories)])
+        column_group = self.groups[column_category]
+        slacks = np.arange(changes, n_columns)
+
+        # Rows <=: needs cap, wants cap, savings floor (negated), then each category's minimum (negated)
+        rule_sign = np.where(column_group == SAVINGS, -1.0, 1.0)
+        self.A_ub = sparse.csr_array((
+            np.concatenate([column_sign * rule_sign, -column_sign, -np.ones(len(GROUPS))]),
+            (np.concatenate([column_group, len(GROUPS) + column_category, np.arange(len(GROUPS))]),
+             np.concatenate([np.arange(changes), np.arange(changes), slacks]))
+        ), shape=(len(GROUPS) + n_categories, n_columns))
+        # Row =: the changes add up to the difference between the budget and the history
+        self.A_eq = sparse.csr_array(
+            (column_sign, (np.zeros(changes, dtype=np.intp), np.arange(changes))), shape=(1, n_columns)
+        )
+
+    def anchors(self, weights):
+        """Historical monthly spend per member and category, shared spend split by ``weights``."""
+        return self.spend + np.outer(weights / weights.sum(), self.shared)
+
+    def solve(self, total_budget, weights, minimums):
+        """
+        Allocation (members x categories) of ``total_budget``, with member
+        ``weights`` and per-category ``minimums`` arrays.  Returns
+        ``(allocation, anchors, rule_shortfall)``.
+        """
+        if minimums.sum() > total_budget + 1e-9:
+            raise BudgetInfeasible('Category minimums add up to more than the total budget')
+        anchors = self.anchors(weights)
+        history = anchors.sum(axis=0)
+        category_weight = np.divide(weights @ anchors, history, out=np.ones_like(history), where=history > 0)
+
+        # Costs are per unit relative to the typical category, so they stay well scaled
+        unit = max(float(history.mean()), 1.0) if len(history) else 1.0
+        relative = category_weight * unit / np.maximum(history, 0.01 * unit)
+        cut_costs = np.concatenate([relative * cost for _, cost in FAMILY_OPTIMIZER_CUT_SEGMENTS])
+        raise_costs = unit / np.maximum(history, unit) * np.where(
+            self.groups == SAVINGS, FAMILY_OPTIMIZER_SAVINGS_RAISE_COST, FAMILY_OPTIMIZER_RAISE_COST
+        )
+        penalty = 2 * (cut_costs.max(initial=0.0) + raise_costs.max(initial=0.0)) + 1
+        costs = np.concatenate([cut_costs, raise_costs, np.full(len(GROUPS), penalty)])
+
+        upper = np.concatenate([
+            *(history * share for share, _ in FAMILY_OPTIMIZER_CUT_SEGMENTS),
+            np.full(len(self.categories) + len(GROUPS), np.inf)
+        ])
+        group_history = np.bincount(self.groups, weights=history, minlength=len(GROUPS))
+        rule_rhs = np.array([
+            BUDGET_RULES['needs_percentage'] * total_budget - group_history[NEEDS],
+            BUDGET_RULES['wants_percentage'] * total_budget - group_history[WANTS],
+            group_history[SAVINGS] - BUDGET_RULES['savings_percentage'] * total_budget
+        ])
+
+        # A couple of dual simplex iterations solve it; presolve would cost more than the solve
+        result = linprog(
+            costs, A_ub=self.A_ub, b_ub=np.concatenate([rule_rhs, history - minimums]),
+            A_eq=self.A_eq, b_eq=[total_budget - history.sum()],
+            bounds=np.column_stack([np.zeros(len(costs)), upper]),
+            method='highs-ds', options={'presolve': False}
+        )
+        if result.status == 2:
+            raise BudgetInfeasible('No allocation satisfies the category minimums')
+        if result.status != 0:
+            raise RuntimeError(f'Budget optimization failed: {result.message}')
+
+        cuts = result.x[:self.n_cuts].reshape(len(FAMILY_OPTIMIZER_CUT_SEGMENTS), -1).sum(axis=0)
+        raises = result.x[self.n_cuts:self.n_cuts + len(self.categories)]
+        # Raises follow each member's share of the category, or their weight where nobody has history
+        shares = np.where(
+            history > 0,
+            anchors / np.where(history > 0, history, 1.0),
+            (weights / weights.sum())[:, None]
+        )
+        allocation = anchors - split_cuts(anchors, weights, cuts) + shares * raises
+        return np.maximum(allocation, 0.0), anchors, dict(zip(GROUPS, result.x[-len(GROUPS):]))
+
+
+def _history_window(months):
+    this_month = date.today().replace(day=1)
+    index = this_month.year * 12 + this_month.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1), this_month
+
+
+def _build_model(identity, member_ids):
+    start, end = _history_window(FAMILY_OPTIMIZER_LOOKBACK_MONTHS)
+    if identity.family_id:
+        owner = Transaction.family_id == identity.family_id
+    else:
+        owner = Transaction.user_id == identity.user_id
+    rows = db.session.query(
+        Transaction.family_member_id, Category.name, func.sum(Transaction.amount), func.min(Transaction.date)
+    ).join(Category, Transaction.category_id == Category.id).filter(
+        owner, Transaction.type == 'expense', Transaction.date >= start, Transaction.date < end
+    ).group_by(Transaction.family_member_id, Category.name).all()
+
+    own = db.session.query(Category.name).filter(
+        Category.user_id == identity.user_id, Category.type == 'expense'
+    ).distinct()
+    categories = sorted({name for name, in own} | {name for _, name, _, _ in rows})
+    if not any(category_group(name) == SAVINGS for name in categories):
+        categories.append(DEFAULT_SAVINGS_CATEGORY)
+
+    # Average over the months since the first transaction in the window
+    first = min((row[3] for row in rows), default=end)
+    months = max(1, (end.year - first.year) * 12 + end.month - first.month)
+    member_index = {member_id: i for i, member_id in enumerate(member_ids)}
+    category_index = {name: i for i, name in enumerate(categories)}
+    spend = np.zeros((len(member_ids), len(categories)))
+    shared = np.zeros(len(categories))
+    for member_id, name, amount, _ in rows:
+        if member_id in member_index:
+            spend[member_index[member_id], category_index[name]] += amount / months
+        else:
+            shared[category_index[name]] += amount / months
+    return BudgetModel(member_ids, categories, spend, shared)
+
+
+def load_budget_model(identity, member_ids):
+    """The family's (or a single user's) budget model, cached until its data changes."""
+    member_ids = tuple(member_ids)
+    if identity.family_id:
+        scopes = [(SCOPE_FAMILY, identity.family_id), (SCOPE_FAMILY_CATEGORIES, identity.family_id)]
+    else:
+        scopes = [(SCOPE_USER, identity.user_id)]
+    versions = load_scope_versions(scopes + [(SCOPE_USER_CATEGORIES, identity.user_id)])
+    token = (date.today().replace(day=1), tuple(sorted(versions.items())))
+
+    key = (identity.user_id, identity.family_id, member_ids)
+    cached = budget_model_cache.get(key)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    model = _build_model(identity, member_ids)
+    budget_model_cache.set(key, (token, model))
+    return model
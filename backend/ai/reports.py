@@ -0,0 +1,79 @@
+"""
+AI report generation, run as a background job (see utils.jobs).
+"""
+from datetime import date
+
+from sqlalchemy import or_
+
+from models import db, Transaction, Category
+from utils.recurrence import committed_amounts
+from .config import MIN_MONTHS_FOR_PREDICTION, PREDICTION_MONTHS_AHEAD, UNUSUAL_TRANSACTION_THRESHOLD
+from .kernels import add_commitments, current_pool, encode_transactions, name_predictions, summarize_spending
+
+
+def load_report_transactions(user_id, family_id, start_date, end_date):
+    """The user's and their family's transactions in the range, each once, as plain dicts."""
+    owner_filter = Transaction.user_id == user_id
+    if family_id:
+        owner_filter = or_(owner_filter, Transaction.family_id == family_id)
+
+    rows = db.session.query(
+        Transaction.id, Transaction.type, Transaction.amount, Category.name,
+        Transaction.description, Transaction.date
+    ).outerjoin(
+        Category, Transaction.category_id == Category.id
+    ).filter(
+        owner_filter, Transaction.date >= start_date, Transaction.date <= end_date
+    ).order_by(Transaction.date, Transaction.id)
+
+    return [{
+        'id': row_id,
+        'type': transaction_type,
+        'amount': amount,
+        'category': category or 'Uncategorized',
+        'description': description,
+        'date': day
+    } for row_id, transaction_type, amount, category, description, day in rows]
+
+
+def build_ai_report(params, progress):
+    """
+    Job handler for 'ai_report': spending patterns and predictions for a date
+    range.  Predictions are at least what recurring rules have committed.
+    """
+    start_date = date.fromisoformat(params['start_date'])
+    end_date = date.fromisoformat(params['end_date'])
+
+    transactions = load_report_transactions(params['user_id'], params.get('family_id'), start_date, end_date)
+    committed = committed_amounts(params['user_id'], params.get('family_id'), PREDICTION_MONTHS_AHEAD)
+    progress(30)
+    if not transactions:
+        return _report({}, add_commitments({}, committed), start_date, end_date, 0)
+
+    # Only the compact columns go to the analytics pool; the row dicts stay here
+    arrays = encode_transactions(
+        [t['amount'] for t in transactions],
+        [t['category'] for t in transactions],
+        [t['date'] for t in transactions]
+    )
+    pool = current_pool()
+    summary = pool.run('spending', arrays, threshold=UNUSUAL_TRANSACTION_THRESHOLD)
+    patterns = summarize_spending(summary, arrays)
+    patterns['unusual_transactions'] = [transactions[i] for i in summary['unusual']]
+    progress(70)
+    predictions = pool.run('prediction', arrays, months_ahead=PREDICTION_MONTHS_AHEAD,
+                           min_months=MIN_MONTHS_FOR_PREDICTION)
+    return _report(patterns, add_commitments(name_predictions(predictions, arrays), committed),
+                   start_date, end_date, len(transactions))
+
+
+def _report(patterns, predictions, start_date, end_date, transaction_count):
+    return {
+        'spending_patterns': patterns,
+        'predictions': predictions,
+        'period': {
+            'start_date': start_date,
+            'end_date': end_date
+        },
+        'transaction_count': transaction_count
+    }
@@ -1,14 +1,28 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import case, extract, func, or_
 import json
+import queue
+import time
 
-from models import db, User, Transaction, MonthlyPlan, AINotification, Category
+from models import (db, User, Transaction, MonthlyPlan, FamilyMember, AINotification, Category, ReportJob,
+                    AIInsight, AIBudgetRecommendation, AIBatchWatermark)
+from utils.columnar import record_columns, wants_columnar
+from utils.identity import current_identity
+from utils.versioning import load_versions
+from utils.notifications import broker, notification_to_dict, RESYNC
+from utils.jobs import register_job, job_to_dict, ACTIVE_STATUSES, STATUS_DONE
+from .config import SAVINGS_SIMULATION_LOOKBACK_MONTHS, SAVINGS_SIMULATION_MIN_MONTHS
+from .optimizer import BudgetInfeasible, load_budget_model
+from .reports import build_ai_report
 from .services import AIFinanceService
 
 ai_bp = Blueprint('ai', __name__)
 ai_service = AIFinanceService()
 
+register_job('ai_report', build_ai_report)
+
 # AI Chat endpoint
 @ai_bp.route('/chat', methods=['POST'])
 @jwt_required()
@@ -87,7 +101,7 @@ def ai_budget_recommendations():
     expenses = [t.to_dict() for t in transactions]
     
     # Add family expenses if user is part of a family
-    user = User.query.get(user_id)
+    user = current_identity()
     if user.family_id:
         family_transactions = Transaction.query.filter_by(family_id=user.family_id).all()
         expenses.extend([t.to_dict() for t in family_transactions])
@@ -101,56 +115,142 @@ def ai_budget_recommendations():
         'recommendations': recommendations
     })
 
+def _batch_status(user_id):
+    """When the user's precomputed rows were built and whether their data changed since."""
+    watermark = db.session.get(AIBatchWatermark, user_id)
+    if watermark is None:
+        # Never computed (e.g. a new account): have the batch pick it up now
+        current_app.extensions['ai_batch'].wake()
+        return {'computed_at': None, 'stale': True}
+    versions = load_versions(user_id)
+    stale = versions is None or (
+        (versions.user_version or 0) != watermark.user_version
+        or (versions.family_version or 0) != watermark.family_version
+        or versions.family_id != watermark.family_id
+    )
+    return {'computed_at': watermark.computed_at, 'stale': stale}
+
+# Precomputed insights (see ai.batch)
+@ai_bp.route('/insights', methods=['GET'])
+@jwt_required()
+def get_ai_insights():
+    user_id = int(get_jwt_identity())
+    insights = AIInsight.query.filter_by(user_id=user_id).order_by(AIInsight.id).all()
+    return jsonify({
+        'insights': [{
+            'id': insight.id,
+            'type': insight.type,
+            'title': insight.title,
+            'description': insight.description,
+            'data': insight.data
+        } for insight in insights],
+        **_batch_status(user_id)
+    })
+
+@ai_bp.route('/budget/recommendations', methods=['GET'])
+@jwt_required()
+def get_stored_budget_recommendations():
+    user_id = int(get_jwt_identity())
+    latest = AIBudgetRecommendation.query.filter_by(user_id=user_id).order_by(
+        AIBudgetRecommendation.month.desc()
+    ).first()
+    return jsonify({
+        'recommendations': latest.recommendations if latest else None,
+        'month': latest.month if latest else None,
+        'applied': bool(latest.applied) if latest else False,
+        **_batch_status(user_id)
+    })
+
 # AI Report Generation endpoint
 @ai_bp.route('/generate-report', methods=['POST'])
 @jwt_required()
 def generate_ai_report():
-    user_id = get_jwt_identity()
-    data = request.get_json()
+    """Queue a report; poll GET /report-jobs/<id> (optionally with ?wait=<seconds>) for the result"""
+    user = current_identity()
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+    data = request.get_json(silent=True)
     
     if not data or 'startDate' not in data or 'endDate' not in data:
         return jsonify({'error': 'Start date and end date are required'}), 400
     
-    start_date = datetime.strptime(data['startDate'], '%Y-%m-%d')
-    end_date = datetime.strptime(data['endDate'], '%Y-%m-%d')
-    
-    # Get user's transactions
-    transactions = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.date >= start_date,
-        Transaction.date <= end_date
-    ).all()
-    
-    # Add family transactions if user is part of a family
-    user = User.query.get(user_id)
-    if user.family_id:
-        family_transactions = Transaction.query.filter(
-            Transaction.family_id == user.family_id,
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
-        transactions.extend(family_transactions)
-    
-    # Get spending patterns
-    patterns = ai_service.analyze_spending_patterns([t.to_dict() for t in transactions])
-    
-    # Get future predictions
-    predictions = ai_service.predict_future_expenses([t.to_dict() for t in transactions])
-    
-    report = {
-        'spending_patterns': patterns,
-        'predictions': predictions,
-        'period': {
-            'start_date': start_date.strftime('%Y-%m-%d'),
-            'end_date': end_date.strftime('%Y-%m-%d')
-        }
-    }
-    
-    return jsonify({
-        'report': report
+    try:
+        start_date = datetime.strptime(data['startDate'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(data['endDate'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    if start_date > end_date:
+        return jsonify({'error': 'Start date must not be after end date'}), 400
+
+    job, created = current_app.extensions['jobs'].submit(user.user_id, 'ai_report', {
+        'user_id': user.user_id,
+        'family_id': user.family_id,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat()
     })
+    response = jsonify({'job': job_to_dict(job), 'deduplicated': not created})
+    response.status_code = 202
+    response.headers['Location'] = f'/api/ai/report-jobs/{job.id}'
+    return response
+
+@ai_bp.route('/report-jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_report_job(job_id):
+    """
+    Job status and progress; includes the report once it is done.  With
+    ?layout=columnar the report's transaction lists come as columns.
+    """
+    user_id = int(get_jwt_identity())
+    runner = current_app.extensions['jobs']
+    job = ReportJob.query.filter_by(id=job_id, user_id=user_id).first()
+    if not job:
+        return jsonify({'error': 'Report job not found'}), 404
+    # A job whose process died shows up as failed instead of running forever
+    if job.status in ACTIVE_STATUSES and runner.expire_job(job_id, job.updated_at, datetime.utcnow()):
+        db.session.refresh(job)
+
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['JOB_MAX_WAIT'])
+    if wait > 0 and job.status in ACTIVE_STATUSES:
+        db.session.rollback()  # end the read transaction so the wait doesn't pin a snapshot
+        runner.wait(job_id, wait)
+        job = ReportJob.query.filter_by(id=job_id, user_id=user_id).first()
+
+    meta = current_app.json.dumps(job_to_dict(job))
+    if job.status != STATUS_DONE:
+        return Response(f'{{"job":{meta}}}', mimetype='application/json')
+    if wants_columnar():
+        report = json.loads(job.result)
+        patterns = report.get('spending_patterns') or {}
+        if 'unusual_transactions' in patterns:
+            patterns['unusual_transactions'] = record_columns(patterns['unusual_transactions'])
+        return jsonify({'job': job_to_dict(job), 'report': report})
+    # The stored report is already JSON; splice it in instead of decoding and re-encoding it
+    return Response(f'{{"job":{meta},"report":{job.result}}}', mimetype='application/json')
 
 # AI Savings Plan endpoint
+def _monthly_net_history(user, months=SAVINGS_SIMULATION_LOOKBACK_MONTHS):
+    """
+    Income minus expenses of each complete month, up to ``months`` back, for the
+    user and their family; months before the first transaction are left out.
+    """
+    this_month = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    current = this_month.year * 12 + this_month.month - 1
+    start = datetime((current - months) // 12, (current - months) % 12 + 1, 1)
+
+    owner = Transaction.user_id == user.user_id
+    if user.family_id:
+        owner = or_(owner, Transaction.family_id == user.family_id)
+    year, month = extract('year', Transaction.date), extract('month', Transaction.date)
+    net = func.sum(case((Transaction.type == 'income', Transaction.amount), else_=-Transaction.amount))
+    rows = db.session.query(year, month, net).filter(
+        owner, Transaction.date >= start.date(), Transaction.date < this_month.date()
+    ).group_by(year, month).all()
+
+    totals = {int(y) * 12 + int(m) - 1: float(amount or 0) for y, m, amount in rows}
+    if not totals:
+        return []
+    return [totals.get(index, 0.0) for index in range(min(totals), current)]
+
 @ai_bp.route('/savings-plan', methods=['POST'])
 @jwt_required()
 def ai_savings_plan():
@@ -189,7 +289,7 @@ def ai_savings_plan():
     )
     
     # Add family expenses if user is part of a family
-    user = User.query.get(user_id)
+    user = current_identity()
     if user.family_id:
         expenses_query = expenses_query.union(
             Transaction.query.filter(
@@ -199,7 +299,20 @@ def ai_savings_plan():
         )
     
     current_month_expenses = sum(t.amount for t in expenses_query.all())
-    target_date = datetime.strptime(data.get('targetDate'), '%Y-%m-%d') if data.get('targetDate') else None
+    try:
+        target_date = datetime.strptime(data.get('targetDate'), '%Y-%m-%d') if data.get('targetDate') else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'targetDate must be in YYYY-MM-DD format'}), 400
+    if target_date and target_date <= datetime.now():
+        return jsonify({'error': 'targetDate must be in the future'}), 400
+
+    monthly_history = None
+    if data.get('mode') == 'simulation':
+        monthly_history = _monthly_net_history(user)
+        if len(monthly_history) < SAVINGS_SIMULATION_MIN_MONTHS:
+            return jsonify({
+                'error': f'At least {SAVINGS_SIMULATION_MIN_MONTHS} complete months of transactions are needed to simulate'
+            }), 400
     
     try:
         plan = ai_service.generate_savings_plan(
@@ -207,7 +320,8 @@ def ai_savings_plan():
             current_savings=savings,
             monthly_income=total_income,
             monthly_expenses=current_month_expenses,
-            target_date=target_date
+            target_date=target_date,
+            monthly_history=monthly_history
         )
     except Exception as e:
         return jsonify({'error': f'Error generating savings plan: {str(e)}'}), 500
@@ -220,16 +334,42 @@ def ai_savings_plan():
 @ai_bp.route('/family/optimize-budget', methods=['POST'])
 @jwt_required()
 def ai_optimize_family_budget():
-    user_id = get_jwt_identity()
+    """
+    Split {"totalBudget"} over family members x categories.  Optional
+    "familyMembers" ([{id, role, special_needs}], default: the whole family)
+    and "categoryMinimums" ({category name: amount}) make what-if calls cheap:
+    the family's history is cached between them.
+    """
+    user = current_identity()
     data = request.get_json()
     
-    if not data or 'familyMembers' not in data or 'totalBudget' not in data:
-        return jsonify({'error': 'Family members and total budget are required'}), 400
+    if not data or 'totalBudget' not in data:
+        return jsonify({'error': 'Total budget is required'}), 400
+    try:
+        total_budget = float(data['totalBudget'])
+        minimums = {str(name): float(amount) for name, amount in (data.get('categoryMinimums') or {}).items()}
+    except (ValueError, TypeError, AttributeError):
+        return jsonify({'error': 'Invalid budget or category minimum format'}), 400
+    if total_budget <= 0 or any(amount < 0 for amount in minimums.values()):
+        return jsonify({'error': 'Budget must be positive and minimums non-negative'}), 400
+
+    family_members = data.get('familyMembers')
+    if not family_members and user.family_id:
+        family_members = [{'id': member.id, 'role': member.role}
+                          for member in FamilyMember.query.filter_by(family_id=user.family_id).order_by(FamilyMember.id)]
+    if not family_members or not all(isinstance(member, dict) and 'id' in member for member in family_members):
+        return jsonify({'error': 'Family members are required'}), 400
     
-    optimized_budget = ai_service.optimize_family_budget(
-        data['familyMembers'],
-        data['totalBudget']
-    )
+    try:
+        model = load_budget_model(user, [member['id'] for member in family_members])
+        unknown = sorted(set(minimums) - set(model.categories))
+        if unknown:
+            return jsonify({'error': f'Unknown categories: {", ".join(unknown)}'}), 400
+        optimized_budget = ai_service.optimize_family_budget(family_members, total_budget, model, minimums)
+    except BudgetInfeasible as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error optimizing family budget: {str(e)}'}), 500
     
     return jsonify({
         'optimizedBudget': optimized_budget
@@ -239,25 +379,170 @@ def ai_optimize_family_budget():
 @ai_bp.route('/notifications', methods=['GET'])
 @jwt_required()
 def get_ai_notifications():
-    user_id = get_jwt_identity()
-    
-    # Get notifications for the user
-    notifications = AINotification.query.filter_by(user_id=user_id).order_by(AINotification.created_at.desc()).all()
-    
+    """Newest first, one page at a time: ?limit=20&before=<id of the last notification seen>"""
+    user_id = int(get_jwt_identity())
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['NOTIFICATION_PAGE_SIZE'])),
+                    current_app.config['NOTIFICATION_PAGE_MAX'])
+        before = request.args.get('before', type=int)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    query = AINotification.query.filter(AINotification.user_id == user_id, AINotification.dismissed == False)  # noqa: E712
+    if before is not None:
+        query = query.filter(AINotification.id < before)
+    notifications = query.order_by(AINotification.id.desc()).limit(limit + 1).all()
+
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
     return jsonify({
-        'notifications': [
-            {
-                'id': notification.id,
-                'type': notification.type,
-                'message': notification.message,
-                'priority': notification.priority,
-                'read': notification.read,
-                'timestamp': notification.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            for notification in notifications
-        ]
+        'notifications': [notification_to_dict(notification) for notification in notifications],
+        'next_before': notifications[-1].id if has_more else None
+    })
+
+def _unread_count(user_id):
+    return db.session.query(func.count(AINotification.id)).filter(
+        AINotification.user_id == user_id, AINotification.read == False  # noqa: E712
+    ).scalar()
+
+@ai_bp.route('/notifications/unread-count', methods=['GET'])
+@jwt_required()
+def get_unread_notification_count():
+    return jsonify({'unread': _unread_count(int(get_jwt_identity()))})
+
+def _sse(event, data, event_id=None):
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {data}')
+    return '\n'.join(lines) + '\n\n'
+
+# Server-sent events: pushed notifications instead of polling.  EventSource
+# can't send headers, so the access token may be passed as ?jwt=<token>.
+@ai_bp.route('/notifications/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_notifications():
+    user_id = int(get_jwt_identity())
+    heartbeat = current_app.config['NOTIFICATION_STREAM_HEARTBEAT']
+    max_age = current_app.config['NOTIFICATION_STREAM_MAX_AGE']
+
+    # Subscribe before reading missed rows so nothing committed in between is lost
+    subscription = broker.subscribe(user_id)
+    try:
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        missed = []
+        if last_event_id is not None:
+            missed = AINotification.query.filter(
+                AINotification.user_id == user_id, AINotification.id > last_event_id,
+                AINotification.dismissed == False  # noqa: E712
+            ).order_by(AINotification.id).limit(current_app.config['NOTIFICATION_PAGE_MAX'] + 1).all()
+        if len(missed) > current_app.config['NOTIFICATION_PAGE_MAX']:
+            missed = []
+            backlog = [_sse('resync', '{}')]  # too far behind, reload the first page instead
+        else:
+            backlog = [_sse('notification', current_app.json.dumps(notification_to_dict(n)), n.id) for n in missed]
+        unread_data = current_app.json.dumps({'unread': _unread_count(user_id)})
+        db.session.remove()  # don't hold a connection for the life of the stream
+    except Exception:
+        broker.unsubscribe(user_id, subscription)
+        raise
+    # Published ids are not ordered across writers: a notification committed
+    # after we subscribed can carry an id at or below Last-Event-ID, and the
+    # client has not seen it.  Only skip what the backlog already replayed.
+    replayed = {n.id for n in missed}
+
+    def events():
+        cursor = max(replayed, default=last_event_id or 0)  # the client's Last-Event-ID
+        try:
+            yield 'retry: 3000\n\n'
+            yield _sse('unread', unread_data)
+            yield from backlog
+            deadline = time.monotonic() + max_age
+            while time.monotonic() < deadline:
+                try:
+                    message = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if message is RESYNC:
+                    yield _sse('resync', '{}')
+                    continue
+                notification_id, data = message
+                if notification_id in replayed:
+                    continue
+                if notification_id > cursor:
+                    cursor = notification_id
+                    yield _sse('notification', data, notification_id)
+                else:
+                    # Without an id field EventSource keeps its Last-Event-ID, so a
+                    # late, lower id doesn't rewind where the next reconnect resumes
+                    yield _sse('notification', data)
+        finally:
+            broker.unsubscribe(user_id, subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # don't let a proxy buffer the stream
     })
 
+def _bulk_selection(user_id):
+    """
+    Filter for a bulk update from the JSON body: {"ids": [...]} and/or
+    {"before": "<ISO timestamp>"} (every notification created before it).
+    """
+    data = request.get_json(silent=True) or {}
+    ids, before = data.get('ids'), data.get('before')
+    if ids is None and before is None:
+        raise ValueError('Provide "ids" or "before"')
+
+    conditions = [AINotification.user_id == user_id]
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            raise ValueError('"ids" must be a list of notification ids')
+        if len(ids) > current_app.config['NOTIFICATION_BULK_MAX_IDS']:
+            raise ValueError(f'At most {current_app.config["NOTIFICATION_BULK_MAX_IDS"]} ids per request')
+        conditions.append(AINotification.id.in_(ids))
+    if before is not None:
+        try:
+            cutoff = datetime.fromisoformat(str(before).replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError('"before" must be an ISO 8601 timestamp')
+        if cutoff.tzinfo is not None:
+            cutoff = cutoff.astimezone(timezone.utc).replace(tzinfo=None)  # created_at is naive UTC
+        conditions.append(AINotification.created_at < cutoff)
+    return conditions
+
+# Mark many AI Notifications as read in one statement
+@ai_bp.route('/notifications/read', methods=['PUT'])
+@jwt_required()
+def mark_notifications_read():
+    try:
+        conditions = _bulk_selection(int(get_jwt_identity()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    updated = AINotification.query.filter(*conditions, AINotification.read == False).update(  # noqa: E712
+        {'read': True}, synchronize_session=False
+    )
+    db.session.commit()
+    return jsonify({'success': True, 'updated': updated})
+
+# Dismiss (hide) many AI Notifications; they stay read and are purged with the rest
+@ai_bp.route('/notifications/dismiss', methods=['PUT'])
+@jwt_required()
+def dismiss_notifications():
+    try:
+        conditions = _bulk_selection(int(get_jwt_identity()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    dismissed = AINotification.query.filter(*conditions, AINotification.dismissed == False).update(  # noqa: E712
+        {'read': True, 'dismissed': True}, synchronize_session=False
+    )
+    db.session.commit()
+    return jsonify({'success': True, 'dismissed': dismissed})
+
 # Mark AI Notification as read endpoint
 @ai_bp.route('/notifications/<int:notification_id>/read', methods=['PUT'])
 @jwt_required()
@@ -9,16 +9,53 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from dotenv import load_dotenv
 
+from .kernels import add_commitments, current_pool, encode_transactions, name_predictions, summarize_spending
+from .optimizer import BudgetModel, GROUPS, member_weight
+from .simulation import simulate_savings
 from .config import (
     OPENAI_MODEL, OPENAI_TEMPERATURE, NEEDS_CATEGORIES, WANTS_CATEGORIES,
     SAVINGS_CATEGORIES, BUDGET_RULES, UNUSUAL_TRANSACTION_THRESHOLD,
-    MIN_MONTHS_FOR_PREDICTION, PREDICTION_MONTHS_AHEAD, FAMILY_MEMBER_WEIGHTS,
+    MIN_MONTHS_FOR_PREDICTION, PREDICTION_MONTHS_AHEAD,
     CHAT_SYSTEM_PROMPT, DEFAULT_SAVINGS_PERCENTAGE, AGGRESSIVE_SAVINGS_PERCENTAGE,
-    CONSERVATIVE_SAVINGS_PERCENTAGE
+    CONSERVATIVE_SAVINGS_PERCENTAGE, SAVINGS_SIMULATION_HORIZON_MONTHS
 )
 
 load_dotenv()
 
+
+def recommendations_for_allocations(current_allocations: Dict[str, float]) -> Dict[str, Any]:
+    """Budget advice for needs/wants/savings shares of income, against BUDGET_RULES."""
+    recommendations = {
+        'current_allocations': current_allocations,
+        'recommended_allocations': BUDGET_RULES,
+        'specific_recommendations': []
+    }
+
+    # Generate specific recommendations based on budget rules
+    if current_allocations['needs'] > BUDGET_RULES['needs_percentage']:
+        recommendations['specific_recommendations'].append({
+            'category': 'Needs',
+            'message': f'Your essential expenses are {current_allocations["needs"]*100:.1f}% of income. '
+                      f'Try to reduce them to {BUDGET_RULES["needs_percentage"]*100}% by finding cheaper alternatives.'
+        })
+
+    if current_allocations['wants'] > BUDGET_RULES['wants_percentage']:
+        recommendations['specific_recommendations'].append({
+            'category': 'Wants',
+            'message': f'Your discretionary spending is {current_allocations["wants"]*100:.1f}% of income. '
+                      f'Consider reducing it to {BUDGET_RULES["wants_percentage"]*100}% to increase savings.'
+        })
+
+    if current_allocations['savings'] < BUDGET_RULES['savings_percentage']:
+        recommendations['specific_recommendations'].append({
+            'category': 'Savings',
+            'message': f'Your savings rate is {current_allocations["savings"]*100:.1f}%. '
+                      f'Try to increase it to {BUDGET_RULES["savings_percentage"]*100}% by reducing discretionary spending.'
+        })
+
+    return recommendations
+
+
 class FinanceAgent:
     def __init__(self, name: str):
         self.name = name
@@ -41,33 +78,21 @@ class AIFinanceService:
             'budget_recommender': FinanceAgent('BudgetRecommender')
         }
 
-    def analyze_spending_patterns(self, transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def analyze_spending_patterns(self, transactions: List[Dict[str, Any]], pool=None) -> Dict[str, Any]:
         # Use agent to perform task
         agent_response = self.agents['spending_analyzer'].perform_task('analyze_spending', {'transactions': transactions})
         print(agent_response)  # For demonstration purposes
         
-        # Existing logic
-        amounts = [t['amount'] for t in transactions]
-        dates = [datetime.strptime(t['date'], '%Y-%m-%d') for t in transactions]
-        categories = [t['category'] for t in transactions]
-
-        total_spent = sum(amounts)
-        avg_per_transaction = np.mean(amounts)
-        category_totals = {}
-        
-        for amount, category in zip(amounts, categories):
-            category_totals[category] = category_totals.get(category, 0) + amount
-
-        scaled_amounts = self.scaler.fit_transform(np.array(amounts).reshape(-1, 1))
-        unusual_indices = np.where(abs(scaled_amounts) > UNUSUAL_TRANSACTION_THRESHOLD)[0]
-        unusual_transactions = [transactions[i] for i in unusual_indices]
-
-        return {
-            'total_spent': total_spent,
-            'average_per_transaction': avg_per_transaction,
-            'category_breakdown': category_totals,
-            'unusual_transactions': unusual_transactions
-        }
+        # Vectorized kernel, run on the app's analytics process pool
+        arrays = encode_transactions(
+            [t['amount'] for t in transactions],
+            [t['category'] for t in transactions],
+            [t['date'] for t in transactions]
+        )
+        summary = (pool or current_pool()).run('spending', arrays, threshold=UNUSUAL_TRANSACTION_THRESHOLD)
+        patterns = summarize_spending(summary, arrays)
+        patterns['unusual_transactions'] = [transactions[i] for i in summary['unusual']]
+        return patterns
 
     async def get_ai_chat_response(self, user_message: str, context: Dict[str, Any]) -> str:
         """Get AI response using LangChain."""
@@ -102,112 +127,78 @@ class AIFinanceService:
             'savings': sum(category_expenses.get(cat, 0) for cat in SAVINGS_CATEGORIES) / income
         }
 
-        recommendations = {
-            'current_allocations': current_allocations,
-            'recommended_allocations': BUDGET_RULES,
-            'specific_recommendations': []
-        }
-
-        # Generate specific recommendations based on budget rules
-        if current_allocations['needs'] > BUDGET_RULES['needs_percentage']:
-            recommendations['specific_recommendations'].append({
-                'category': 'Needs',
-                'message': f'Your essential expenses are {current_allocations["needs"]*100:.1f}% of income. '
-                          f'Try to reduce them to {BUDGET_RULES["needs_percentage"]*100}% by finding cheaper alternatives.'
-            })
-
-        if current_allocations['wants'] > BUDGET_RULES['wants_percentage']:
-            recommendations['specific_recommendations'].append({
-                'category': 'Wants',
-                'message': f'Your discretionary spending is {current_allocations["wants"]*100:.1f}% of income. '
-                          f'Consider reducing it to {BUDGET_RULES["wants_percentage"]*100}% to increase savings.'
-            })
-
-        if current_allocations['savings'] < BUDGET_RULES['savings_percentage']:
-            recommendations['specific_recommendations'].append({
-                'category': 'Savings',
-                'message': f'Your savings rate is {current_allocations["savings"]*100:.1f}%. '
-                          f'Try to increase it to {BUDGET_RULES["savings_percentage"]*100}% by reducing discretionary spending.'
-            })
+        return recommendations_for_allocations(current_allocations)
 
-        return recommendations
-
-    def predict_future_expenses(self, historical_transactions: List[Dict[str, Any]], months_ahead: int = PREDICTION_MONTHS_AHEAD) -> Dict[str, Any]:
-        """Predict future expenses using simple time series analysis."""
-        # Group transactions by category and month
-        category_monthly_totals = {}
-        
-        for transaction in historical_transactions:
-            date = datetime.strptime(transaction['date'], '%Y-%m-%d')
-            month_key = f"{date.year}-{date.month}"
-            category = transaction['category']
-            
-            if category not in category_monthly_totals:
-                category_monthly_totals[category] = {}
-            
-            if month_key not in category_monthly_totals[category]:
-                category_monthly_totals[category][month_key] = 0
-                
-            category_monthly_totals[category][month_key] += transaction['amount']
-
-        # Calculate trends and make predictions
-        predictions = {}
-        for category, monthly_data in category_monthly_totals.items():
-            amounts = list(monthly_data.values())
-            if len(amounts) >= MIN_MONTHS_FOR_PREDICTION:
-                trend = np.polyfit(range(len(amounts)), amounts, 1)[0]  # Linear trend
-                last_amount = amounts[-1]
-                
-                predictions[category] = {
-                    'current_monthly': last_amount,
-                    'trend': trend,
-                    'predicted_next_months': [
-                        max(0, last_amount + trend * i) for i in range(1, months_ahead + 1)
-                    ]
-                }
-
-        return predictions
+    def predict_future_expenses(self, historical_transactions: List[Dict[str, Any]], months_ahead: int = PREDICTION_MONTHS_AHEAD,
+                                pool=None, committed: Optional[Dict[str, List[float]]] = None) -> Dict[str, Any]:
+        """
+        Predict future expenses from the linear trend of each category's monthly
+        totals, raised to the ``committed`` amounts of recurring rules (see
+        utils.recurrence.committed_amounts).
+        """
+        arrays = encode_transactions(
+            [t['amount'] for t in historical_transactions],
+            [t['category'] for t in historical_transactions],
+            [t['date'] for t in historical_transactions]
+        )
+        predictions = (pool or current_pool()).run(
+            'prediction', arrays, months_ahead=months_ahead, min_months=MIN_MONTHS_FOR_PREDICTION
+        )
+        return add_commitments(name_predictions(predictions, arrays), committed or {})
 
-    def optimize_family_budget(self, family_members: List[Dict[str, Any]], total_budget: float) -> Dict[str, Any]:
-        """Optimize budget allocation for family members."""
+    def optimize_family_budget(self, family_members: List[Dict[str, Any]], total_budget: float,
+                               model: BudgetModel, minimums: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """
+        Optimize budget allocation for family members over categories (see
+        ai.optimizer). ``model`` holds the members' history in the same order
+        as ``family_members``; ``minimums`` maps category names to the least
+        each category must get.
+        """
         # Calculate weights based on member attributes using configured weights
-        member_weights = {}
-        total_weight = 0
-        
-        for member in family_members:
-            weight = 1.0  # Base weight
-            
-            # Apply configured weights based on role
-            if member.get('role') == 'primary_earner':
-                weight *= FAMILY_MEMBER_WEIGHTS['primary_earner']
-            elif member.get('role') == 'dependent':
-                weight *= FAMILY_MEMBER_WEIGHTS['dependent']
-                
-            # Apply special needs weight if applicable
-            if member.get('special_needs'):
-                weight *= FAMILY_MEMBER_WEIGHTS['special_needs']
-                
-            member_weights[member['id']] = weight
-            total_weight += weight
+        member_weights = {member['id']: member_weight(member) for member in family_members}
+        weights = np.array([member_weights[member_id] for member_id in model.member_ids])
+        category_minimums = np.zeros(len(model.categories))
+        for name, amount in (minimums or {}).items():
+            category_minimums[model.categories.index(name)] = amount
 
-        # Calculate allocations
-        allocations = {}
-        for member_id, weight in member_weights.items():
-            allocation = (weight / total_weight) * total_budget
-            allocations[member_id] = round(allocation, 2)
+        allocation, anchors, shortfall = model.solve(total_budget, weights, category_minimums)
 
+        category_totals = allocation.sum(axis=0)
+        group_totals = np.bincount(model.groups, weights=category_totals, minlength=len(GROUPS))
         return {
-            'allocations': allocations,
+            'allocations': {
+                member_id: round(float(amount), 2) for member_id, amount in zip(model.member_ids, allocation.sum(axis=1))
+            },
+            'category_allocations': {
+                member_id: {name: round(float(amount), 2) for name, amount in zip(model.categories, row) if amount >= 0.005}
+                for member_id, row in zip(model.member_ids, allocation)
+            },
+            'category_totals': {name: round(float(amount), 2) for name, amount in zip(model.categories, category_totals)},
+            'groups': {
+                group: {
+                    'amount': round(float(amount), 2),
+                    'share': round(float(amount) / total_budget, 4) if total_budget else 0.0,
+                    'target': BUDGET_RULES[f'{group}_percentage']
+                } for group, amount in zip(GROUPS, group_totals)
+            },
+            'rule_shortfall': {group: round(float(amount), 2) for group, amount in shortfall.items() if amount >= 0.005},
             'explanation': {
                 'weights': member_weights,
-                'total_budget': total_budget
+                'total_budget': total_budget,
+                'historical_allocations': {
+                    member_id: round(float(amount), 2) for member_id, amount in zip(model.member_ids, anchors.sum(axis=1))
+                }
             }
         }
 
     def generate_savings_plan(self, goal_amount: float, current_savings: float, 
                             monthly_income: float, monthly_expenses: float,
-                            target_date: Optional[datetime] = None) -> Dict[str, Any]:
-        """Generate a personalized savings plan."""
+                            target_date: Optional[datetime] = None,
+                            monthly_history: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Generate a personalized savings plan. With ``monthly_history`` (net cash
+        flow of past months) the plan also carries a Monte Carlo simulation.
+        """
         available_monthly = monthly_income - monthly_expenses
         amount_needed = goal_amount - current_savings
 
@@ -235,7 +226,7 @@ class AIFinanceService:
             potential_savings = self._find_potential_savings(monthly_expenses)
             recommendations.extend(potential_savings)
 
-        return {
+        plan = {
             'current_savings': current_savings,
             'goal_amount': goal_amount,
             'required_monthly_savings': required_monthly,
@@ -244,6 +235,26 @@ class AIFinanceService:
             'months_to_goal': months_until_target,
             'recommendations': recommendations
         }
+        if monthly_history is not None:
+            plan['simulation'] = self.simulate_savings_plan(goal_amount, current_savings, monthly_history, target_date)
+        return plan
+
+    def simulate_savings_plan(self, goal_amount: float, current_savings: float, monthly_history: List[float],
+                              target_date: Optional[datetime] = None) -> Dict[str, Any]:
+        """Simulate savings month by month up to the target date (or the default horizon)."""
+        now = datetime.now()
+        if target_date:
+            months = max(1, (target_date.year - now.year) * 12 + target_date.month - now.month)
+        else:
+            months = SAVINGS_SIMULATION_HORIZON_MONTHS
+        simulation = simulate_savings(monthly_history, current_savings, goal_amount, months)
+
+        first = now.year * 12 + now.month - 1
+        for band in simulation['bands']:
+            year, month = divmod(first + band['month'], 12)
+            band['date'] = f'{year}-{month + 1:02d}'
+        simulation['target_date'] = target_date.strftime('%Y-%m-%d') if target_date else None
+        return simulation
 
     def _find_potential_savings(self, monthly_expenses: float) -> List[Dict[str, Any]]:
         """Find potential areas for savings."""
@@ -0,0 +1,102 @@
+"""
+Monte Carlo savings simulation.
+
+``simulate_savings`` bootstraps monthly net cash flow (income minus expenses)
+from a user's own history and runs every path at once: a ``(months, paths)``
+float32 matrix of sampled months, summed down each column.  Percentile bands
+come from per-month histograms filled by one ``bincount`` instead of sorting
+each month, and the histogram bounds are known up front (every path lies
+between ``months * min`` and ``months * max`` of the history), so no extra
+pass over the matrix is needed.  Paths are capped so that
+``paths * months`` stays within ``SAVINGS_SIMULATION_MAX_CELLS``, which
+keeps a request's time and memory bounded for far-off target dates.
+"""
+import numpy as np
+
+from .config import (
+    SAVINGS_SIMULATION_PATHS, SAVINGS_SIMULATION_MAX_CELLS, SAVINGS_SIMULATION_PERCENTILES,
+    SAVINGS_SIMULATION_BANDS, SAVINGS_SIMULATION_BINS
+)
+
+
+def _band_quantiles(offsets, steps, low, high, percentiles, bins):
+    """
+    Interpolated percentiles of each row of ``offsets`` (overwritten), whose
+    values lie between ``steps * low`` and ``steps * high``.
+    """
+    rows, paths = offsets.shape
+    lower = steps * low
+    width = steps * (high - low) / bins
+    scale = np.divide(1.0, width, out=np.zeros_like(width), where=width > 0)
+
+    offsets -= lower
+    offsets *= scale
+    codes = offsets.astype(np.int32)
+    np.minimum(codes, bins - 1, out=codes)
+    codes += np.arange(0, rows * bins, bins, dtype=np.int32)[:, None]
+    counts = np.bincount(codes.ravel(), minlength=rows * bins).reshape(rows, bins)
+    cumulative = np.cumsum(counts, axis=1)
+
+    targets = np.asarray(percentiles, dtype=np.float64) / 100 * paths
+    index = np.minimum((cumulative[:, :, None] < targets).sum(axis=1), bins - 1)
+    row = np.arange(rows)[:, None]
+    before = np.where(index > 0, cumulative[row, np.maximum(index - 1, 0)], 0)
+    fraction = np.clip((targets - before) / np.maximum(counts[row, index], 1), 0.0, 1.0)
+    return lower + (index + fraction) * width
+
+
+def simulate_savings(history, current_savings, goal_amount, months, paths=SAVINGS_SIMULATION_PATHS,
+                     percentiles=SAVINGS_SIMULATION_PERCENTILES, rng=None):
+    """
+    Savings balance over the next ``months`` months, each month's net cash flow
+    drawn at random from ``history``.
+
+    Returns the share of paths that reach ``goal_amount`` at some point, the
+    share still at or above it after the last month, the months it takes to
+    reach it at each percentile (None where too few paths get there) and
+    percentile bands of the balance for up to SAVINGS_SIMULATION_BANDS months.
+    """
+    history = np.asarray(history, dtype=np.float32)
+    if len(history) == 0:
+        raise ValueError('At least one month of history is needed')
+    months = max(1, int(months))
+    paths = max(1, min(int(paths), SAVINGS_SIMULATION_MAX_CELLS // months))
+    rng = rng or np.random.default_rng()
+    needed = goal_amount - current_savings
+
+    # Row m holds every path's savings growth after m + 1 months
+    growth = history[rng.integers(0, len(history), size=(months, paths), dtype=np.int16)]
+    np.cumsum(growth, axis=0, out=growth)
+
+    reached = growth >= needed
+    first = reached.argmax(axis=0)
+    hit = reached[first, np.arange(paths)]
+    reached_by = np.cumsum(np.bincount(first[hit], minlength=months)) / paths
+
+    band_rows = np.unique(np.linspace(0, months - 1, min(months, SAVINGS_SIMULATION_BANDS)).round().astype(np.intp))
+    steps = (band_rows + 1).astype(np.float32)[:, None]
+    bands = current_savings + _band_quantiles(
+        growth[band_rows], steps, float(history.min()), float(history.max()), percentiles, SAVINGS_SIMULATION_BINS
+    )
+
+    months_to_goal = {}
+    for percentile in percentiles:
+        month = int(np.searchsorted(reached_by, percentile / 100 - 1e-9))
+        months_to_goal[f'p{percentile}'] = month + 1 if month < months else None
+
+    return {
+        'paths': paths,
+        'months': months,
+        'probability_of_reaching_goal': float(hit.mean()),
+        'probability_above_goal_at_end': float((growth[-1] >= needed).mean()),
+        'months_to_goal': months_to_goal,
+        'bands': [
+            {'month': int(row) + 1, **{f'p{p}': round(float(value), 2) for p, value in zip(percentiles, band)}}
+            for row, band in zip(band_rows, bands)
+        ],
+        'monthly_net': {
+            'months': len(history),
+            'mean': round(float(history.mean()), 2),
+            'std': round(float(history.std()), 2)
+        }
+    }
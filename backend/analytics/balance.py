@@ -0,0 +1,207 @@
+"""
+Running balance (income minus expenses) at any date.
+
+``daily_balance`` holds one row per owner and day with transactions: the
+day's net amount and the cumulative balance through that day.  Owners are
+users (their own transactions) and families (every family transaction),
+matching the user and family scopes of the other analytics.
+
+An ``after_flush`` hook turns each written transaction into +/- deltas on
+the days it leaves and enters.  A delta is one UPDATE of the day's row and
+every later row of that owner.  A back-dated edit therefore touches only the
+suffix after its day, and an edit of today's transaction touches one row.
+The first write on a day inserts its row seeded from the previous day's
+balance.  Rows written around the ORM should be passed to
+``update_balances()``.  A ledger that predates the table is backfilled once
+at startup with a window-function sum.
+
+The balance at a date is the latest row on or before it: one index seek.
+``balance_series`` looks up every point of a series in one query with a
+seek per point (the points are passed as a JSON array on SQLite and a date
+array on PostgreSQL), so its cost is proportional to the points returned,
+not to the history or the length of the range.
+"""
+import calendar
+import json
+from collections import defaultdict
+from datetime import date, timedelta
+
+from flask import has_app_context
+from sqlalchemy import and_, case, event, func, literal, select, text, union_all
+
+from models import db, DailyBalance, Transaction
+from utils.flush_history import flush_values
+from utils.plans import InvalidRange
+from utils.versioning import SCOPE_FAMILY, SCOPE_USER
+
+STEPS = ('day', 'week', 'month')
+MAX_POINTS = 5000  # points per series, over 13 years of days
+
+# Fields whose pre-flush value is needed to compute the delta
+_TRACKED_FIELDS = ('type', 'amount', 'date', 'user_id', 'family_id')
+
+
+def _signed(transaction_type, amount):
+    if transaction_type == 'income':
+        return float(amount or 0)
+    if transaction_type == 'expense':
+        return -float(amount or 0)
+    return 0.0
+
+
+def _contributions(values):
+    """``((scope, owner_id, day), signed amount)`` pairs of one transaction's values."""
+    if values['date'] is None or values['user_id'] is None:
+        return []
+    amount = _signed(values['type'], values['amount'])
+    if not amount:
+        return []
+    pairs = [((SCOPE_USER, int(values['user_id']), values['date']), amount)]
+    if values['family_id']:
+        pairs.append(((SCOPE_FAMILY, int(values['family_id']), values['date']), amount))
+    return pairs
+
+
+def _apply_delta(connection, key, delta):
+    """Add ``delta`` to the day's net and to the balance of the day and every later day."""
+    scope, owner_id, day = key
+    table = DailyBalance.__table__
+    owner = and_(table.c.scope == scope, table.c.owner_id == owner_id)
+    exists = connection.execute(select(table.c.day).where(owner, table.c.day == day)).first()
+    if exists is None:
+        previous = connection.execute(
+            select(table.c.balance).where(owner, table.c.day < day).order_by(table.c.day.desc()).limit(1)
+        ).scalar()
+        connection.execute(table.insert().values(
+            scope=scope, owner_id=owner_id, day=day, net=0.0, balance=previous or 0.0
+        ))
+    connection.execute(
+        table.update()
+        .where(owner, table.c.day >= day)
+        .values(balance=table.c.balance + delta,
+                net=table.c.net + case((table.c.day == day, delta), else_=0.0))
+    )
+
+
+def update_balances(connection, transactions):
+    """Add transactions (objects or rows with type, amount, date, user_id, family_id) that are already written."""
+    deltas = defaultdict(float)
+    for transaction in transactions:
+        values = {field: getattr(transaction, field) for field in _TRACKED_FIELDS}
+        for key, amount in _contributions(values):
+            deltas[key] += amount
+    for key, delta in sorted(deltas.items()):
+        if delta:
+            _apply_delta(connection, key, delta)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_balances_after_flush(session, flush_context):
+    if not has_app_context():
+        return
+
+    deltas = defaultdict(float)
+    for obj in session.new | session.dirty | session.deleted:
+        if not isinstance(obj, Transaction):
+            continue
+        before, after = flush_values(obj, _TRACKED_FIELDS)
+        old = [] if obj in session.new else _contributions(before)
+        new = [] if obj in session.deleted else _contributions(after)
+        if old == new:
+            continue
+        for key, amount in old:
+            deltas[key] -= amount
+        for key, amount in new:
+            deltas[key] += amount
+
+    deltas = {key: delta for key, delta in deltas.items() if abs(delta) > 1e-9}
+    if not deltas:
+        return
+    connection = session.connection()
+    for key, delta in sorted(deltas.items()):
+        _apply_delta(connection, key, delta)
+
+
+def _backfill(connection):
+    signed = case((Transaction.type == 'income', Transaction.amount),
+                  (Transaction.type == 'expense', -Transaction.amount), else_=0.0)
+    selects = []
+    for scope, owner in ((SCOPE_USER, Transaction.user_id), (SCOPE_FAMILY, Transaction.family_id)):
+        net = func.sum(signed)
+        selects.append(
+            select(literal(scope), owner, Transaction.date, net,
+                   func.sum(net).over(partition_by=owner, order_by=Transaction.date))
+            .where(owner.is_not(None))
+            .group_by(owner, Transaction.date)
+        )
+    table = DailyBalance.__table__
+    connection.execute(table.insert().from_select(
+        ['scope', 'owner_id', 'day', 'net', 'balance'], union_all(*selects)
+    ))
+
+
+def init_daily_balances(app):
+    """Backfill balances of a ledger that predates the table. Call after db.create_all()."""
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if connection.execute(select(DailyBalance.owner_id).limit(1)).first() is None and \
+                    connection.execute(select(Transaction.id).limit(1)).first() is not None:
+                _backfill(connection)
+
+
+def _month_end(day):
+    return date(day.year, day.month, calendar.monthrange(day.year, day.month)[1])
+
+
+def series_points(start, end, step):
+    """Last day of each ``step`` period from ``start``, the last period ending at ``end``."""
+    if step not in STEPS:
+        raise InvalidRange(f'step must be one of {", ".join(STEPS)}')
+    if start > end:
+        raise InvalidRange('"from" must not be after "to"')
+
+    points, day = [], start
+    while day <= end:
+        if step == 'day':
+            point = day
+        elif step == 'week':
+            point = day + timedelta(days=6)
+        else:
+            point = _month_end(day)
+        points.append(min(point, end))
+        if len(points) > MAX_POINTS:
+            raise InvalidRange(f'At most {MAX_POINTS} points per series')
+        day = point + timedelta(days=1)
+    return points
+
+
+# The series points as a table of (value, key) rows in point order, per dialect.
+# The tests exercise the sqlite form only; the postgresql one has been compiled, never executed.
+_POINTS = {
+    'sqlite': 'json_each(:points) AS p',
+    'postgresql': 'unnest(CAST(:points AS date[])) WITH ORDINALITY AS p(value, key)'
+}
+
+BALANCE_SERIES_SQL = """
+    SELECT (SELECT b.balance FROM daily_balance AS b
+            WHERE b.scope = :scope AND b.owner_id = :owner_id AND b.day <= p.value
+            ORDER BY b.day DESC LIMIT 1) AS balance
+    FROM {points}
+    ORDER BY p.key
+"""
+
+
+def balance_series(identity, scope, start, end, step='day'):
+    """Dates and balances at the end of each ``step`` from ``start`` to ``end``, as parallel lists."""
+    points = series_points(start, end, step)
+    owner_id = identity.family_id if scope == SCOPE_FAMILY else identity.user_id
+    if db.session.get_bind().dialect.name == 'postgresql':
+        statement, values = text(BALANCE_SERIES_SQL.format(points=_POINTS['postgresql'])), points
+    else:
+        statement = text(BALANCE_SERIES_SQL.format(points=_POINTS['sqlite']))
+        values = json.dumps([point.isoformat() for point in points])
+    balances = db.session.execute(statement, {'scope': scope, 'owner_id': owner_id, 'points': values}).scalars()
+    return {
+        'dates': [point.isoformat() for point in points],
+        'balances': [round(balance or 0.0, 2) for balance in balances]
+    }
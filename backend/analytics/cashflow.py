@@ -0,0 +1,189 @@
+"""
+Cash-flow time series bucketed by day, week (Monday to Sunday) or month.
+
+One query does all the work.  A recursive CTE (``generate_series`` on
+PostgreSQL) generates the calendar of bucket start dates, so empty periods
+come back as zeros instead of missing.  Transactions are summed per (bucket, key) with GROUP BY, where a
+key is a transaction type (plus ``net`` = income - expenses) or a category
+name.  The calendar is cross-joined with the keys and the sums left-joined
+onto it.  Window functions over each key's periods then add a trailing
+rolling average and the change from the previous period (month over
+month for monthly buckets).  The calendar starts ``window`` periods before
+the requested range, so the first points' averages and changes see the
+periods before them.
+
+Results come back as parallel arrays per key, compact enough for
+multi-year daily ranges.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import Date, bindparam, text
+
+from models import db
+from utils.plans import InvalidRange
+from utils.versioning import SCOPE_FAMILY
+
+BUCKETS = ('day', 'week', 'month')
+GROUPS = ('type', 'category')
+MAX_PERIODS = 5000  # buckets per series, over 13 years of days
+MAX_WINDOW = 24  # periods in the rolling average
+
+# Start of the bucket a date falls in, and the calendar of bucket starts from
+# :first to :last, per dialect.
+# Untested on PostgreSQL: those fragments were compiled but have not been run on a server.
+_BUCKET_START = {
+    'sqlite': {
+        'day': "date({column})",
+        'week': "date({column}, 'weekday 0', '-6 days')",
+        'month': "date({column}, 'start of month')",
+    },
+    'postgresql': {
+        'day': "CAST({column} AS DATE)",
+        'week': "CAST(date_trunc('week', CAST({column} AS TIMESTAMP)) AS DATE)",
+        'month': "CAST(date_trunc('month', CAST({column} AS TIMESTAMP)) AS DATE)",
+    }
+}
+_NEXT_BUCKET = {
+    'day': "date(period, '+1 day')",
+    'week': "date(period, '+7 days')",
+    'month': "date(period, '+1 month')",
+}
+_STEP = {'day': '1 day', 'week': '7 days', 'month': '1 month'}
+_CALENDAR = {
+    'sqlite': """
+        SELECT :first
+        UNION ALL
+        SELECT {next_bucket} FROM calendar WHERE period < :last
+    """,
+    'postgresql': """
+        SELECT CAST(g AS DATE)
+        FROM generate_series(CAST(:first AS TIMESTAMP), CAST(:last AS TIMESTAMP), INTERVAL '{step}') AS g
+    """
+}
+
+_TYPE_KEYS = """
+        SELECT {bucket} AS period, t.type AS key, SUM(t.amount) AS amount
+        FROM "transaction" AS t
+        WHERE {owner_filter} AND t.date >= :start AND t.date <= :end AND t.type IN ('income', 'expense')
+        GROUP BY 1, 2
+        UNION ALL
+        SELECT {bucket}, 'net',
+               SUM(CASE t.type WHEN 'income' THEN t.amount WHEN 'expense' THEN -t.amount ELSE 0 END)
+        FROM "transaction" AS t
+        WHERE {owner_filter} AND t.date >= :start AND t.date <= :end
+        GROUP BY 1
+"""
+
+_CATEGORY_KEYS = """
+        SELECT {bucket} AS period, COALESCE(c.name, 'Uncategorized') AS key, SUM(t.amount) AS amount
+        FROM "transaction" AS t
+        LEFT JOIN category AS c ON c.id = t.category_id
+        WHERE {owner_filter} AND t.date >= :start AND t.date <= :end AND t.type = :type
+        GROUP BY 1, 2
+"""
+
+CASHFLOW_SQL = """
+    WITH RECURSIVE calendar(period) AS ({calendar}),
+    sums AS ({sums}
+    ),
+    keys(key) AS ({keys}),
+    series AS (
+        SELECT k.key AS key, cal.period AS period, COALESCE(s.amount, 0) AS amount
+        FROM keys AS k
+        CROSS JOIN calendar AS cal
+        LEFT JOIN sums AS s ON s.key = k.key AND s.period = cal.period
+    )
+    SELECT key, period, amount, rolling, change FROM (
+        SELECT key, period, amount,
+               AVG(amount) OVER (PARTITION BY key ORDER BY period ROWS BETWEEN {preceding} PRECEDING AND CURRENT ROW)
+                   AS rolling,
+               amount - LAG(amount) OVER (PARTITION BY key ORDER BY period) AS change
+        FROM series
+    ) AS windows
+    WHERE period >= :range_first
+    ORDER BY key, period
+"""
+
+
+def bucket_start(day, bucket):
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _shift(start, bucket, periods):
+    """The bucket start ``periods`` buckets after (or before, if negative) ``start``."""
+    if bucket == 'day':
+        return start + timedelta(days=periods)
+    if bucket == 'week':
+        return start + timedelta(weeks=periods)
+    index = start.year * 12 + start.month - 1 + periods
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _period_count(first, last, bucket):
+    if bucket == 'day':
+        return (last - first).days + 1
+    if bucket == 'week':
+        return (last - first).days // 7 + 1
+    return (last.year - first.year) * 12 + last.month - first.month + 1
+
+
+def cashflow_series(identity, scope, start, end, bucket='month', group='type', category_type='expense', window=3):
+    """
+    Per-key amounts for every ``bucket`` from ``start`` to ``end`` with a
+    trailing ``window``-period average and the change from the previous
+    period.  ``group='type'`` gives income, expense and net;
+    ``group='category'`` gives one series per category of ``category_type``.
+    """
+    if bucket not in BUCKETS:
+        raise InvalidRange(f'bucket must be one of {", ".join(BUCKETS)}')
+    if group not in GROUPS:
+        raise InvalidRange(f'group must be one of {", ".join(GROUPS)}')
+    if start > end:
+        raise InvalidRange('"from" must not be after "to"')
+    if not 1 <= window <= MAX_WINDOW:
+        raise InvalidRange(f'window must be between 1 and {MAX_WINDOW}')
+
+    first, last = bucket_start(start, bucket), bucket_start(end, bucket)
+    periods = _period_count(first, last, bucket)
+    if periods > MAX_PERIODS:
+        raise InvalidRange(f'At most {MAX_PERIODS} {bucket}s per series')
+    # Earlier periods feed the first points' rolling average and change
+    lead_first = _shift(first, bucket, -window)
+
+    if scope == SCOPE_FAMILY:
+        owner_filter, owner_id = 't.family_id = :owner_id', identity.family_id
+    else:
+        owner_filter, owner_id = 't.user_id = :owner_id', identity.user_id
+    dialect = 'postgresql' if db.session.get_bind().dialect.name == 'postgresql' else 'sqlite'
+    bucket_expression = _BUCKET_START[dialect][bucket].format(column='t.date')
+    sums = (_TYPE_KEYS if group == 'type' else _CATEGORY_KEYS).format(bucket=bucket_expression,
+                                                                       owner_filter=owner_filter)
+    keys = ("VALUES ('income'), ('expense'), ('net')" if group == 'type'
+            else 'SELECT DISTINCT key FROM sums WHERE period >= :range_first')
+    calendar = _CALENDAR[dialect].format(next_bucket=_NEXT_BUCKET[bucket], step=_STEP[bucket])
+    statement = text(CASHFLOW_SQL.format(
+        calendar=calendar, sums=sums, keys=keys, preceding=window - 1
+    )).bindparams(*(bindparam(name, type_=Date) for name in ('first', 'last', 'range_first', 'start', 'end')))
+
+    rows = db.session.execute(statement, {
+        'first': lead_first,
+        'last': last,
+        'range_first': first,
+        'start': lead_first,
+        'end': end,
+        'owner_id': owner_id,
+        'type': category_type
+    })
+
+    labels = [_shift(first, bucket, i).isoformat() for i in range(periods)]
+    series = {}
+    for key, period, amount, rolling, change in rows:
+        values = series.setdefault(key, {'amount': [], 'rolling_average': [], 'change': []})
+        values['amount'].append(round(amount, 2))
+        values['rolling_average'].append(round(rolling, 2))
+        values['change'].append(round(change, 2) if change is not None else None)
+    return {'periods': labels, 'series': series}
@@ -0,0 +1,360 @@
+"""
+Streaming quantile and top-merchant sketches of transaction amounts.
+
+Each ``spending_sketch`` row summarizes one user's transactions in one
+category (and family, 0 for personal ones).  It holds:
+
+- count, sum and sum of squares, for the mean and standard deviation;
+- the exact minimum and maximum;
+- a merging t-digest of the amounts: at most about ``DIGEST_COMPRESSION / 2``
+  float32 (mean, weight) centroids, sized by the k1 scale function so the
+  tails stay precise;
+- Misra-Gries counters for the ``MERCHANT_COUNTERS`` most frequent merchants
+  (descriptions normalized as for categorization).
+
+Both sketches are mergeable.  The user view merges a user's rows per
+category, the family view merges every member's rows for the family per
+category name, and totals across categories merge again.  Quantile and
+top-N queries therefore read a few hundred bytes per category instead of
+the history.
+
+An ``after_flush`` hook adds new transactions to their rows.  A row that
+doesn't exist yet, or whose transactions were edited or deleted (sketches
+can't subtract), is rebuilt from that one key's history.  Rows written
+around the ORM should be passed to ``update_sketches()``.  A ledger that
+predates the table is sketched once at startup by ``init_spending_sketches``.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime
+from itertools import groupby
+
+import numpy as np
+from flask import has_app_context
+from sqlalchemy import and_, delete, event, func, inspect, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ai.categorizer import normalize_description
+from models import db, Category, SpendingSketch, Transaction
+from utils.flush_history import flush_values
+
+DIGEST_COMPRESSION = 200  # k1 scale range; about half as many centroids are kept
+MERCHANT_COUNTERS = 32  # Misra-Gries counters per sketch
+MERCHANT_LENGTH = 60  # merchant keys are truncated to this
+DEFAULT_QUANTILES = (50, 90)
+REBUILD_CHUNK = 1000  # sketches per insert when rebuilding everything
+KEY_CHUNK = 200  # keys per lookup, keeping OR lists well inside SQLite's expression depth
+
+# Fields that move a transaction between sketches or change what it contributed
+_SKETCHED_FIELDS = ('user_id', 'family_id', 'category_id', 'amount', 'description')
+
+
+def compress_digest(means, weights, compression=DIGEST_COMPRESSION):
+    """
+    Merge centroids so each spans at most one unit of the k1 scale
+    ``compression / 2pi * asin(2q - 1)``: one pass of bincount over the
+    sorted centroids.
+    """
+    means = np.asarray(means, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if len(means) == 0:
+        return means, weights
+    order = np.argsort(means, kind='stable')
+    means, weights = means[order], weights[order]
+    cumulative = np.cumsum(weights)
+    midpoints = (cumulative - weights / 2) / cumulative[-1]
+    scale = compression / (2 * math.pi) * np.arcsin(2 * midpoints - 1)
+    buckets = np.floor(scale - scale[0]).astype(np.intp)
+    merged_weights = np.bincount(buckets, weights)
+    merged_sums = np.bincount(buckets, weights * means)
+    keep = merged_weights > 0
+    return merged_sums[keep] / merged_weights[keep], merged_weights[keep]
+
+
+def digest_quantiles(means, weights, minimum, maximum, percentiles):
+    """Interpolated percentiles from centroids, pinned to the exact minimum and maximum."""
+    cumulative = np.cumsum(weights)
+    total = cumulative[-1]
+    positions = np.concatenate(([0.0], cumulative - weights / 2, [total]))
+    values = np.concatenate(([minimum], means, [maximum]))
+    return np.interp(np.asarray(percentiles, dtype=np.float64) / 100 * total, positions, values)
+
+
+def merge_counters(counters, capacity=MERCHANT_COUNTERS):
+    """
+    Misra-Gries merge: add the counters up, then subtract the
+    ``capacity + 1``-th largest count so at most ``capacity`` stay positive.
+    Any count is then at most ``n / (capacity + 1)`` below the true one.
+    """
+    merged = Counter()
+    for counter in counters:
+        merged.update(counter)
+    if len(merged) <= capacity:
+        return dict(merged)
+    cut = sorted(merged.values(), reverse=True)[capacity]
+    return {merchant: count - cut for merchant, count in merged.items() if count > cut}
+
+
+def _merchant(description):
+    return normalize_description(description)[:MERCHANT_LENGTH]
+
+
+class Sketch:
+    """In-memory form of a ``spending_sketch`` row."""
+
+    __slots__ = ('count', 'total', 'sum_squares', 'minimum', 'maximum', 'means', 'weights', 'merchants')
+
+    def __init__(self, count=0, total=0.0, sum_squares=0.0, minimum=math.inf, maximum=-math.inf,
+                 means=(), weights=(), merchants=None):
+        self.count = count
+        self.total = total
+        self.sum_squares = sum_squares
+        self.minimum = minimum
+        self.maximum = maximum
+        self.means = np.asarray(means, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.merchants = merchants or {}
+
+    @classmethod
+    def from_row(cls, row):
+        """Sketch of a ``spending_sketch`` row mapping."""
+        centroids = np.frombuffer(row['centroids'], dtype=np.float32).reshape(-1, 2)
+        return cls(row['count'], row['total'], row['sum_squares'], row['minimum'], row['maximum'],
+                   centroids[:, 0], centroids[:, 1], dict(row['merchants'] or {}))
+
+    @classmethod
+    def from_transactions(cls, amounts, descriptions):
+        sketch = cls()
+        sketch.add(amounts, descriptions)
+        return sketch
+
+    def add(self, amounts, descriptions):
+        amounts = np.asarray(amounts, dtype=np.float64)
+        if len(amounts) == 0:
+            return self
+        self.count += len(amounts)
+        self.total += float(amounts.sum())
+        self.sum_squares += float(np.dot(amounts, amounts))
+        self.minimum = min(self.minimum, float(amounts.min()))
+        self.maximum = max(self.maximum, float(amounts.max()))
+        self.means, self.weights = compress_digest(
+            np.concatenate((self.means, amounts)), np.concatenate((self.weights, np.ones(len(amounts))))
+        )
+        seen = Counter(merchant for merchant in map(_merchant, descriptions) if merchant)
+        if seen:
+            self.merchants = merge_counters([self.merchants, seen])
+        return self
+
+    @classmethod
+    def merge(cls, sketches):
+        sketches = [sketch for sketch in sketches if sketch.count]
+        merged = cls(
+            sum(s.count for s in sketches), sum(s.total for s in sketches), sum(s.sum_squares for s in sketches),
+            min((s.minimum for s in sketches), default=math.inf), max((s.maximum for s in sketches), default=-math.inf)
+        )
+        if len(sketches) == 1:
+            merged.means, merged.weights = sketches[0].means, sketches[0].weights
+        elif sketches:
+            merged.means, merged.weights = compress_digest(
+                np.concatenate([s.means for s in sketches]), np.concatenate([s.weights for s in sketches])
+            )
+        merged.merchants = merge_counters([s.merchants for s in sketches])
+        return merged
+
+    def values(self):
+        """Column values for the sketch's row."""
+        return {
+            'count': self.count,
+            'total': self.total,
+            'sum_squares': self.sum_squares,
+            'minimum': self.minimum,
+            'maximum': self.maximum,
+            'centroids': np.column_stack((self.means, self.weights)).astype(np.float32).tobytes(),
+            'merchants': self.merchants,
+            'updated_at': datetime.utcnow()
+        }
+
+    def summary(self, percentiles=DEFAULT_QUANTILES, top=10):
+        mean = self.total / self.count
+        variance = max(self.sum_squares / self.count - mean * mean, 0.0)
+        quantiles = digest_quantiles(self.means, self.weights, self.minimum, self.maximum, percentiles)
+        merchants = sorted(self.merchants.items(), key=lambda item: (-item[1], item[0]))[:top]
+        return {
+            'count': self.count,
+            'total': round(self.total, 2),
+            'mean': round(mean, 2),
+            'std': round(math.sqrt(variance), 2),
+            'min': round(self.minimum, 2),
+            'max': round(self.maximum, 2),
+            'quantiles': {f'p{p:g}': round(float(value), 2) for p, value in zip(percentiles, quantiles)},
+            'top_merchants': [{'merchant': merchant, 'count': count} for merchant, count in merchants]
+        }
+
+
+def _key(user_id, family_id, category_id):
+    if user_id is None or category_id is None:
+        return None
+    return int(user_id), int(family_id or 0), int(category_id)
+
+
+def _chunks(keys):
+    keys = sorted(keys)
+    for start in range(0, len(keys), KEY_CHUNK):
+        yield keys[start:start + KEY_CHUNK]
+
+
+def _key_filter(keys):
+    return or_(*(and_(SpendingSketch.user_id == user_id, SpendingSketch.family_id == family_id,
+                      SpendingSketch.category_id == category_id) for user_id, family_id, category_id in keys))
+
+
+def _upsert(connection, rows):
+    insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(SpendingSketch.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['user_id', 'family_id', 'category_id'],
+        set_={name: statement.excluded[name] for name in rows[0] if name not in ('user_id', 'family_id', 'category_id')}
+    )
+    connection.execute(statement, rows)
+
+
+def _row(key, sketch):
+    return {'user_id': key[0], 'family_id': key[1], 'category_id': key[2], **sketch.values()}
+
+
+def rebuild_sketches(connection, keys):
+    """Recompute the sketches of ``(user_id, family_id, category_id)`` keys from their transactions."""
+    family_id = func.coalesce(Transaction.family_id, 0)
+    for chunk in _chunks(keys):
+        connection.execute(delete(SpendingSketch.__table__).where(_key_filter(chunk)))
+        rows = connection.execute(
+            select(Transaction.user_id, family_id, Transaction.category_id, Transaction.amount, Transaction.description)
+            .where(or_(*(and_(Transaction.category_id == category, Transaction.user_id == user, family_id == family)
+                         for user, family, category in chunk)))
+        )
+        grouped = defaultdict(lambda: ([], []))
+        for user, family, category, amount, description in rows:
+            amounts, descriptions = grouped[(user, family, category)]
+            amounts.append(amount or 0.0)
+            descriptions.append(description)
+        if grouped:
+            _upsert(connection, [_row(key, Sketch.from_transactions(*columns)) for key, columns in grouped.items()])
+
+
+def update_sketches(connection, transactions):
+    """
+    Add transactions (objects or rows with user_id, family_id, category_id,
+    amount and description) that are already written to their sketches.
+    """
+    added = defaultdict(lambda: ([], []))
+    for transaction in transactions:
+        key = _key(transaction.user_id, transaction.family_id, transaction.category_id)
+        if key is not None:
+            added[key][0].append(transaction.amount or 0.0)
+            added[key][1].append(transaction.description)
+    if not added:
+        return
+
+    existing = {}
+    for chunk in _chunks(added):
+        query = select(SpendingSketch.__table__).where(_key_filter(chunk))
+        if connection.dialect.name != 'sqlite':
+            # Concurrent writers to a sketch merge one after the other instead of overwriting each other;
+            # SQLite already serializes them on the database write lock
+            query = query.with_for_update()
+        for row in connection.execute(query).mappings():
+            existing[(row['user_id'], row['family_id'], row['category_id'])] = row
+    # Keys without a row yet are built from their history, which already includes these transactions
+    rebuild_sketches(connection, set(added) - set(existing))
+    updates = [_row(key, Sketch.from_row(existing[key]).add(*columns))
+               for key, columns in added.items() if key in existing]
+    if updates:
+        _upsert(connection, updates)
+
+
+def _before_and_after_keys(obj):
+    before, after = flush_values(obj, ('user_id', 'family_id', 'category_id'))
+    return _key(**before), _key(**after)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_sketches_after_flush(session, flush_context):
+    if not has_app_context():
+        return
+
+    added, rebuild = [], set()
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            added.append(obj)
+    for obj in session.dirty | session.deleted:
+        if not isinstance(obj, Transaction):
+            continue
+        state = inspect(obj)
+        if obj in session.deleted or any(state.attrs[f].history.has_changes() for f in _SKETCHED_FIELDS):
+            rebuild.update(key for key in _before_and_after_keys(obj) if key is not None)
+    removed_categories = {obj.id for obj in session.deleted if isinstance(obj, Category)}
+    if not (added or rebuild or removed_categories):
+        return
+
+    connection = session.connection()
+    if removed_categories:
+        connection.execute(delete(SpendingSketch.__table__).where(
+            SpendingSketch.category_id.in_(removed_categories)
+        ))
+    rebuild_sketches(connection, {key for key in rebuild if key[2] not in removed_categories})
+    update_sketches(connection, [obj for obj in added if _key(obj.user_id, obj.family_id, obj.category_id) not in rebuild])
+
+
+def _rebuild_all(connection):
+    family_id = func.coalesce(Transaction.family_id, 0)
+    rows = connection.execution_options(yield_per=10000).execute(
+        select(Transaction.user_id, family_id, Transaction.category_id, Transaction.amount, Transaction.description)
+        .order_by(Transaction.user_id, family_id, Transaction.category_id)
+    )
+    batch = []
+    for key, group in groupby(rows, key=lambda row: (row[0], row[1], row[2])):
+        group = list(group)
+        batch.append(_row(key, Sketch.from_transactions([row[3] or 0.0 for row in group], [row[4] for row in group])))
+        if len(batch) >= REBUILD_CHUNK:
+            _upsert(connection, batch)
+            batch = []
+    if batch:
+        _upsert(connection, batch)
+
+
+def init_spending_sketches(app):
+    """Sketch a ledger that predates the sketch table. Call after db.create_all()."""
+    with app.app_context():
+        with db.engine.begin() as connection:
+            if connection.execute(select(SpendingSketch.user_id).limit(1)).first() is None and \
+                    connection.execute(select(Transaction.id).limit(1)).first() is not None:
+                _rebuild_all(connection)
+
+
+def spending_distribution(identity, scope, category_type='expense', percentiles=DEFAULT_QUANTILES, top=10):
+    """
+    Count, mean, standard deviation, percentiles and top merchants per
+    category and overall, for the user's own (``scope='user'``) or the
+    family's transactions, merged from the stored sketches.
+    """
+    query = select(SpendingSketch.__table__, Category.name.label('category_name')).join(
+        Category, Category.id == SpendingSketch.category_id
+    ).where(Category.type == category_type)
+    if scope == 'family':
+        query = query.where(SpendingSketch.family_id == identity.family_id)
+    else:
+        query = query.where(SpendingSketch.user_id == identity.user_id)
+
+    by_category = defaultdict(list)
+    for row in db.session.execute(query).mappings():
+        by_category[row['category_name']].append(Sketch.from_row(row))
+
+    categories = {name: Sketch.merge(sketches) for name, sketches in by_category.items()}
+    overall = Sketch.merge(categories.values())
+    return {
+        'categories': sorted(
+            ({'category': name, **sketch.summary(percentiles, top)} for name, sketch in categories.items()),
+            key=lambda entry: (-entry['total'], entry['category'])
+        ),
+        'overall': overall.summary(percentiles, top) if overall.count else None
+    }
@@ -0,0 +1,225 @@
+"""
+Plan-vs-actual variance for monthly plans.
+
+A month's plan keeps its expectations as JSON lists of
+``{category, amount, ...}`` entries.  ``json_each`` (``json_array_elements``
+on PostgreSQL) expands them inside the database, and a single query unions
+them with the month's transactions grouped by (month, type, category name),
+emulating a full outer join.
+
+Per-month aggregates are cached in-process and revalidated against the
+month-scoped data versions (see utils.versioning), so adding one transaction
+only recomputes its own month.  Burn rate and projection depend on today's
+date, so they are derived at response time and never cached.
+"""
+from collections import namedtuple
+from datetime import date
+
+from sqlalchemy import Date, bindparam, text
+
+from config import Config
+from models import db
+from utils.cache import TTLCache
+from utils.plans import resolve_plans, month_range
+from utils.versioning import (
+    load_scope_versions, user_month_scope, family_month_scope,
+    SCOPE_FAMILY, SCOPE_USER_CATEGORIES, SCOPE_FAMILY_CATEGORIES
+)
+
+# planned/actual per (type, category) for one month, plus the plan it came from
+MonthAggregate = namedtuple('MonthAggregate', ['plan_id', 'is_family_plan', 'lines'])
+
+variance_cache = TTLCache(maxsize=Config.VARIANCE_CACHE_SIZE, ttl=Config.VARIANCE_CACHE_TTL)
+
+# JSON expansion and month formatting per dialect.
+# The postgresql fragments have been compiled but not yet run against a PostgreSQL server.
+_DIALECT_SQL = {
+    'sqlite': {
+        'elements': 'json_each({column}) AS e',
+        'category': "json_extract(e.value, '$.category')",
+        'amount': "CAST(json_extract(e.value, '$.amount') AS REAL)",
+        'month': "strftime('%Y-%m', t.date)"
+    },
+    'postgresql': {
+        'elements': 'json_array_elements({column}) AS e(value)',
+        'category': "e.value ->> 'category'",
+        'amount': ("CASE WHEN json_typeof(e.value -> 'amount') = 'number' "
+                   "OR (e.value ->> 'amount') ~ '^\\s*-?[0-9]+(\\.[0-9]*)?\\s*$' "
+                   "THEN CAST(e.value ->> 'amount' AS DOUBLE PRECISION) END"),
+        'month': "to_char(t.date, 'YYYY-MM')"
+    }
+}
+
+VARIANCE_SQL = """
+    WITH planned AS (
+        SELECT p.month AS month, 'expense' AS type,
+               {category} AS category,
+               SUM({amount}) AS amount
+        FROM monthly_plan AS p, {expenses}
+        WHERE p.id IN :plan_ids
+        GROUP BY 1, 2, 3
+        UNION ALL
+        SELECT p.month, 'income',
+               {category},
+               SUM({amount})
+        FROM monthly_plan AS p, {income}
+        WHERE p.id IN :plan_ids
+        GROUP BY 1, 2, 3
+    ),
+    actual AS (
+        SELECT {month} AS month, t.type AS type, c.name AS category, SUM(t.amount) AS amount
+        FROM "transaction" AS t
+        LEFT JOIN category AS c ON c.id = t.category_id
+        WHERE {owner_filter} AND t.date >= :start AND t.date < :end
+        GROUP BY 1, 2, 3
+    )
+    SELECT month, type, category, SUM(planned) AS planned, SUM(actual) AS actual
+    FROM (
+        SELECT month, type, category, amount AS planned, 0 AS actual FROM planned
+        UNION ALL
+        SELECT month, type, category, 0, amount FROM actual
+    ) AS lines
+    GROUP BY month, type, category
+"""
+
+
+def _variance_statement(dialect, owner_filter):
+    sql = _DIALECT_SQL['postgresql' if dialect == 'postgresql' else 'sqlite']
+    return text(VARIANCE_SQL.format(
+        category=sql['category'], amount=sql['amount'], month=sql['month'], owner_filter=owner_filter,
+        expenses=sql['elements'].format(column='p.expected_expenses'),
+        income=sql['elements'].format(column='p.expected_income')
+    )).bindparams(bindparam('plan_ids', expanding=True), bindparam('start', type_=Date), bindparam('end', type_=Date))
+
+
+def _month_bounds(month):
+    year, number = map(int, month.split('-'))
+    start = date(year, number, 1)
+    end = date(year + 1, 1, 1) if number == 12 else date(year, number + 1, 1)
+    return start, end
+
+
+def _aggregate(identity, scope, months):
+    plans = resolve_plans(identity, months, scope, keys_only=True)
+    start, _ = _month_bounds(months[0])
+    _, end = _month_bounds(months[-1])
+
+    if scope == SCOPE_FAMILY:
+        owner_filter, owner_id = 't.family_id = :owner_id', identity.family_id
+    else:
+        owner_filter, owner_id = 't.user_id = :owner_id', identity.user_id
+    statement = _variance_statement(db.session.get_bind().dialect.name, owner_filter)
+    rows = db.session.execute(statement, {
+        'plan_ids': [plan.id for plan in plans.values()] or [-1],
+        'owner_id': owner_id,
+        'start': start,
+        'end': end
+    })
+
+    lines = {month: [] for month in months}
+    for month, line_type, category, planned, actual in rows:
+        if month in lines:
+            lines[month].append((line_type, category or 'Uncategorized', planned or 0.0, actual or 0.0))
+
+    result = {}
+    for month in months:
+        plan = plans.get(month)
+        result[month] = MonthAggregate(
+            plan.id if plan else None,
+            plan is not None and plan.family_id is not None,
+            sorted(lines[month])
+        )
+    return result
+
+
+def _version_keys(identity, months):
+    keys = [(SCOPE_USER_CATEGORIES, identity.user_id), (SCOPE_FAMILY_CATEGORIES, identity.family_id)]
+    for month in months:
+        keys.append((user_month_scope(month), identity.user_id))
+        keys.append((family_month_scope(month), identity.family_id))
+    return keys
+
+
+def _month_token(versions, identity, month):
+    return (
+        versions.get((user_month_scope(month), identity.user_id)),
+        versions.get((family_month_scope(month), identity.family_id)),
+        versions.get((SCOPE_USER_CATEGORIES, identity.user_id)),
+        versions.get((SCOPE_FAMILY_CATEGORIES, identity.family_id))
+    )
+
+
+def monthly_aggregates(identity, scope, months):
+    """Cached ``MonthAggregate`` per month; only months whose data changed are recomputed."""
+    versions = load_scope_versions(_version_keys(identity, months))
+    owner = identity.family_id if scope == SCOPE_FAMILY else identity.user_id
+
+    aggregates, stale = {}, []
+    for month in months:
+        token = _month_token(versions, identity, month)
+        cached = variance_cache.get((scope, owner, identity.family_id, month))
+        if cached is not None and cached[0] == token:
+            aggregates[month] = cached[1]
+        else:
+            stale.append(month)
+
+    if stale:
+        # One query over the span of stale months; unchanged months in between are cheap to recompute
+        fresh = _aggregate(identity, scope, month_range(stale[0], stale[-1]))
+        for month in stale:
+            aggregates[month] = fresh[month]
+            token = _month_token(versions, identity, month)
+            variance_cache.set((scope, owner, identity.family_id, month), (token, fresh[month]))
+    return aggregates
+
+
+def _elapsed_days(month, today):
+    start, end = _month_bounds(month)
+    days_in_month = (end - start).days
+    if today < start:
+        return 0, days_in_month
+    if today >= end:
+        return days_in_month, days_in_month
+    return today.day, days_in_month
+
+
+def _line(line_type, category, planned, actual, elapsed, days_in_month):
+    burn_rate = actual / elapsed if elapsed else 0.0
+    return {
+        'type': line_type,
+        'category': category,
+        'planned': round(planned, 2),
+        'actual': round(actual, 2),
+        'remaining': round(planned - actual, 2),
+        'burn_rate': round(burn_rate, 2),  # per day so far
+        'projected': round(burn_rate * days_in_month, 2)
+    }
+
+
+def plan_variance(identity, scope, months, today=None):
+    """Per-category and total planned, actual, remaining, burn rate and projection for each month."""
+    today = today or date.today()
+    aggregates = monthly_aggregates(identity, scope, months)
+
+    result = []
+    for month in months:
+        aggregate = aggregates[month]
+        elapsed, days_in_month = _elapsed_days(month, today)
+        totals = {}
+        for line_type, _, planned, actual in aggregate.lines:
+            total = totals.setdefault(line_type, [0.0, 0.0])
+            total[0] += planned
+            total[1] += actual
+        result.append({
+            'month': month,
+            'plan_id': aggregate.plan_id,
+            'is_family_plan': aggregate.is_family_plan,
+            'days_elapsed': elapsed,
+            'days_in_month': days_in_month,
+            'categories': [_line(*line, elapsed, days_in_month) for line in aggregate.lines],
+            'totals': {
+                line_type: _line(line_type, None, planned, actual, elapsed, days_in_month)
+                for line_type, (planned, actual) in sorted(totals.items())
+            }
+        })
+    return result
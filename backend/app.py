@@ -1,27 +1,53 @@
 from flask import Flask, request, jsonify
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_refresh_token, jwt_required, get_jwt_identity
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from flask_mail import Mail, Message
+from flask_mail import Mail
 from config import Config
-from models import db, User, Transaction, MonthlyPlan, Family, Invitation, FamilyMember, Category
+from models import db, User, Transaction, Family, Invitation, FamilyMember, Category, RecurrenceRule
 import random
 import string
 from datetime import datetime, timedelta
-import bcrypt
 from functools import wraps
 import logging
 from ai.routes import ai_bp
+from ai.kernels import init_analytics_pool
+from ai.batch import init_ai_batch
+from ai.categorizer import init_categorizer, CategorizerBusy, CategorizerUnavailable
 from routes.monthly_plans import monthly_plans_bp
+from routes.analytics import analytics_bp
+from analytics.sketches import init_spending_sketches
+from analytics.balance import init_daily_balances
+from routes.recurrences import recurrences_bp
+from utils.database import init_database, ensure_columns, ensure_indexes
+from utils.versioning import conditional_get, SCOPE_USER, SCOPE_FAMILY
+from utils.identity import current_identity, identity_of, create_user_token, invalidate_identity
+from utils.passwords import password_hasher, PasswordHasherBusy
+from utils.lookups import resolve_category, resolve_family_member, invalidate_categories, invalidate_family_members
+from utils.json_provider import JSON_PROVIDERS
+from utils.compression import init_compression
+from utils.columnar import wants_columnar, columnar_response, representation, transaction_columns
+from utils.outbox import init_outbox, queue_email
+from utils.notifications import init_notification_retention
+from utils.jobs import init_jobs
+from utils.search import init_user_search, find_users
+from utils.transaction_search import init_transaction_search, find_transactions, InvalidCursor
+from utils import alerts  # registers the budget alert flush hook
+from utils.recurrence import init_recurrence_scheduler, rule_from_transaction, stop_recurrence
 
 # Register the blueprint
 
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
+init_database(app)
 jwt = JWTManager(app)
 app.register_blueprint(ai_bp, url_prefix='/api/ai')
 app.register_blueprint(monthly_plans_bp, url_prefix='/api/monthly-plans')
+app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+app.register_blueprint(recurrences_bp, url_prefix='/api/recurrences')
+app.json = JSON_PROVIDERS[app.config['JSON_PROVIDER']](app)
+init_compression(app)
 
 
 # Configure logging
@@ -73,6 +99,14 @@ def unauthorized_callback(error):
     }), 401
 
 mail = Mail(app)
+# Forks the analytics workers, so it runs while the process has no other threads
+analytics_pool = init_analytics_pool(app)
+outbox_worker = init_outbox(app)
+retention_worker = init_notification_retention(app)
+job_runner = init_jobs(app)
+ai_batch_worker = init_ai_batch(app)
+recurrence_worker = init_recurrence_scheduler(app)
+categorizer = init_categorizer(app)
 
 # Error handling decorator
 def handle_errors(f):
@@ -89,6 +123,11 @@ def handle_errors(f):
 def generate_otp():
     return ''.join(random.choices(string.digits, k=6))
 
+def busy_response():
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # User Profile Routes
 @app.route('/api/user/profile', methods=['GET'])
 @jwt_required()
@@ -202,6 +241,7 @@ def upload_profile_image():
 # Category Routes
 @app.route('/api/categories', methods=['GET'])
 @jwt_required()
+@conditional_get(SCOPE_USER)
 @handle_errors
 def get_categories():
     user_id = get_jwt_identity()
@@ -235,6 +275,7 @@ def add_category():
     
     db.session.add(category)
     db.session.commit()
+    invalidate_categories(user_id)
     
     return jsonify({
         'id': category.id,
@@ -261,6 +302,7 @@ def update_category(id):
     category.suggested_limit = data.get('suggested_limit', category.suggested_limit)
     
     db.session.commit()
+    invalidate_categories(user_id)
     return jsonify({'message': 'Category updated successfully'})
 
 @app.route('/api/categories/<int:id>', methods=['DELETE'])
@@ -271,16 +313,19 @@ def delete_category(id):
     category = Category.query.filter_by(id=id, user_id=user_id).first_or_404()
     db.session.delete(category)
     db.session.commit()
+    invalidate_categories(user_id)
     return jsonify({'message': 'Category deleted successfully'})
 
 # Family Member Routes
 @app.route('/api/family/members', methods=['GET'])
 @jwt_required()
+@conditional_get(SCOPE_FAMILY)
 @handle_errors
 def get_family_members():
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
-    family_members = FamilyMember.query.filter_by(family_id=user.family_id).all()
+    identity = current_identity()
+    if identity is None:
+        return jsonify({'message': 'User not found'}), 404
+    family_members = FamilyMember.query.filter_by(family_id=identity.family_id).all()
     return jsonify([{
         'id': member.id,
         'name': member.name,
@@ -293,9 +338,10 @@ def get_family_members():
 @jwt_required()
 @handle_errors
 def update_family_member(id):
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
-    member = FamilyMember.query.filter_by(id=id, family_id=user.family_id).first_or_404()
+    identity = current_identity()
+    if identity is None:
+        return jsonify({'message': 'User not found'}), 404
+    member = FamilyMember.query.filter_by(id=id, family_id=identity.family_id).first_or_404()
     data = request.get_json()
     
     member.name = data.get('name', member.name)
@@ -304,17 +350,20 @@ def update_family_member(id):
     member.color = data.get('color', member.color)
     
     db.session.commit()
+    invalidate_family_members(identity.family_id)
     return jsonify({'message': 'Family member updated successfully'})
 
 @app.route('/api/family/members/<int:id>', methods=['DELETE'])
 @jwt_required()
 @handle_errors
 def delete_family_member(id):
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
-    member = FamilyMember.query.filter_by(id=id, family_id=user.family_id).first_or_404()
+    identity = current_identity()
+    if identity is None:
+        return jsonify({'message': 'User not found'}), 404
+    member = FamilyMember.query.filter_by(id=id, family_id=identity.family_id).first_or_404()
     db.session.delete(member)
     db.session.commit()
+    invalidate_family_members(identity.family_id)
     return jsonify({'message': 'Family member deleted successfully'})
 
 # Family Invitation Routes
@@ -322,36 +371,34 @@ def delete_family_member(id):
 @jwt_required()
 @handle_errors
 def invite_family_member():
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    identity = current_identity()
+    if identity is None:
+        return jsonify({'message': 'User not found'}), 404
     data = request.get_json()
     
-    if not user.family_id:
+    if not identity.family_id:
         return jsonify({'message': 'You are not part of a family'}), 400
         
     invitation = Invitation(
         email=data['email'],
-        family_id=user.family_id,
+        family_id=identity.family_id,
+        invited_by=identity.user_id,
+        role=data.get('role', 'member'),
         otp=generate_otp(),
         expires_at=datetime.utcnow() + timedelta(days=7)
     )
-    
     db.session.add(invitation)
-    db.session.commit()
-    
-    # Send invitation email
-    try:
-        msg = Message(
-            'Family Finance Tracker Invitation',
-            sender=app.config['MAIL_USERNAME'],
-            recipients=[data['email']]
-        )
-        msg.body = f'''You have been invited to join a family on Finance Tracker.
+
+    # Queue the invitation email; it is sent in the background after commit
+    queue_email(
+        data['email'],
+        'Family Finance Tracker Invitation',
+        f'''You have been invited to join a family on Finance Tracker.
         Your invitation code is: {invitation.otp}
         This code will expire in 7 days.'''
-        mail.send(msg)
-    except Exception as e:
-        print(f"Failed to send email: {str(e)}")
+    )
+    db.session.commit()
+    outbox_worker.wake()
         
     return jsonify({'message': 'Invitation sent successfully'})
 
@@ -360,17 +407,8 @@ def invite_family_member():
 @handle_errors
 def search_users():
     """Search for users by email to add to family"""
-    query = request.args.get('query', '').lower()
-    if not query:
-        return jsonify([])
-        
-    users = User.query.filter(User.email.ilike(f'%{query}%')).limit(5).all()
-    return jsonify([{
-        'id': user.id,
-        'email': user.email,
-        'name': user.name,
-        'profile_image': user.profile_image
-    } for user in users])
+    query = request.args.get('query', '')
+    return jsonify(find_users(query, limit=5))
 
 @app.route('/api/family/create', methods=['POST'])
 @jwt_required()
@@ -405,6 +443,8 @@ def create_family():
     )
     db.session.add(member)
     db.session.commit()
+    invalidate_identity(user.id)
+    invalidate_family_members(family.id)
 
     return jsonify({
         'message': 'Family created successfully',
@@ -442,21 +482,17 @@ def invite_to_family():
         expires_at=datetime.utcnow() + timedelta(days=7)
     )
     db.session.add(invitation)
-    db.session.commit()
 
-    # Send invitation email
-    try:
-        msg = Message(
-            'Family Finance Tracker Invitation',
-            sender=app.config['MAIL_USERNAME'],
-            recipients=[data['email']]
-        )
-        msg.body = f'''You have been invited to join {user.name}'s family on Finance Tracker.
+    # Queue the invitation email; it is sent in the background after commit
+    queue_email(
+        data['email'],
+        'Family Finance Tracker Invitation',
+        f'''You have been invited to join {user.name}'s family on Finance Tracker.
         Your invitation code is: {invitation.otp}
         This code will expire in 7 days.'''
-        mail.send(msg)
-    except Exception as e:
-        print(f"Failed to send email: {str(e)}")
+    )
+    db.session.commit()
+    outbox_worker.wake()
 
     return jsonify({'message': 'Invitation sent successfully'})
 
@@ -465,11 +501,12 @@ def invite_to_family():
 @handle_errors
 def add_family_member():
     """Add an existing user to the family"""
-    user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    identity = current_identity()
+    if identity is None:
+        return jsonify({'message': 'User not found'}), 404
     data = request.get_json()
 
-    if not user.family_id or not user.is_family_admin:
+    if not identity.family_id or not identity.is_family_admin:
         return jsonify({'message': 'Unauthorized'}), 403
 
     member_user = User.query.get_or_404(data['user_id'])
@@ -477,7 +514,7 @@ def add_family_member():
         return jsonify({'message': 'User is already part of a family'}), 400
 
     # Add user to family
-    member_user.family_id = user.family_id
+    member_user.family_id = identity.family_id
 
     # Create family member entry
     member = FamilyMember(
@@ -485,11 +522,13 @@ def add_family_member():
         role=data['role'],
         icon=data.get('icon', '👤'),
         color=data.get('color', '#4ECDC4'),
-        family_id=user.family_id,
+        family_id=identity.family_id,
         user_id=member_user.id
     )
     db.session.add(member)
     db.session.commit()
+    invalidate_identity(member_user.id)
+    invalidate_family_members(identity.family_id)
 
     return jsonify({
         'message': 'Family member added successfully',
@@ -540,6 +579,8 @@ def join_family():
     # Update invitation status
     invitation.status = 'accepted'
     db.session.commit()
+    invalidate_identity(user.id)
+    invalidate_family_members(invitation.family_id)
 
     return jsonify({
         'message': 'Successfully joined family',
@@ -566,8 +607,10 @@ def register():
 
         print(f"Creating new user with email: {data['email']}")
         try:
-            hashed_password = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+            hashed_password = password_hasher.hash(data['password'])
             print("Password successfully hashed")
+        except PasswordHasherBusy:
+            return busy_response()
         except Exception as e:
             print(f"Error hashing password: {str(e)}")
             return jsonify({'message': 'Error processing password'}), 500
@@ -615,24 +658,47 @@ def login():
         print(f"Login attempt for email: {data.get('email')}")
         
         user = User.query.filter_by(email=data['email']).first()
-        if not user or not bcrypt.checkpw(data['password'].encode('utf-8'), user.password):
+        if not user or not password_hasher.verify(data['password'], user.password):
             print(f"Failed login attempt for email: {data.get('email')}")
             return jsonify({'message': 'Invalid credentials'}), 401
 
-        token = create_access_token(identity=user.id)
+        # Upgrade hashes made with an older cost factor while we have the password.  Best effort:
+        # a busy hasher must not turn a correct login into a 503, the next login retries.
+        if password_hasher.needs_rehash(user.password):
+            try:
+                user.password = password_hasher.hash(data['password'])
+                db.session.commit()
+            except PasswordHasherBusy:
+                logger.warning(f"Skipped rehashing the password of user {user.id}: hasher busy")
+
+        token = create_user_token(identity_of(user))
+        refresh_token = create_refresh_token(identity=str(user.id))
         print(f"Created token for user ID: {user.id}")
         print(f"Successful login for user: {user.email}")
         return jsonify({
             'token': token,
+            'refresh_token': refresh_token,
             'user': {
                 'id': user.id,
                 'email': user.email
             }
         }), 200
+    except PasswordHasherBusy:
+        return busy_response()
     except Exception as e:
         print(f"Login error: {str(e)}")
         return jsonify({'message': 'Login failed', 'error': str(e)}), 500
 
+@app.route('/api/token/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+@handle_errors
+def refresh_token():
+    """Issue a new access token without re-checking the password"""
+    identity = current_identity()
+    if identity is None:
+        return jsonify({'message': 'User not found'}), 401
+    return jsonify({'token': create_user_token(identity)}), 200
+
 @app.route('/api/logout', methods=['POST'])
 @jwt_required()
 @handle_errors
@@ -643,6 +709,7 @@ def logout():
 # Transaction Routes
 @app.route('/api/transactions', methods=['GET'])
 @jwt_required()
+@conditional_get(SCOPE_USER, SCOPE_FAMILY, key=representation, vary=('Accept',))
 @handle_errors
 def get_transactions():
     try:
@@ -661,25 +728,57 @@ def get_transactions():
 
         user_id = int(user_id)
         month = request.args.get('month')
-        query = Transaction.query.filter_by(user_id=user_id)
+        if wants_columnar():
+            # Compact parallel arrays for charting clients
+            columns = (
+                Transaction.id,
+                Transaction.date,
+                Transaction.amount,
+                Transaction.type,
+                Transaction.category_id,
+                Category.name,
+                Transaction.family_member_id,
+                FamilyMember.name
+            )
+        else:
+            # Select plain columns so rows are serialized without loading ORM objects
+            columns = (
+                Transaction.id,
+                Transaction.type,
+                Transaction.amount,
+                Category.name,
+                Transaction.description,
+                Transaction.date,
+                FamilyMember.name,
+                Transaction.is_recurring
+            )
+
+        query = db.session.query(*columns).outerjoin(
+            Category, Transaction.category_id == Category.id
+        ).outerjoin(
+            FamilyMember, Transaction.family_member_id == FamilyMember.id
+        ).filter(Transaction.user_id == user_id)
         
         if month:
             print(f"Filtering by month: {month}")
             query = query.filter(Transaction.date.startswith(month))
         
-        transactions = query.all()
-        print(f"Found {len(transactions)} transactions")
+        if wants_columnar():
+            return columnar_response(transaction_columns(query.order_by(Transaction.date, Transaction.id)))
+
+        rows = query.all()
+        print(f"Found {len(rows)} transactions")
         
         result = [{
-            'id': t.id,
-            'type': t.type,
-            'amount': float(t.amount),
-            'category': t.category,
-            'description': t.description,
-            'date': t.date.strftime('%Y-%m-%d'),
-            'familyMember': t.family_member,
-            'isRecurring': t.is_recurring
-        } for t in transactions]
+            'id': id,
+            'type': type,
+            'amount': amount,
+            'category': category,
+            'description': description,
+            'date': date,
+            'familyMember': family_member,
+            'isRecurring': is_recurring
+        } for id, type, amount, category, description, date, family_member, is_recurring in rows]
         
         print("Successfully returning transactions")
         return jsonify(result)
@@ -687,6 +786,62 @@ def get_transactions():
         print(f"Error in get_transactions: {str(e)}")
         return jsonify({'message': 'Failed to fetch transactions', 'error': str(e)}), 500
 
+@app.route('/api/transactions/search', methods=['GET'])
+@jwt_required()
+@conditional_get(SCOPE_USER, SCOPE_FAMILY)
+@handle_errors
+def search_transactions():
+    """Search transaction descriptions and category names, ranked and paginated"""
+    identity = current_identity()
+    if identity is None:
+        return jsonify({'message': 'User not found'}), 404
+
+    query = request.args.get('q', '')
+    scope = request.args.get('scope', 'user')
+    sort = request.args.get('sort', 'relevance')
+    if scope not in ('user', 'family') or sort not in ('relevance', 'date'):
+        return jsonify({'message': 'Invalid scope or sort'}), 400
+    if scope == 'family' and not identity.family_id:
+        return jsonify({'message': 'You are not part of a family'}), 400
+
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+        results, next_cursor = find_transactions(
+            identity, query, scope=scope, sort=sort, cursor=request.args.get('cursor'), limit=limit
+        )
+    except (ValueError, InvalidCursor) as e:
+        return jsonify({'message': str(e)}), 400
+
+    return jsonify({'results': results, 'next_cursor': next_cursor})
+
+@app.route('/api/transactions/categorize', methods=['POST'])
+@jwt_required()
+@handle_errors
+def categorize_transactions():
+    """Suggest categories for descriptions, e.g. for every row of an import at once"""
+    identity = current_identity()
+    if identity is None:
+        return jsonify({'message': 'User not found'}), 404
+
+    data = request.get_json() or {}
+    descriptions = data.get('descriptions')
+    category_type = data.get('type', 'expense')
+    if not isinstance(descriptions, list) or category_type not in ('income', 'expense'):
+        return jsonify({'message': 'descriptions must be a list and type income or expense'}), 400
+    if len(descriptions) > app.config['CATEGORIZER_MAX_ROWS']:
+        return jsonify({'message': f"At most {app.config['CATEGORIZER_MAX_ROWS']} descriptions per request"}), 400
+
+    try:
+        top = min(max(int(data.get('top', 3)), 1), 10)
+        suggestions = categorizer.suggest(identity, [str(d or '') for d in descriptions], category_type, top)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except CategorizerBusy:
+        return busy_response()
+    except CategorizerUnavailable as e:
+        return jsonify({'message': str(e)}), 503
+    return jsonify({'suggestions': suggestions})
+
 @app.route('/api/transactions', methods=['POST'])
 @jwt_required()
 @handle_errors
@@ -699,74 +854,33 @@ def add_transaction():
         logger.info(f"Adding transaction with data: {data}")
 
         # Validate required fields
-        required_fields = ['type', 'amount', 'category', 'date', 'familyMember']
+        required_fields = ['type', 'amount', 'date', 'familyMember']
         if not all(field in data for field in required_fields):
             return jsonify({'message': 'Missing required fields'}), 400
             
-        # Get the user to check if they have a family
-        user = User.query.get(user_id)
+        # Family membership comes from the token claims / identity cache
+        user = current_identity()
         if not user:
             return jsonify({'message': 'User not found'}), 404
+
+        # No category (or 'auto'): file it where the categorizer is confident it belongs
+        suggestion = None
+        if data.get('category') in (None, '', 'auto'):
+            suggestion = categorizer.assign(user, data.get('description', ''), data['type'])
+            if suggestion is None:
+                return jsonify({'message': 'Missing required fields: no category given and none could be inferred'}), 400
+            data['category'] = suggestion['category_id'] or suggestion['category']
             
-        # Get or create the category
-        category = None
-        if isinstance(data['category'], int) or data['category'].isdigit():
-            # If category is an ID
-            category_id = int(data['category'])
-            category = Category.query.get(category_id)
-            if not category:
-                return jsonify({'message': f'Category with ID {category_id} not found'}), 404
-        else:
-            # If category is a name, find or create it
-            category_name = data['category']
-            category = Category.query.filter_by(
-                name=category_name, 
-                user_id=user_id,
-                type=data['type']
-            ).first()
-            
-            if not category:
-                # Create a new category
-                category = Category(
-                    name=category_name,
-                    type=data['type'],
-                    icon='📊',  # Default icon
-                    color='#94A3B8',  # Default color
-                    description=f'Auto-created {data["type"]} category',
-                    user_id=user_id,
-                    family_id=user.family_id
-                )
-                db.session.add(category)
-                db.session.flush()  # Get the ID without committing
+        # Resolve category and family member through the per-user lookup cache
+        category = resolve_category(user, data['category'], data['type'])
+        if not category:
+            return jsonify({'message': f'Category with ID {data["category"]} not found'}), 404
                 
-        # Get or create the family member
         family_member_id = None
         if user.family_id:
-            if isinstance(data['familyMember'], int) or data['familyMember'].isdigit():
-                # If familyMember is an ID
-                family_member_id = int(data['familyMember'])
-                family_member = FamilyMember.query.get(family_member_id)
-                if not family_member or family_member.family_id != user.family_id:
-                    return jsonify({'message': f'Family member with ID {family_member_id} not found in your family'}), 404
-            else:
-                # If familyMember is a name, find or create it
-                family_member_name = data['familyMember']
-                family_member = FamilyMember.query.filter_by(
-                    name=family_member_name, 
-                    family_id=user.family_id
-                ).first()
-                
-                if not family_member:
-                    # Create a new family member
-                    family_member = FamilyMember(
-                        name=family_member_name,
-                        role='Member',  # Default role
-                        family_id=user.family_id
-                    )
-                    db.session.add(family_member)
-                    db.session.flush()  # Get the ID without committing
-                
-                family_member_id = family_member.id
+            family_member_id = resolve_family_member(user.family_id, data['familyMember'])
+            if family_member_id is None:
+                return jsonify({'message': f'Family member with ID {data["familyMember"]} not found in your family'}), 404
 
         # Create the transaction
         transaction = Transaction(
@@ -776,16 +890,22 @@ def add_transaction():
             amount=float(data['amount']),
             category_id=category.id,
             description=data.get('description', ''),
-            date=datetime.strptime(data['date'], '%Y-%m-%d'),
+            date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
             family_member_id=family_member_id,
             is_recurring=data.get('isRecurring', False)
         )
         db.session.add(transaction)
-        db.session.commit()
-        
-        logger.info(f"Transaction added successfully with ID: {transaction.id}")
+        db.session.flush()  # Assign the ID while attributes are still loaded
 
-        return jsonify({
+        # A recurring transaction starts a monthly rule; the scheduler creates the next ones as they come due
+        if transaction.is_recurring:
+            rule = rule_from_transaction(transaction)
+            db.session.add(rule)
+            db.session.flush()
+            transaction.recurrence_id = rule.id
+
+        # Build the response before commit expires the instance (avoids a reload)
+        result = {
             'message': 'Transaction added',
             'id': transaction.id,
             'transaction': {
@@ -795,12 +915,21 @@ def add_transaction():
                 'category': category.name,
                 'category_id': category.id,
                 'description': transaction.description,
-                'date': transaction.date.strftime('%Y-%m-%d'),
+                'date': transaction.date,
                 'familyMember': data['familyMember'],
                 'family_member_id': family_member_id,
-                'isRecurring': transaction.is_recurring
+                'isRecurring': transaction.is_recurring,
+                'recurrence_id': transaction.recurrence_id,
+                'autoCategorized': suggestion is not None
             }
-        }), 201
+        }
+        if suggestion is not None:
+            result['transaction']['categoryConfidence'] = suggestion['confidence']
+        db.session.commit()
+        
+        logger.info(f"Transaction added successfully with ID: {result['id']}")
+
+        return jsonify(result), 201
     except ValueError as e:
         logger.error(f"ValueError in add_transaction: {str(e)}")
         return jsonify({'message': f'Invalid data: {str(e)}'}), 400
@@ -830,85 +959,45 @@ def update_transaction(id):
         if not transaction:
             return jsonify({'message': 'Transaction not found'}), 404
             
-        # Get the user to check if they have a family
-        user = User.query.get(user_id)
+        # Family membership comes from the token claims / identity cache
+        user = current_identity()
         if not user:
             return jsonify({'message': 'User not found'}), 404
             
-        # Get or create the category
-        category = None
-        if isinstance(data['category'], int) or data['category'].isdigit():
-            # If category is an ID
-            category_id = int(data['category'])
-            category = Category.query.get(category_id)
-            if not category:
-                return jsonify({'message': f'Category with ID {category_id} not found'}), 404
-        else:
-            # If category is a name, find or create it
-            category_name = data['category']
-            category = Category.query.filter_by(
-                name=category_name, 
-                user_id=user_id,
-                type=data['type']
-            ).first()
-            
-            if not category:
-                # Create a new category
-                category = Category(
-                    name=category_name,
-                    type=data['type'],
-                    icon='📊',  # Default icon
-                    color='#94A3B8',  # Default color
-                    description=f'Auto-created {data["type"]} category',
-                    user_id=user_id,
-                    family_id=user.family_id
-                )
-                db.session.add(category)
-                db.session.flush()  # Get the ID without committing
+        # Resolve category and family member through the per-user lookup cache
+        category = resolve_category(user, data['category'], data['type'])
+        if not category:
+            return jsonify({'message': f'Category with ID {data["category"]} not found'}), 404
                 
-        # Get or create the family member
         family_member_id = None
         if user.family_id:
-            if isinstance(data['familyMember'], int) or data['familyMember'].isdigit():
-                # If familyMember is an ID
-                family_member_id = int(data['familyMember'])
-                family_member = FamilyMember.query.get(family_member_id)
-                if not family_member or family_member.family_id != user.family_id:
-                    return jsonify({'message': f'Family member with ID {family_member_id} not found in your family'}), 404
-            else:
-                # If familyMember is a name, find or create it
-                family_member_name = data['familyMember']
-                family_member = FamilyMember.query.filter_by(
-                    name=family_member_name, 
-                    family_id=user.family_id
-                ).first()
-                
-                if not family_member:
-                    # Create a new family member
-                    family_member = FamilyMember(
-                        name=family_member_name,
-                        role='Member',  # Default role
-                        family_id=user.family_id
-                    )
-                    db.session.add(family_member)
-                    db.session.flush()  # Get the ID without committing
-                
-                family_member_id = family_member.id
+            family_member_id = resolve_family_member(user.family_id, data['familyMember'])
+            if family_member_id is None:
+                return jsonify({'message': f'Family member with ID {data["familyMember"]} not found in your family'}), 404
 
         # Update the transaction
         transaction.type = data['type']
         transaction.amount = float(data['amount'])
         transaction.category_id = category.id
         transaction.description = data.get('description', '')
-        transaction.date = datetime.strptime(data['date'], '%Y-%m-%d')
+        transaction.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
         transaction.family_member_id = family_member_id
-        transaction.is_recurring = data.get('isRecurring', False)
-
-        db.session.commit()
-        
-        logger.info(f"Transaction {id} updated successfully")
-
-        return jsonify({
+        # Turning isRecurring on starts a monthly rule; turning it off stops the rule.  Leaving it
+        # out (or unchanged) leaves the rule alone, so editing an instance doesn't stop its series.
+        is_recurring = bool(data.get('isRecurring', transaction.is_recurring))
+        rule = db.session.get(RecurrenceRule, transaction.recurrence_id) if transaction.recurrence_id else None
+        repeats = rule is not None and rule.active
+        if is_recurring and not transaction.is_recurring and not repeats:
+            rule = rule_from_transaction(transaction)
+            db.session.add(rule)
+            db.session.flush()
+            transaction.recurrence_id = rule.id
+        elif repeats and not is_recurring:
+            stop_recurrence(rule, keep=transaction.id)
+        transaction.is_recurring = is_recurring
+
+        # Build the response before commit expires the instance (avoids a reload)
+        result = {
             'message': 'Transaction updated',
             'transaction': {
                 'id': transaction.id,
@@ -917,12 +1006,18 @@ def update_transaction(id):
                 'category': category.name,
                 'category_id': category.id,
                 'description': transaction.description,
-                'date': transaction.date.strftime('%Y-%m-%d'),
+                'date': transaction.date,
                 'familyMember': data['familyMember'],
                 'family_member_id': family_member_id,
-                'isRecurring': transaction.is_recurring
+                'isRecurring': transaction.is_recurring,
+                'recurrence_id': transaction.recurrence_id
             }
-        }), 200
+        }
+        db.session.commit()
+        
+        logger.info(f"Transaction {id} updated successfully")
+
+        return jsonify(result), 200
     except ValueError as e:
         logger.error(f"ValueError in update_transaction: {str(e)}")
         return jsonify({'message': f'Invalid data: {str(e)}'}), 400
@@ -953,6 +1048,7 @@ def delete_transaction(id):
 # Dashboard Routes
 @app.route('/api/dashboard', methods=['GET'])
 @jwt_required()
+@conditional_get(SCOPE_USER)
 @handle_errors
 def get_dashboard():
     try:
@@ -1012,94 +1108,6 @@ def get_family_dashboard():
         print(f"Error in family dashboard: {str(e)}")
         return jsonify({'message': 'Failed to fetch family dashboard data', 'error': str(e)}), 500
 
-# Monthly Plan Routes
-@app.route('/api/monthly-plans/<month>', methods=['GET'])
-@jwt_required()
-@handle_errors
-def get_monthly_plan(month):
-    try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user.family_id:
-            logger.error(f"User {user_id} does not belong to a family")
-            return jsonify({'message': 'User does not belong to a family'}), 400
-            
-        logger.info(f"Fetching monthly plan for user {user_id}, family {user.family_id}, month {month}")
-        
-        plan = MonthlyPlan.query.filter_by(
-            month=month,
-            family_id=user.family_id
-        ).first()
-        
-        if not plan:
-            logger.info(f"No plan found for month {month}, creating default response")
-            return jsonify({
-                'month': month,
-                'expectedIncome': [],
-                'expectedExpenses': [],
-                'notes': ''
-            })
-
-        logger.info(f"Successfully retrieved plan for month {month}")
-        return jsonify({
-            'month': plan.month,
-            'expectedIncome': plan.expected_income,
-            'expectedExpenses': plan.expected_expenses,
-            'notes': plan.notes
-        })
-    except Exception as e:
-        logger.error(f"Error in get_monthly_plan: {str(e)}", exc_info=True)
-        return jsonify({'message': 'Failed to fetch monthly plan', 'error': str(e)}), 500
-
-@app.route('/api/monthly-plans/<month>', methods=['PUT'])
-@jwt_required()
-@handle_errors
-def save_monthly_plan(month):
-    try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        data = request.get_json()
-        
-        if not user.family_id:
-            logger.error(f"User {user_id} does not belong to a family")
-            return jsonify({'message': 'User does not belong to a family'}), 400
-            
-        if not data:
-            logger.error("No data provided in request")
-            return jsonify({'message': 'No data provided'}), 400
-
-        logger.info(f"Saving monthly plan for user {user_id}, family {user.family_id}, month {month}")
-        
-        plan = MonthlyPlan.query.filter_by(
-            month=month,
-            family_id=user.family_id
-        ).first()
-        
-        if not plan:
-            logger.info("Creating new monthly plan")
-            plan = MonthlyPlan(
-                month=month,
-                family_id=user.family_id,
-                expected_income=data.get('expectedIncome', []),
-                expected_expenses=data.get('expectedExpenses', []),
-                notes=data.get('notes', '')
-            )
-            db.session.add(plan)
-        else:
-            logger.info("Updating existing monthly plan")
-            plan.expected_income = data.get('expectedIncome', plan.expected_income)
-            plan.expected_expenses = data.get('expectedExpenses', plan.expected_expenses)
-            plan.notes = data.get('notes', plan.notes)
-
-        db.session.commit()
-        logger.info("Successfully saved monthly plan")
-        return jsonify({'message': 'Plan saved successfully'})
-    except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error in save_monthly_plan: {str(e)}", exc_info=True)
-        return jsonify({'message': 'Failed to save monthly plan', 'error': str(e)}), 500
-
 # Error Handlers
 @app.errorhandler(404)
 def not_found_error(error):
@@ -1113,6 +1121,12 @@ def internal_error(error):
 # Initialize Database
 with app.app_context():
     db.create_all()
+ensure_columns(app)
+ensure_indexes(app)
+init_user_search(app)
+init_transaction_search(app)
+init_spending_sketches(app)
+init_daily_balances(app)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Balance-at-date series and back-dated write cost.
+
+Fills a throwaway SQLite database with one user's daily transactions over
+ten years and backfills ``daily_balance`` from them.  It then times:
+
+- ``balance_series`` for a month of days, a year of days, ten years of
+  days and ten years of months, next to summing the transactions up to
+  every point as the naive approach would;
+- applying a transaction dated today, a year back and ten years back, which
+  rewrites the running balance of every later day.
+
+Usage:
+    python benchmarks/bench_balance.py [years] [repeats]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import config  # noqa: E402
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_balance.db')
+config.Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
+
+from sqlalchemy import case, func, select  # noqa: E402
+
+from analytics import balance  # noqa: E402
+from app import app  # noqa: E402
+from models import db, Category, Transaction, User  # noqa: E402
+
+Identity = namedtuple('Identity', ['user_id', 'family_id'])
+
+
+def load(years, rng):
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [{'email': 'user@example.com', 'password': b'x', 'name': 'User'}])
+        db.session.execute(Category.__table__.insert(), [
+            {'name': 'Salary', 'type': 'income', 'icon': '-', 'color': '-', 'user_id': 1},
+            {'name': 'Groceries', 'type': 'expense', 'icon': '-', 'color': '-', 'user_id': 1}
+        ])
+        start = date.today() - timedelta(days=365 * years)
+        rows = []
+        for offset in range(365 * years):
+            day = start + timedelta(days=offset)
+            for _ in range(rng.randint(1, 4)):
+                rows.append({'user_id': 1, 'type': 'expense', 'amount': round(rng.uniform(5, 120), 2),
+                             'category_id': 2, 'date': day, 'description': 'groceries'})
+            if day.day == 1:
+                rows.append({'user_id': 1, 'type': 'income', 'amount': 4000.0, 'category_id': 1,
+                             'date': day, 'description': 'salary'})
+        db.session.execute(Transaction.__table__.insert(), rows)
+        db.session.commit()
+        with db.engine.begin() as connection:
+            balance._backfill(connection)
+        return start, len(rows)
+
+
+def naive(points):
+    signed = case((Transaction.type == 'income', Transaction.amount), else_=-Transaction.amount)
+    return [db.session.execute(select(func.sum(signed)).where(Transaction.user_id == 1, Transaction.date <= point)).scalar()
+            for point in points]
+
+
+def timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats * 1000, result
+
+
+def main():
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    start, count = load(years, random.Random(11))
+    end = date.today()
+    identity = Identity(1, None)
+    print(f'{count} transactions over {years} years')
+
+    with app.app_context():
+        for label, first, step in (('30 days', end - timedelta(days=29), 'day'),
+                                   ('1 year of days', end - timedelta(days=364), 'day'),
+                                   (f'{years} years of days', start, 'day'),
+                                   (f'{years} years of months', start, 'month')):
+            ms, series = timed(lambda: balance.balance_series(identity, 'user', first, end, step), repeats)
+            points = balance.series_points(first, end, step)
+            naive_ms, expected = timed(lambda: naive(points), 1)
+            assert all(abs(a - (b or 0)) < 0.01 for a, b in zip(series['balances'], expected))
+            print(f'{label:>20}: {len(points):>5} points in {ms:7.1f} ms (naive sums {naive_ms:8.1f} ms)')
+
+        for label, day in (('today', end), ('1 year back', end - timedelta(days=365)),
+                           (f'{years} years back', start)):
+            ms, _ = timed(lambda: balance._apply_delta(db.session.connection(), ('user', 1, day), 1.0), repeats)
+            db.session.rollback()
+            print(f'{label:>20}: back-dated write {ms:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Transaction categorizer throughput.
+
+Trains ai.categorizer.CategorizerModel on a synthetic ledger of merchant
+descriptions (store numbers, card suffixes and casing varied as in bank
+exports).  It then reports:
+
+- bulk rows per second for an import of unseen rows, cold and again once
+  the memo cache is warm;
+- latency of single-description requests from concurrent threads, which
+  the micro-batcher merges into shared forward passes.
+
+Needs torch.  ``--onnx PATH`` also exports the trained model.
+
+Usage:
+    python benchmarks/bench_categorizer.py [rows] [threads] [--onnx PATH]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+import numpy as np  # noqa: E402
+
+from ai import categorizer as categorizer_module  # noqa: E402
+from ai.categorizer import Categorizer, CategorizerModel  # noqa: E402
+
+MERCHANTS = {
+    'Groceries': ['whole foods market', 'trader joes', 'safeway', 'kroger', 'aldi', 'costco wholesale'],
+    'Dining': ['starbucks', 'mcdonalds', 'chipotle', 'dominos pizza', 'subway', 'panera bread'],
+    'Transportation': ['shell oil', 'chevron', 'uber trip', 'lyft ride', 'exxonmobil', 'metro transit'],
+    'Utilities': ['pg e electric', 'comcast cable', 'city water dept', 'verizon wireless', 'at t bill'],
+    'Entertainment': ['netflix com', 'spotify usa', 'amc theatres', 'steam games', 'hulu'],
+    'Shopping': ['amazon mktp', 'target', 'walmart', 'best buy', 'ikea', 'etsy'],
+    'Healthcare': ['cvs pharmacy', 'walgreens', 'kaiser permanente', 'dental care'],
+    'Housing': ['rent payment', 'mortgage', 'hoa dues'],
+}
+
+
+def synthetic_description(rng, merchant):
+    name = merchant.upper() if rng.random() < 0.5 else merchant.title()
+    return f'{name} #{rng.integers(100, 9999)} CARD {rng.integers(1000, 9999)}'
+
+
+def synthetic_ledger(rows, seed=3):
+    rng = np.random.default_rng(seed)
+    names = list(MERCHANTS)
+    samples = []
+    for _ in range(rows):
+        category = names[rng.integers(len(names))]
+        merchants = MERCHANTS[category]
+        samples.append((synthetic_description(rng, merchants[rng.integers(len(merchants))]), 'expense', category, 1))
+    return samples
+
+
+class Identity:
+    user_id = None
+    family_id = None
+
+
+class NoCategories:
+    """A user without categories of their own, so every label can be suggested."""
+    by_name = {}
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    rows = int(args[0]) if args else 5000
+    threads = int(args[1]) if len(args) > 1 else 16
+    if categorizer_module.torch is None:
+        sys.exit('torch is not installed')
+    categorizer_module._category_map = lambda user_id: NoCategories
+
+    start = time.perf_counter()
+    model = CategorizerModel.train(synthetic_ledger(20000))
+    print(f'trained on 20000 rows, {len(model.labels)} categories: {time.perf_counter() - start:.1f} s')
+
+    categorizer = Categorizer(os.path.join(tempfile.mkdtemp(), 'categorizer.pt'))
+    categorizer.install(model)
+    imported = [description for description, _, _, _ in synthetic_ledger(rows, seed=11)]
+    for label in ('cold', 'memo'):
+        start = time.perf_counter()
+        categorizer.suggest(Identity, imported, 'expense')
+        elapsed = time.perf_counter() - start
+        print(f'bulk {rows} rows ({label}): {rows / elapsed:,.0f} rows/s')
+
+    categorizer.memo.clear()
+    latencies = []
+
+    def client(seed):
+        rng = np.random.default_rng(seed)
+        for _ in range(50):
+            # Digits are dropped by normalization, so random letters keep requests off the memo cache
+            suffix = ''.join(chr(97 + letter) for letter in rng.integers(0, 26, 8))
+            description = f'{MERCHANTS["Dining"][rng.integers(6)]} {suffix}'
+            started = time.perf_counter()
+            categorizer.suggest(Identity, [description], 'expense')
+            latencies.append(time.perf_counter() - started)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=client, args=(seed,)) for seed in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    print(f'{threads} threads x 50 requests: {len(latencies) / elapsed:,.0f} req/s, '
+          f'p50 {np.percentile(latencies, 50) * 1000:.1f} ms, p99 {np.percentile(latencies, 99) * 1000:.1f} ms')
+
+    if '--onnx' in sys.argv:
+        path = sys.argv[sys.argv.index('--onnx') + 1]
+        model.export_onnx(path)
+        print(f'exported {path}')
+
+
+if __name__ == '__main__':
+    main()
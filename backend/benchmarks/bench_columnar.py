@@ -0,0 +1,102 @@
+"""
+Row vs columnar payload benchmark for transaction lists.
+
+Builds both layouts from the same result tuples the endpoint reads and
+reports encoded size (raw and gzip) and parse time.  JSON.parse in browsers
+scales similarly to json.loads here: it is dominated by object/key creation.
+
+Usage:
+    python benchmarks/bench_columnar.py [rows]
+"""
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.columnar import transaction_columns  # noqa: E402
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+CATEGORIES = [(i, name) for i, name in enumerate(
+    ['Groceries', 'Housing', 'Utilities', 'Dining', 'Transportation', 'Salary', 'Shopping'], start=1)]
+MEMBERS = [(1, 'Alex'), (2, 'Sam'), (None, None)]
+
+
+def make_rows(n):
+    rng = random.Random(42)
+    start = date(2020, 1, 1)
+    rows = []
+    for i in range(n):
+        category_id, category_name = rng.choice(CATEGORIES)
+        member_id, member_name = rng.choice(MEMBERS)
+        rows.append((i + 1, start + timedelta(days=i % 1800), round(rng.uniform(1, 500), 2),
+                     'income' if i % 10 == 0 else 'expense',
+                     category_id, category_name, member_id, member_name))
+    return rows
+
+
+def row_layout(rows):
+    return [{
+        'id': row_id,
+        'date': row_date,
+        'amount': amount,
+        'type': row_type,
+        'category': category_name,
+        'familyMember': member_name
+    } for row_id, row_date, amount, row_type, _, category_name, _, member_name in rows]
+
+
+def timed(fn, *args, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def report(name, build_seconds, body, parse):
+    parse_seconds, _ = timed(parse, body)
+    print(f'{name:<18} build {build_seconds * 1000:7.1f} ms  raw {len(body) / 1024:8.1f} KiB  '
+          f'gzip {len(gzip.compress(body, 6)) / 1024:7.1f} KiB  parse {parse_seconds * 1000:7.1f} ms')
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rows = make_rows(n)
+    print(f'Rows: {n}')
+
+    seconds, body = timed(lambda r: orjson.dumps(row_layout(r)), rows)
+    report('rows (json)', seconds, body, json.loads)
+
+    seconds, body = timed(lambda r: orjson.dumps(transaction_columns(r)), rows)
+    report('columnar (json)', seconds, body, json.loads)
+
+    if pa is not None:
+        from utils.columnar import _arrow_column
+        payload = transaction_columns(rows)
+
+        def to_arrow(p):
+            table = pa.table({k: _arrow_column(k, v, p['dictionaries']) for k, v in p['columns'].items()})
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+
+        seconds, body = timed(to_arrow, payload)
+        report('columnar (arrow)', seconds, body, lambda b: pa.ipc.open_stream(b).read_all())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Mixed read/write throughput against SQLite with several worker threads.
+
+Compares SQLite's defaults (rollback journal, synchronous=FULL) with the
+pragmas from Config.SQLITE_PRAGMAS (WAL, busy_timeout, synchronous=NORMAL,
+mmap and cache sizing).  Each worker runs a 80/20 mix of dashboard-style
+aggregate reads and single-row transaction inserts.
+
+Usage:
+    python benchmarks/bench_db_concurrency.py [workers] [seconds]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import create_engine, event, func, insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from config import Config  # noqa: E402
+from models import db, Transaction  # noqa: E402
+from utils.database import apply_sqlite_pragmas  # noqa: E402
+
+USERS = 50
+SEED_ROWS = 20_000
+WRITE_RATIO = 0.2
+
+
+def make_engine(path, pragmas):
+    engine = create_engine(f'sqlite:///{path}', pool_size=32, max_overflow=0)
+    if pragmas:
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, pragmas)
+    return engine
+
+
+def seed(engine):
+    db.metadata.create_all(engine, tables=[Transaction.__table__])
+    rng = random.Random(1)
+    rows = [{
+        'user_id': rng.randint(1, USERS),
+        'type': 'expense',
+        'amount': rng.uniform(1, 200),
+        'category_id': 1,
+        'date': date(2025, 1, 1 + i % 28)
+    } for i in range(SEED_ROWS)]
+    with engine.begin() as conn:
+        conn.execute(insert(Transaction.__table__), rows)
+        conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS bench_ix_transaction_user ON "transaction" (user_id)')
+
+
+def worker(engine, deadline, stats, seed_value):
+    rng = random.Random(seed_value)
+    table = Transaction.__table__
+    reads = writes = errors = 0
+    while time.perf_counter() < deadline:
+        user_id = rng.randint(1, USERS)
+        try:
+            if rng.random() < WRITE_RATIO:
+                with engine.begin() as conn:
+                    conn.execute(insert(table).values(
+                        user_id=user_id, type='expense', amount=rng.uniform(1, 200),
+                        category_id=1, date=date(2025, 2, 1)
+                    ))
+                writes += 1
+            else:
+                with engine.connect() as conn:
+                    conn.execute(
+                        select(func.sum(table.c.amount)).where(table.c.user_id == user_id)
+                    ).scalar()
+                reads += 1
+        except OperationalError:
+            errors += 1
+    stats.append((reads, writes, errors))
+
+
+def run(label, pragmas, workers, seconds):
+    path = os.path.join(tempfile.mkdtemp(), 'bench_concurrency.db')
+    engine = make_engine(path, pragmas)
+    seed(engine)
+
+    stats = []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=worker, args=(engine, deadline, stats, i)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    reads = sum(s[0] for s in stats)
+    writes = sum(s[1] for s in stats)
+    errors = sum(s[2] for s in stats)
+    print(f'{label:<10} {reads / seconds:9.0f} reads/s  {writes / seconds:8.0f} writes/s  {errors} lock errors')
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f'Workers: {workers}, {seconds:.0f}s per run, {int(WRITE_RATIO * 100)}% writes')
+    run('default', {}, workers, seconds)
+    run('tuned', Config.SQLITE_PRAGMAS, workers, seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Family budget optimizer latency.
+
+Builds ai.optimizer.BudgetModel for synthetic families, from a few members
+and a dozen categories up to dozens of members and hundreds of categories.
+It then times what-if solves for a shrinking, flat and growing total budget.
+The model is built once per family as load_budget_model caches it, so the
+solves are what repeated what-if calls pay for.
+
+Usage:
+    python benchmarks/bench_family_optimizer.py [repeats]
+"""
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+import numpy as np  # noqa: E402
+
+from ai.config import NEEDS_CATEGORIES, SAVINGS_CATEGORIES, WANTS_CATEGORIES  # noqa: E402
+from ai.optimizer import BudgetModel  # noqa: E402
+
+
+def synthetic_family(members, categories, density=0.3, seed=7):
+    rng = np.random.default_rng(seed)
+    named = NEEDS_CATEGORIES + WANTS_CATEGORIES + SAVINGS_CATEGORIES[:1]
+    names = (named + [f'Category {i}' for i in range(categories)])[:max(categories, len(named))]
+    spend = rng.lognormal(4, 1, (members, len(names))) * (rng.random((members, len(names))) < density)
+    shared = rng.lognormal(4, 1, len(names)) * (rng.random(len(names)) < 0.1)
+    return BudgetModel(range(members), names, spend, shared), rng.choice([0.8, 1.0, 1.2], members)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for members, categories in ((4, 12), (12, 50), (30, 200), (50, 300)):
+        start = time.perf_counter()
+        model, weights = synthetic_family(members, categories)
+        built = (time.perf_counter() - start) * 1000
+        history = model.anchors(weights).sum()
+        minimums = np.zeros(len(model.categories))
+        timings = []
+        for scale in (0.8, 1.0, 1.3):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                model.solve(history * scale, weights, minimums)
+            timings.append((time.perf_counter() - start) / repeats * 1000)
+        print(f'{members:>3} members x {len(model.categories):>3} categories: build {built:5.1f} ms, '
+              + ', '.join(f'{scale:.0%} {ms:5.1f} ms' for scale, ms in zip((0.8, 1.0, 1.3), timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Login throughput and API latency under a concurrent login burst.
+
+Runs the real Flask app against a throwaway SQLite database.  ``clients``
+threads log in repeatedly while one more thread keeps calling a cheap
+authenticated endpoint (GET /api/categories).  This is done twice: with
+bcrypt running on every request thread (one hashing worker per client,
+i.e. the old inline behaviour) and with the bounded pool from
+Config.PASSWORD_HASH_WORKERS.  Reports logins per second, rejected (503)
+logins and the latency of the cheap endpoint.
+
+Usage:
+    python benchmarks/bench_login.py [clients] [seconds]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import config  # noqa: E402
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_login.db')
+config.Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
+
+import app as app_module  # noqa: E402
+from app import app  # noqa: E402
+from utils.passwords import PasswordHasher  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+def setup(clients):
+    client = app.test_client()
+    for i in range(clients):
+        client.post('/api/register', json={
+            'email': f'bench{i}@example.com', 'password': PASSWORD, 'name': f'Bench {i}'
+        })
+    return client.post('/api/login', json={'email': 'bench0@example.com', 'password': PASSWORD}).get_json()['token']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def run(hasher, clients, seconds, token):
+    app_module.password_hasher = hasher
+    stop = threading.Event()
+    logins, busy, latencies = [0], [0], []
+    lock = threading.Lock()
+
+    def login_loop(i):
+        client = app.test_client()
+        body = {'email': f'bench{i}@example.com', 'password': PASSWORD}
+        while not stop.is_set():
+            status = client.post('/api/login', json=body).status_code
+            with lock:
+                if status == 200:
+                    logins[0] += 1
+                elif status == 503:
+                    busy[0] += 1
+
+    def read_loop():
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get('/api/categories', headers=headers)
+            latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(clients)]
+    threads.append(threading.Thread(target=read_loop))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return logins[0] / seconds, busy[0], percentile(latencies, 0.5), percentile(latencies, 0.95)
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rounds = config.Config.BCRYPT_LOG_ROUNDS
+    token = setup(clients)
+
+    print(f'{clients} login clients, {seconds:g}s, bcrypt cost {rounds}, {os.cpu_count()} CPUs')
+    modes = [
+        ('inline (1 hash per client)', PasswordHasher(rounds, workers=clients, max_pending=clients)),
+        (f'pool ({config.Config.PASSWORD_HASH_WORKERS} workers)', app_module.password_hasher),
+    ]
+    for name, hasher in modes:
+        rate, busy, p50, p95 = run(hasher, clients, seconds, token)
+        print(f'{name:28s} {rate:7.1f} logins/s  {busy:5d} busy  '
+              f'categories p50 {p50 * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
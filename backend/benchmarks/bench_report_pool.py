@@ -0,0 +1,85 @@
+"""
+AI report throughput: analytics kernels inline vs on the process pool.
+
+Builds a synthetic transaction history as compact arrays (what
+ai.reports.build_ai_report hands to the pool) and has ``clients`` threads
+compute reports back to back, one spending and one prediction kernel per
+report, as the report job threads do.  This runs once with the kernels
+inline on the calling threads and once per pool size from 1 up to the CPU
+count.  Reports per second should grow with the pool size until it reaches
+the number of cores.
+
+Usage:
+    python benchmarks/bench_report_pool.py [transactions] [clients] [seconds]
+"""
+import os
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+import numpy as np  # noqa: E402
+
+from ai.config import MIN_MONTHS_FOR_PREDICTION, PREDICTION_MONTHS_AHEAD, UNUSUAL_TRANSACTION_THRESHOLD  # noqa: E402
+from ai.kernels import AnalyticsPool, TransactionArrays  # noqa: E402
+
+
+def synthetic_history(transactions, categories=40, months=36, seed=7):
+    rng = np.random.default_rng(seed)
+    return TransactionArrays(
+        rng.lognormal(3.5, 1.0, transactions),
+        rng.integers(0, categories, transactions, dtype=np.int32),
+        np.sort(rng.integers(2023 * 12, 2023 * 12 + months, transactions, dtype=np.int32)),
+        [f'Category {i}' for i in range(categories)]
+    )
+
+
+def report(pool, arrays):
+    pool.run('spending', arrays, threshold=UNUSUAL_TRANSACTION_THRESHOLD)
+    pool.run('prediction', arrays, months_ahead=PREDICTION_MONTHS_AHEAD, min_months=MIN_MONTHS_FOR_PREDICTION)
+
+
+def run(pool, arrays, clients, seconds):
+    pool.warm()
+    report(pool, arrays)
+    stop = threading.Event()
+    done = [0] * clients
+
+    def loop(i):
+        while not stop.is_set():
+            report(pool, arrays)
+            done[i] += 1
+
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return sum(done) / elapsed
+
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    arrays = synthetic_history(transactions)
+    cores = os.cpu_count() or 1
+
+    print(f'{transactions} transactions per report, {clients} concurrent clients, {cores} CPU(s)')
+    baseline = run(AnalyticsPool(0), arrays, clients, seconds)
+    print(f'{"inline":>10}: {baseline:8.2f} reports/s')
+    for processes in sorted({1, 2, 4, cores} & set(range(1, cores + 1))):
+        throughput = run(AnalyticsPool(processes), arrays, clients, seconds)
+        print(f'{processes:>3} procs : {throughput:8.2f} reports/s  ({throughput / baseline:.2f}x inline)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Savings simulation latency per request.
+
+Runs ai.simulation.simulate_savings on a synthetic two-year monthly net cash
+flow history for target dates from one month to ten years out, and reports
+the paths simulated and the mean time per call.  Every horizon should stay
+well under 100 ms: paths run as one array, and far-off targets are capped
+by SAVINGS_SIMULATION_MAX_CELLS.
+
+Usage:
+    python benchmarks/bench_savings_simulation.py [repeats]
+"""
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+import numpy as np  # noqa: E402
+
+from ai.simulation import simulate_savings  # noqa: E402
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    history = np.random.default_rng(7).normal(600, 900, 24)
+    goal = 20_000
+
+    for months in (1, 6, 12, 24, 36, 60, 120):
+        result = simulate_savings(history, 1_000, goal, months)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            simulate_savings(history, 1_000, goal, months)
+        elapsed = (time.perf_counter() - start) / repeats * 1000
+        print(f'{months:>4} months: {result["paths"]:>7} paths  {elapsed:7.1f} ms'
+              f'  P(goal) = {result["probability_of_reaching_goal"]:.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Serialization and wire-size benchmark for a 50k-row transaction payload.
+
+Compares the previous path (per-row strftime + Flask's stdlib JSON provider)
+with native dates serialized by orjson, then reports compressed sizes.
+
+Usage:
+    python benchmarks/bench_serialization.py [rows]
+"""
+import gzip
+import json
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import orjson
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATEGORIES = ['Groceries', 'Housing', 'Utilities', 'Dining', 'Transportation', 'Salary', 'Shopping']
+
+
+def make_rows(n):
+    rng = random.Random(42)
+    start = date(2020, 1, 1)
+    created = datetime(2024, 1, 1, 9, 30, 0)
+    return [{
+        'id': i,
+        'type': 'income' if i % 10 == 0 else 'expense',
+        'amount': round(rng.uniform(1, 500), 2),
+        'category': rng.choice(CATEGORIES),
+        'description': f'Purchase #{i}',
+        'date': start + timedelta(days=i % 1800),
+        'familyMember': None,
+        'isRecurring': False,
+        'created_at': created + timedelta(minutes=i)
+    } for i in range(n)]
+
+
+def legacy_serialize(rows):
+    """Previous behaviour: strftime every date field, then stdlib json."""
+    formatted = [{
+        **row,
+        'date': row['date'].strftime('%Y-%m-%d'),
+        'created_at': row['created_at'].strftime('%Y-%m-%d %H:%M:%S')
+    } for row in rows]
+    return json.dumps(formatted, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def orjson_serialize(rows):
+    return orjson.dumps(rows, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_OMIT_MICROSECONDS)
+
+
+def timed(fn, *args, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rows = make_rows(n)
+    print(f'Rows: {n}')
+
+    for name, fn in (('stdlib json + strftime', legacy_serialize), ('orjson native dates', orjson_serialize)):
+        seconds, body = timed(fn, rows)
+        gz_seconds, gz = timed(gzip.compress, body, 6, repeat=3)
+        line = f'{name:<24} {seconds * 1000:8.1f} ms  raw {len(body) / 1024:8.1f} KiB  gzip {len(gz) / 1024:7.1f} KiB ({gz_seconds * 1000:.1f} ms)'
+        if brotli is not None:
+            br_seconds, br = timed(lambda b: brotli.compress(b, quality=4), body, repeat=3)
+            line += f'  br {len(br) / 1024:7.1f} KiB ({br_seconds * 1000:.1f} ms)'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
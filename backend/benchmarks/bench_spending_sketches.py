@@ -0,0 +1,77 @@
+"""
+Spending sketch accuracy and cost.
+
+Sketches synthetic lognormal amounts with analytics.sketches and compares
+them with exact numbers from the full history:
+
+- percentile error of the t-digest built in one pass and one transaction
+  at a time (as the flush hook does);
+- the cost of adding one transaction to a stored sketch;
+- merging a family's sketches and summarizing them, against
+  ``np.percentile`` over all of the rows.
+
+Usage:
+    python benchmarks/bench_spending_sketches.py [rows] [members] [categories]
+"""
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+import numpy as np  # noqa: E402
+
+from analytics.sketches import Sketch  # noqa: E402
+
+PERCENTILES = (50, 90, 99)
+
+
+def describe(label, sketch, amounts):
+    estimated = sketch.summary(PERCENTILES)['quantiles']
+    exact = np.percentile(amounts, PERCENTILES)
+    errors = ', '.join(f'p{p} {estimated[f"p{p}"]:8.2f} vs {value:8.2f}' for p, value in zip(PERCENTILES, exact))
+    print(f'{label:<12} {len(sketch.means):>3} centroids, {len(sketch.values()["centroids"]):>4} bytes: {errors}')
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    members = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    categories = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    rng = np.random.default_rng(5)
+    amounts = rng.lognormal(3.5, 1.1, rows).round(2)
+    merchants = [f'merchant {chr(97 + i % 26)}{chr(97 + i // 26 % 26)}' for i in rng.zipf(1.5, rows) % 676]
+
+    describe('one pass', Sketch.from_transactions(amounts, merchants), amounts)
+
+    incremental = Sketch()
+    start = time.perf_counter()
+    writes = min(rows, 20000)
+    for amount, merchant in zip(amounts[:writes], merchants[:writes]):
+        incremental.add([amount], [merchant])
+    per_write = (time.perf_counter() - start) / writes * 1e6
+    describe('incremental', incremental, amounts[:writes])
+    print(f'add one transaction: {per_write:.0f} us')
+
+    keys = rng.integers(0, members * categories, rows)
+    sketches = [Sketch.from_transactions(amounts[keys == key], [merchants[i] for i in np.flatnonzero(keys == key)])
+                for key in range(members * categories)]
+    start = time.perf_counter()
+    by_category = [Sketch.merge(sketches[category::categories]) for category in range(categories)]
+    overall = Sketch.merge(by_category)
+    summaries = [sketch.summary(PERCENTILES) for sketch in by_category + [overall]]
+    merged_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for category in range(categories):
+        np.percentile(amounts[keys % categories == category], PERCENTILES)
+    np.percentile(amounts, PERCENTILES)
+    exact_ms = (time.perf_counter() - start) * 1000
+    describe('family', overall, amounts)
+    print(f'family view ({members} members x {categories} categories, {len(summaries)} summaries): '
+          f'{merged_ms:.1f} ms from sketches, {exact_ms:.1f} ms from {rows} loaded rows')
+    print('top merchants:', overall.summary(top=3)['top_merchants'])
+
+
+if __name__ == '__main__':
+    main()
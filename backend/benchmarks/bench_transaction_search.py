@@ -0,0 +1,127 @@
+"""
+Latency of GET /api/transactions/search style queries.
+
+Fills a throwaway SQLite database with synthetic transactions spread over
+many users and indexes them, then runs random
+one- and two-word queries for random users through an ILIKE scan over the
+user's rows and through ``find_transactions`` (relevance and date order).
+Reports p50 and p99 latency for the first page.
+
+Usage:
+    python benchmarks/bench_transaction_search.py [transactions] [users] [queries]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import config  # noqa: E402
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_transaction_search.db')
+config.Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
+
+from app import app  # noqa: E402
+from models import db, User, Category, Transaction  # noqa: E402
+from utils import transaction_search as search  # noqa: E402
+
+Identity = namedtuple('Identity', ['user_id', 'family_id', 'is_family_admin'])
+
+CATEGORIES = ['Groceries', 'Dining', 'Housing', 'Utilities', 'Transportation', 'Entertainment']
+MERCHANTS = ['starbucks', 'walmart', 'target', 'uber', 'lyft', 'amazon', 'netflix', 'spotify',
+             'shell', 'costco', 'whole foods', 'chipotle', 'comcast', 'verizon', 'ikea', 'airbnb']
+WORDS = ['coffee', 'lunch', 'dinner', 'ride', 'weekly', 'monthly', 'refill', 'gift', 'order',
+         'subscription', 'snacks', 'downtown', 'airport', 'birthday', 'repair', 'bill']
+
+
+def load(transactions, users, rng):
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'email': f'user{i}@example.com', 'password': b'x', 'name': f'User {i}'} for i in range(users)
+        ])
+        db.session.execute(Category.__table__.insert(), [
+            {'name': name, 'type': 'expense', 'icon': '-', 'color': '-', 'user_id': user_id}
+            for user_id in range(1, users + 1) for name in CATEGORIES
+        ])
+        db.session.commit()
+
+        start = date(2022, 1, 1)
+        batch = 20_000
+        for offset in range(0, transactions, batch):
+            rows = []
+            for _ in range(min(batch, transactions - offset)):
+                user_id = rng.randint(1, users)
+                rows.append({
+                    'user_id': user_id,
+                    'type': 'expense',
+                    'amount': round(rng.uniform(1, 300), 2),
+                    'category_id': (user_id - 1) * len(CATEGORIES) + rng.randint(1, len(CATEGORIES)),
+                    'description': f'{rng.choice(MERCHANTS)} {rng.choice(WORDS)} {rng.choice(WORDS)}',
+                    'date': start + timedelta(days=rng.randint(0, 1000))
+                })
+            db.session.execute(Transaction.__table__.insert(), rows)
+            db.session.commit()
+
+        # Bulk inserts bypass the ORM flush hook; index them like a fresh install would
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DELETE FROM transaction_search')
+            search._index_all(connection)
+        print(f'indexed in {time.perf_counter() - started:.1f}s')
+
+
+def random_query(rng):
+    terms = [rng.choice(MERCHANTS + WORDS + CATEGORIES).split()[0]]
+    if rng.random() < 0.4:
+        terms.append(rng.choice(WORDS)[:rng.randint(3, 6)])
+    return ' '.join(terms)
+
+
+def measure(fn, cases):
+    timings = []
+    with app.app_context():
+        for identity, query in cases:
+            started = time.perf_counter()
+            fn(identity, query)
+            timings.append(time.perf_counter() - started)
+            db.session.remove()
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.99)] * 1000
+
+
+def main():
+    transactions = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    rng = random.Random(11)
+
+    started = time.perf_counter()
+    load(transactions, users, rng)
+    print(f'{transactions} transactions for {users} users loaded '
+          f'in {time.perf_counter() - started:.1f}s')
+
+    cases = [(Identity(rng.randint(1, users), None, False), random_query(rng)) for _ in range(count)]
+
+    def scan(identity, query):
+        return search._scan_transactions(Transaction.user_id == identity.user_id, search.words(query), None, 21)
+
+    def relevance(identity, query):
+        return search.find_transactions(identity, query, sort=search.SORT_RELEVANCE)
+
+    def by_date(identity, query):
+        return search.find_transactions(identity, query, sort=search.SORT_DATE)
+
+    for name, fn in (('ilike scan', scan), ('fts relevance', relevance), ('fts by date', by_date)):
+        p50, p99 = measure(fn, cases)
+        print(f'{name:14s} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
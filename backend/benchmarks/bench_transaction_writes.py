@@ -0,0 +1,105 @@
+"""
+Sustained transaction insert benchmark for POST /api/transactions.
+
+Runs the real Flask app against a throwaway SQLite database and reports
+inserts per second and SQL statements per insert, first with the lookup and
+identity caches cleared before every request (the old uncached path), then
+with warm caches.
+
+Usage:
+    python benchmarks/bench_transaction_writes.py [inserts]
+"""
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import config  # noqa: E402
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_writes.db')
+config.Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
+
+from sqlalchemy import event  # noqa: E402
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from app import app  # noqa: E402
+from models import db, User, Category  # noqa: E402
+from utils.identity import identity_cache  # noqa: E402
+from utils.lookups import category_cache, member_cache  # noqa: E402
+
+CATEGORIES = ['Groceries', 'Housing', 'Utilities', 'Dining', 'Transportation']
+
+
+def setup():
+    with app.app_context():
+        user = User(email='bench@example.com', password=b'x', name='Bench')
+        db.session.add(user)
+        db.session.flush()
+        for name in CATEGORIES:
+            db.session.add(Category(name=name, type='expense', icon='x', color='#000', user_id=user.id))
+        db.session.commit()
+        return create_access_token(identity=str(user.id), additional_claims={
+            'family_id': None, 'is_family_admin': False
+        })
+
+
+def run(client, headers, n, cold):
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        start = time.perf_counter()
+        for i in range(n):
+            if cold:
+                identity_cache.clear()
+                category_cache.clear()
+                member_cache.clear()
+            response = client.post('/api/transactions', headers=headers, json={
+                'type': 'expense',
+                'amount': 10 + i % 50,
+                'category': CATEGORIES[i % len(CATEGORIES)],
+                'date': '2025-03-01',
+                'familyMember': 'Me'
+            })
+            assert response.status_code == 201, response.get_data(as_text=True)
+        elapsed = time.perf_counter() - start
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', count)
+    return n / elapsed, statements[0] / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    token = setup()
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    # Silence per-request debug output so it does not dominate the timing
+    app.logger.disabled = True
+    import logging
+    logging.disable(logging.INFO)
+    devnull = open(os.devnull, 'w')
+    stdout, sys.stdout = sys.stdout, devnull
+    try:
+        cold = run(client, headers, n, cold=True)
+        warm = run(client, headers, n, cold=False)
+    finally:
+        sys.stdout = stdout
+
+    print(f'Inserts: {n} per run, database {DB_PATH}')
+    print(f'cold caches  {cold[0]:8.0f} inserts/s  {cold[1]:.1f} statements/insert')
+    print(f'warm caches  {warm[0]:8.0f} inserts/s  {warm[1]:.1f} statements/insert')
+
+
+if __name__ == '__main__':
+    main()
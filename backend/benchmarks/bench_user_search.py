@@ -0,0 +1,102 @@
+"""
+Latency of /api/family/users/search style lookups.
+
+Fills a throwaway SQLite database with synthetic users (the FTS triggers
+maintain the index during the load), then runs random short and long queries
+through the old ``ILIKE '%q%'`` scan and through ``find_users`` with the
+result cache disabled.  Reports p50 and p99 latency.
+
+Usage:
+    python benchmarks/bench_user_search.py [users] [queries]
+"""
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import config  # noqa: E402
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+config.Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
+
+from app import app  # noqa: E402
+from models import db, User  # noqa: E402
+from utils import search  # noqa: E402
+
+FIRST = ['anna', 'ben', 'carla', 'dev', 'elena', 'farid', 'grace', 'hiro', 'ines', 'jon', 'kavya', 'liam']
+LAST = ['patel', 'smith', 'garcia', 'kim', 'nguyen', 'mueller', 'rossi', 'silva', 'okafor', 'tanaka']
+DOMAINS = ['gmail.com', 'outlook.com', 'example.org', 'yahoo.com', 'proton.me']
+
+
+def random_user(i, rng):
+    first, last = rng.choice(FIRST), rng.choice(LAST)
+    handle = f'{first}.{last}{i}' if rng.random() < 0.5 else f'{first[0]}{last}{i}'
+    return {
+        'email': f'{handle}@{rng.choice(DOMAINS)}',
+        'password': b'x',
+        'name': f'{first.title()} {last.title()}'
+    }
+
+
+def load(users, rng):
+    batch = 10_000
+    with app.app_context():
+        for start in range(0, users, batch):
+            rows = [random_user(i, rng) for i in range(start, min(users, start + batch))]
+            db.session.execute(User.__table__.insert(), rows)
+            db.session.commit()
+
+
+def random_query(rng):
+    kind = rng.random()
+    if kind < 0.3:
+        return rng.choice(FIRST)[:rng.randint(1, 2)]
+    if kind < 0.7:
+        return rng.choice(FIRST + LAST)[:rng.randint(3, 5)]
+    return ''.join(rng.choices(string.ascii_lowercase + string.digits, k=rng.randint(3, 6)))
+
+
+def measure(fn, queries):
+    timings = []
+    with app.app_context():
+        for query in queries:
+            started = time.perf_counter()
+            fn(query)
+            timings.append(time.perf_counter() - started)
+            db.session.remove()
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.99)] * 1000
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(7)
+
+    started = time.perf_counter()
+    load(users, rng)
+    print(f'{users} users loaded and indexed in {time.perf_counter() - started:.1f}s')
+
+    queries = [random_query(rng) for _ in range(count)]
+    search.search_cache.ttl = 0
+
+    def scan(query):
+        return search._scan_search(query, 5)
+
+    def indexed(query):
+        return search.find_users(query, 5)
+
+    for name, fn in (('ilike scan', scan), ('fts5 trigram', indexed)):
+        p50, p99 = measure(fn, queries)
+        print(f'{name:14s} p50 {p50:8.2f} ms  p99 {p99:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
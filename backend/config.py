@@ -2,17 +2,107 @@ import os
 import secrets
 from datetime import timedelta
 
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///finance_tracker.db')
+
+def engine_options(database_url):
+    """SQLAlchemy engine options for the configured backend."""
+    if database_url.startswith('sqlite'):
+        # SQLite tuning is applied per connection via SQLITE_PRAGMAS
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),  # seconds
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),  # seconds
+        'pool_pre_ping': True
+    }
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_hex(32))
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///finance_tracker.db'
+    SQLALCHEMY_DATABASE_URI = DATABASE_URL
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(DATABASE_URL)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Applied on every new SQLite connection (ignored for other backends)
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # ms
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),  # bytes
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),  # negative = KiB
+        'temp_store': 'MEMORY'
+    }
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', secrets.token_urlsafe(32))
-    MAIL_SERVER = 'smtp.gmail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', MAIL_USERNAME)
+    OUTBOX_WORKER_ENABLED = os.environ.get('OUTBOX_WORKER_ENABLED', 'true').lower() == 'true'
+    OUTBOX_POLL_INTERVAL = int(os.environ.get('OUTBOX_POLL_INTERVAL', 30))  # seconds
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))  # messages per SMTP connection
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 6))
+    OUTBOX_RETRY_BASE = 30  # seconds, doubled after every failed attempt
+    OUTBOX_RETRY_MAX = 3600  # seconds
+    OUTBOX_LEASE = 300  # seconds a claimed message is hidden from other workers
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.environ.get('JWT_REFRESH_DAYS', 30)))
     JWT_TOKEN_LOCATION = ['headers']
+    JWT_QUERY_STRING_NAME = 'jwt'  # only the notification stream accepts ?jwt=<token>
     JWT_HEADER_NAME = 'Authorization'
-    JWT_HEADER_TYPE = 'Bearer'
\ No newline at end of file
+    JWT_HEADER_TYPE = 'Bearer'
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))  # waiting requests before 503
+    PASSWORD_HASH_TIMEOUT = int(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))  # seconds
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', 10000))
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 300))  # seconds
+    LOOKUP_CACHE_SIZE = int(os.environ.get('LOOKUP_CACHE_SIZE', 5000))  # users/families
+    LOOKUP_CACHE_TTL = int(os.environ.get('LOOKUP_CACHE_TTL', 600))  # seconds
+    USER_SEARCH_CACHE_SIZE = int(os.environ.get('USER_SEARCH_CACHE_SIZE', 4096))  # distinct queries
+    USER_SEARCH_CACHE_TTL = int(os.environ.get('USER_SEARCH_CACHE_TTL', 30))  # seconds
+    USER_SEARCH_CANDIDATES = 50  # substring matches ranked per query
+    VARIANCE_CACHE_SIZE = int(os.environ.get('VARIANCE_CACHE_SIZE', 20000))  # owner-months
+    VARIANCE_CACHE_TTL = int(os.environ.get('VARIANCE_CACHE_TTL', 3600))  # seconds; revalidated by data version
+    FAMILY_BUDGET_CACHE_SIZE = int(os.environ.get('FAMILY_BUDGET_CACHE_SIZE', 2000))  # optimizer models (families)
+    FAMILY_BUDGET_CACHE_TTL = int(os.environ.get('FAMILY_BUDGET_CACHE_TTL', 3600))  # seconds; revalidated by data version
+    BUDGET_ALERTS_ENABLED = os.environ.get('BUDGET_ALERTS_ENABLED', 'true').lower() == 'true'
+    BUDGET_ALERT_THRESHOLDS = ((1.0, 'budget_exceeded'), (0.8, 'approaching_budget_limit'))  # share of the limit, highest first
+    NOTIFICATION_PAGE_SIZE = 20
+    NOTIFICATION_PAGE_MAX = 100
+    NOTIFICATION_STREAM_QUEUE = 100  # undelivered events per open stream before it is told to resync
+    NOTIFICATION_STREAM_HEARTBEAT = int(os.environ.get('NOTIFICATION_STREAM_HEARTBEAT', 15))  # seconds
+    NOTIFICATION_STREAM_MAX_AGE = int(os.environ.get('NOTIFICATION_STREAM_MAX_AGE', 1800))  # seconds; client reconnects
+    NOTIFICATION_BULK_MAX_IDS = 1000
+    NOTIFICATION_RETENTION_ENABLED = os.environ.get('NOTIFICATION_RETENTION_ENABLED', 'true').lower() == 'true'
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))  # read notifications older than this are deleted
+    NOTIFICATION_PURGE_INTERVAL = int(os.environ.get('NOTIFICATION_PURGE_INTERVAL', 3600))  # seconds
+    NOTIFICATION_PURGE_CHUNK = 500  # rows per delete transaction
+    NOTIFICATION_PURGE_PAUSE = 0.05  # seconds between chunks so other writers get the lock
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # report jobs computed concurrently per process
+    JOB_MAX_WAIT = 30  # seconds a status request may long-poll
+    JOB_POLL_INTERVAL = 0.5  # seconds between status reads while long-polling a job run by another process
+    JOB_HEARTBEAT_INTERVAL = 10  # seconds between touches of the jobs a process is running
+    JOB_STALE_AFTER = 60  # seconds without a heartbeat before a job counts as interrupted
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 86400))  # seconds finished reports are kept
+    ANALYTICS_PROCESSES = int(os.environ.get('ANALYTICS_PROCESSES', min(4, os.cpu_count() or 1)))  # 0 runs kernels inline
+    AI_BATCH_ENABLED = os.environ.get('AI_BATCH_ENABLED', 'true').lower() == 'true'
+    AI_BATCH_INTERVAL = int(os.environ.get('AI_BATCH_INTERVAL', 86400))  # seconds between incremental runs
+    AI_BATCH_CHUNK = 500  # users analyzed per query and transaction
+    AI_BATCH_LOOKBACK_MONTHS = int(os.environ.get('AI_BATCH_LOOKBACK_MONTHS', 12))  # complete months analyzed
+    RECURRENCE_ENABLED = os.environ.get('RECURRENCE_ENABLED', 'true').lower() == 'true'
+    RECURRENCE_INTERVAL = int(os.environ.get('RECURRENCE_INTERVAL', 3600))  # seconds between scheduler runs
+    RECURRENCE_CHUNK = 500  # rules per insert transaction
+    CATEGORIZER_ENABLED = os.environ.get('CATEGORIZER_ENABLED', 'true').lower() == 'true'  # needs torch
+    CATEGORIZER_RETRAIN_INTERVAL = int(os.environ.get('CATEGORIZER_RETRAIN_INTERVAL', 3600))  # seconds between checks for new labelled rows
+    CATEGORIZER_MODEL_PATH = os.environ.get('CATEGORIZER_MODEL_PATH')  # default: instance/categorizer.pt
+    CATEGORIZER_MAX_BATCH = int(os.environ.get('CATEGORIZER_MAX_BATCH', 256))  # rows per micro-batched forward pass
+    CATEGORIZER_MAX_WAIT_MS = float(os.environ.get('CATEGORIZER_MAX_WAIT_MS', 5))  # how long a batch waits to fill
+    CATEGORIZER_ASSIGN_THRESHOLD = float(os.environ.get('CATEGORIZER_ASSIGN_THRESHOLD', 0.6))  # confidence to auto-assign
+    CATEGORIZER_CACHE_SIZE = 50000  # memoized descriptions
+    CATEGORIZER_CACHE_TTL = 86400  # seconds; cleared whenever a new model is installed
+    CATEGORIZER_MAX_ROWS = 10000  # descriptions per categorize request
+    JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson')  # 'orjson' or 'default'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # bytes
+    COMPRESS_LEVEL = 6  # gzip
+    COMPRESS_BR_LEVEL = 4  # brotli
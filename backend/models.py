@@ -43,7 +43,7 @@ class User(db.Model):
             'name': self.name,
             'family_id': self.family_id,
             'is_family_admin': self.is_family_admin,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': self.created_at
         }
         print(f"User dict created: {result}")
         return result
@@ -70,7 +70,7 @@ class Family(db.Model):
             'id': self.id,
             'name': self.name,
             'members': [member.to_dict() for member in self.members],
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': self.created_at
         }
 
 class FamilyMember(db.Model):
@@ -91,7 +91,7 @@ class FamilyMember(db.Model):
             'user_id': self.user_id,
             'name': self.name,
             'role': self.role,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': self.created_at
         }
 
 class Category(db.Model):
@@ -117,7 +117,7 @@ class Category(db.Model):
             'suggested_limit': self.suggested_limit,
             'user_id': self.user_id,
             'family_id': self.family_id,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'created_at': self.created_at
         }
 
 class Transaction(db.Model):
@@ -132,10 +132,18 @@ class Transaction(db.Model):
     family_member_id = db.Column(db.Integer, db.ForeignKey('family_member.id'), nullable=True)
     is_recurring = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    recurrence_id = db.Column(db.Integer, db.ForeignKey('recurrence_rule.id'), nullable=True)  # rule that generated it
 
     # Relationships
     category = db.relationship('Category', backref='transactions', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_transaction_user_date', 'user_id', 'date'),
+        db.Index('ix_transaction_family_date', 'family_id', 'date'),
+        db.Index('ix_transaction_category_date', 'category_id', 'date'),
+        db.Index('ix_transaction_recurrence_date', 'recurrence_id', 'date', unique=True),  # one instance per rule and day
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -146,12 +154,69 @@ class Transaction(db.Model):
             'category_id': self.category_id,
             'category': self.category.to_dict() if self.category else None,
             'description': self.description,
-            'date': self.date.strftime('%Y-%m-%d'),
+            'date': self.date,
             'family_member_id': self.family_member_id,
             'is_recurring': self.is_recurring,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+            'recurrence_id': self.recurrence_id,
+            'created_at': self.created_at
         }
 
+class CategoryMonthTotal(db.Model):
+    """Running month-to-date expense total per category, kept by utils.alerts"""
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DailyBalance(db.Model):
+    """Net amount and running balance through each day with transactions, kept by analytics.balance"""
+    scope = db.Column(db.String(8), primary_key=True)  # 'user' or 'family'
+    owner_id = db.Column(db.Integer, primary_key=True)  # user or family id
+    day = db.Column(db.Date, primary_key=True)
+    net = db.Column(db.Float, nullable=False, default=0.0)
+    balance = db.Column(db.Float, nullable=False, default=0.0)
+
+class SpendingSketch(db.Model):
+    """Amount quantiles and top merchants of one user's transactions in a category, kept by analytics.sketches"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    family_id = db.Column(db.Integer, primary_key=True, default=0)  # 0 = not a family transaction
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    sum_squares = db.Column(db.Float, nullable=False, default=0.0)
+    minimum = db.Column(db.Float, nullable=False)
+    maximum = db.Column(db.Float, nullable=False)
+    centroids = db.Column(db.LargeBinary, nullable=False)  # t-digest (mean, weight) pairs as float32
+    merchants = db.Column(db.JSON, nullable=False, default=dict)  # Misra-Gries counters {merchant: count}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_spending_sketch_family', 'family_id'),
+    )
+
+class RecurrenceRule(db.Model):
+    """A repeating transaction; utils.recurrence materializes its instances as they come due."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    family_id = db.Column(db.Integer, db.ForeignKey('family.id'), nullable=True)
+    type = db.Column(db.String(20), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    description = db.Column(db.String(200))
+    family_member_id = db.Column(db.Integer, db.ForeignKey('family_member.id'), nullable=True)
+    frequency = db.Column(db.String(10), nullable=False)  # daily, weekly, monthly, yearly
+    interval = db.Column(db.Integer, nullable=False, default=1)  # every n periods
+    start_date = db.Column(db.Date, nullable=False)  # first occurrence; also fixes the day of month
+    end_date = db.Column(db.Date, nullable=True)  # last possible occurrence
+    materialized_through = db.Column(db.Date, nullable=True)  # instances exist up to this date
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_recurrence_rule_user', 'user_id'),
+        db.Index('ix_recurrence_rule_due', 'active', 'materialized_through'),
+    )
+
 class MonthlyPlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -162,6 +227,11 @@ class MonthlyPlan(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_monthly_plan_user_month', 'user_id', 'month'),
+        db.Index('ix_monthly_plan_family_month', 'family_id', 'month'),
+    )
+
     def __init__(self, **kwargs):
         print(f"\n=== Creating MonthlyPlan Object ===")
         print(f"Initializing with data: {kwargs}")
@@ -186,7 +256,7 @@ class MonthlyPlan(db.Model):
             'expectedIncome': self.expected_income or [],
             'expectedExpenses': self.expected_expenses or [],
             'notes': self.notes or '',
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'created_at': self.created_at,
             'is_family_plan': self.family_id is not None
         }
         print(f"MonthlyPlan dict created: {result}")
@@ -208,9 +278,19 @@ class AINotification(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     type = db.Column(db.String(20), nullable=False)  # alert, warning, tip, info
     message = db.Column(db.String(255), nullable=False)
-    priority = db.Column(db.String(10), default='normal')  # high, normal, low
+    priority = db.Column(db.String(10), default='normal')  # high, medium, normal, low
     read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    kind = db.Column(db.String(40), nullable=True)  # e.g. budget_exceeded, see ai.config.NOTIFICATION_PRIORITIES
+    dedup_key = db.Column(db.String(100), nullable=True)  # at most one notification per user and key
+    dismissed = db.Column(db.Boolean, nullable=True, default=False, server_default=db.false())  # hidden, kept for dedup
+
+    __table_args__ = (
+        db.Index('ix_ai_notification_user_dedup', 'user_id', 'dedup_key', unique=True),
+        db.Index('ix_ai_notification_user_id', 'user_id', 'id'),  # newest-first history pages
+        db.Index('ix_ai_notification_user_read_created', 'user_id', 'read', 'created_at'),  # unread counts, bulk updates
+        db.Index('ix_ai_notification_read_created', 'read', 'created_at'),  # retention purge
+    )
 
 class AISavingsGoal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -231,6 +311,10 @@ class AIBudgetRecommendation(db.Model):
     applied = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_ai_budget_recommendation_user_month', 'user_id', 'month', unique=True),
+    )
+
 class AIInsight(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -240,3 +324,64 @@ class AIInsight(db.Model):
     data = db.Column(db.JSON, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_ai_insight_user_id', 'user_id', 'id'),
+    )
+
+
+class AIBatchWatermark(db.Model):
+    """Data versions a user's precomputed insights were built from (see ai.batch)."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    family_id = db.Column(db.Integer, nullable=True)
+    user_version = db.Column(db.Integer, nullable=False, default=0)
+    family_version = db.Column(db.Integer, nullable=False, default=0)
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM the batch ran in; insights roll over monthly
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DataVersion(db.Model):
+    """Monotonic change counter per data scope, used to build cheap ETags."""
+    scope = db.Column(db.String(32), primary_key=True)  # 'user', 'family', 'user_month:YYYY-MM', ...
+    scope_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class EmailOutbox(db.Model):
+    """Outgoing email, written in the request's transaction and sent by a background worker."""
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32), nullable=True)  # worker batch currently sending it
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+class ReportJob(db.Model):
+    """Background report, run by utils.jobs; the finished report is kept as JSON text."""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(40), nullable=False)
+    params = db.Column(db.JSON, nullable=False)
+    # Hash of (user, kind, params) while pending/running, NULL afterwards: dedups identical submissions
+    active_key = db.Column(db.String(64), nullable=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, running, done, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)  # percent
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_report_job_active_key', 'active_key', unique=True),
+        db.Index('ix_report_job_status_updated', 'status', 'updated_at'),
+    )
@@ -0,0 +1,165 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+import logging
+from datetime import date
+
+from analytics.balance import balance_series
+from analytics.cashflow import cashflow_series
+from analytics.sketches import spending_distribution, DEFAULT_QUANTILES, MERCHANT_COUNTERS
+from analytics.variance import plan_variance
+from utils.plans import month_range, InvalidRange
+from utils.identity import current_identity
+from utils.versioning import conditional_get, SCOPE_USER, SCOPE_FAMILY
+
+logger = logging.getLogger(__name__)
+analytics_bp = Blueprint('analytics', __name__)
+
+@analytics_bp.route('/plan-variance', methods=['GET'])
+@jwt_required()
+def get_plan_variance():
+    """Planned vs actual per category for ?from=YYYY-MM&to=YYYY-MM (to defaults to from)"""
+    try:
+        identity = current_identity()
+        if not identity:
+            return jsonify({'message': 'User not found'}), 401
+
+        scope = request.args.get('scope', SCOPE_USER)
+        if scope not in (SCOPE_USER, SCOPE_FAMILY):
+            return jsonify({'message': 'Invalid scope'}), 400
+        if scope == SCOPE_FAMILY and not identity.family_id:
+            return jsonify({'message': 'You are not part of a family'}), 400
+
+        first = request.args.get('from')
+        if not first:
+            return jsonify({'message': '"from" month is required'}), 400
+        try:
+            months = month_range(first, request.args.get('to', first))
+        except InvalidRange as e:
+            return jsonify({'message': str(e)}), 400
+
+        return jsonify({
+            'scope': scope,
+            'months': plan_variance(identity, scope, months)
+        })
+
+    except Exception as e:
+        logger.error(f"Error in get_plan_variance: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Failed to compute plan variance', 'error': str(e)}), 500
+
+
+@analytics_bp.route('/spending-distribution', methods=['GET'])
+@jwt_required()
+@conditional_get(SCOPE_USER, SCOPE_FAMILY)
+def get_spending_distribution():
+    """Count, mean, percentiles (?percentiles=50,90) and top merchants per category, from the sketches"""
+    try:
+        identity = current_identity()
+        if not identity:
+            return jsonify({'message': 'User not found'}), 401
+
+        scope = request.args.get('scope', SCOPE_USER)
+        if scope not in (SCOPE_USER, SCOPE_FAMILY):
+            return jsonify({'message': 'Invalid scope'}), 400
+        if scope == SCOPE_FAMILY and not identity.family_id:
+            return jsonify({'message': 'You are not part of a family'}), 400
+        category_type = request.args.get('type', 'expense')
+        if category_type not in ('income', 'expense'):
+            return jsonify({'message': 'Invalid type'}), 400
+
+        try:
+            percentiles = [float(p) for p in request.args.get('percentiles', '').split(',') if p.strip()]
+            top = min(max(int(request.args.get('top', 10)), 0), MERCHANT_COUNTERS)
+        except ValueError:
+            return jsonify({'message': 'percentiles must be numbers and top an integer'}), 400
+        if not all(0 <= p <= 100 for p in percentiles):
+            return jsonify({'message': 'percentiles must be between 0 and 100'}), 400
+
+        return jsonify({
+            'scope': scope,
+            'type': category_type,
+            **spending_distribution(identity, scope, category_type, percentiles or DEFAULT_QUANTILES, top)
+        })
+
+    except Exception as e:
+        logger.error(f"Error in get_spending_distribution: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Failed to compute spending distribution', 'error': str(e)}), 500
+
+
+def _default_end():
+    """Today when the range has no explicit end (it then moves at midnight), else None."""
+    return None if request.args.get('to') else date.today().isoformat()
+
+
+@analytics_bp.route('/balance', methods=['GET'])
+@jwt_required()
+@conditional_get(SCOPE_USER, SCOPE_FAMILY, key=_default_end)
+def get_balance():
+    """Running balance at the end of each day, week or month from ?from=YYYY-MM-DD to ?to=YYYY-MM-DD"""
+    try:
+        identity = current_identity()
+        if not identity:
+            return jsonify({'message': 'User not found'}), 401
+
+        scope = request.args.get('scope', SCOPE_USER)
+        if scope not in (SCOPE_USER, SCOPE_FAMILY):
+            return jsonify({'message': 'Invalid scope'}), 400
+        if scope == SCOPE_FAMILY and not identity.family_id:
+            return jsonify({'message': 'You are not part of a family'}), 400
+
+        try:
+            today = date.today()
+            end = date.fromisoformat(request.args['to']) if request.args.get('to') else today
+            start = date.fromisoformat(request.args['from']) if request.args.get('from') else end.replace(day=1)
+        except ValueError:
+            return jsonify({'message': 'Dates must be in YYYY-MM-DD format'}), 400
+        step = request.args.get('step', 'day')
+
+        try:
+            series = balance_series(identity, scope, start, end, step)
+        except InvalidRange as e:
+            return jsonify({'message': str(e)}), 400
+        return jsonify({'scope': scope, 'step': step, **series})
+
+    except Exception as e:
+        logger.error(f"Error in get_balance: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Failed to compute balance', 'error': str(e)}), 500
+
+
+@analytics_bp.route('/cashflow', methods=['GET'])
+@jwt_required()
+@conditional_get(SCOPE_USER, SCOPE_FAMILY, key=_default_end)
+def get_cashflow():
+    """Amounts per day, week or month by type (?group=type) or category, with rolling averages and changes"""
+    try:
+        identity = current_identity()
+        if not identity:
+            return jsonify({'message': 'User not found'}), 401
+
+        scope = request.args.get('scope', SCOPE_USER)
+        if scope not in (SCOPE_USER, SCOPE_FAMILY):
+            return jsonify({'message': 'Invalid scope'}), 400
+        if scope == SCOPE_FAMILY and not identity.family_id:
+            return jsonify({'message': 'You are not part of a family'}), 400
+        category_type = request.args.get('type', 'expense')
+        if category_type not in ('income', 'expense'):
+            return jsonify({'message': 'Invalid type'}), 400
+
+        try:
+            end = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+            default_start = date(end.year - 1, end.month, 1)
+            start = date.fromisoformat(request.args['from']) if request.args.get('from') else default_start
+            window = int(request.args.get('window', 3))
+        except ValueError:
+            return jsonify({'message': 'Dates must be in YYYY-MM-DD format and window an integer'}), 400
+        bucket = request.args.get('bucket', 'month')
+        group = request.args.get('group', 'type')
+
+        try:
+            result = cashflow_series(identity, scope, start, end, bucket, group, category_type, window)
+        except InvalidRange as e:
+            return jsonify({'message': str(e)}), 400
+        return jsonify({'scope': scope, 'bucket': bucket, 'group': group, 'window': window, **result})
+
+    except Exception as e:
+        logger.error(f"Error in get_cashflow: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Failed to compute cash flow', 'error': str(e)}), 500
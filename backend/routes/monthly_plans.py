@@ -3,38 +3,128 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
 import logging
 
-from models import db, User, MonthlyPlan
+from models import db, MonthlyPlan
+from utils.versioning import conditional_get, SCOPE_USER, SCOPE_FAMILY
+from utils.identity import current_identity
+from utils.plans import resolve_plans, month_range, InvalidRange, MAX_MONTHS
 
 logger = logging.getLogger(__name__)
 monthly_plans_bp = Blueprint('monthly_plans', __name__)
 
+def empty_plan(month, user):
+    """Response body for a month without a plan"""
+    return {
+        'month': month,
+        'expectedIncome': [],
+        'expectedExpenses': [],
+        'notes': '',
+        'is_family_plan': user.family_id is not None
+    }
+
+@monthly_plans_bp.route('', methods=['GET'])
+@jwt_required()
+@conditional_get(SCOPE_USER, SCOPE_FAMILY)
+def get_monthly_plans():
+    """Plans for every month in ?from=YYYY-MM&to=YYYY-MM, resolved in one query"""
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'message': 'User not found'}), 401
+
+        first = request.args.get('from')
+        if not first:
+            return jsonify({'message': '"from" month is required'}), 400
+        try:
+            months = month_range(first, request.args.get('to', first))
+        except InvalidRange as e:
+            return jsonify({'message': str(e)}), 400
+
+        plans = resolve_plans(user, months)
+        return jsonify({
+            'plans': [plans[month].to_dict() if month in plans else empty_plan(month, user) for month in months]
+        })
+
+    except Exception as e:
+        logger.error(f"Error in get_monthly_plans: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Failed to get monthly plans', 'error': str(e)}), 500
+
+@monthly_plans_bp.route('', methods=['PUT'])
+@jwt_required()
+def save_monthly_plans():
+    """
+    Create or update several months at once: {"plans": [{"month", "expectedIncome",
+    "expectedExpenses", "notes"}, ...]}.  Each month updates the plan the user
+    sees for it (their own, else the family's) and is otherwise created.
+    """
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'message': 'User not found'}), 401
+
+        data = request.get_json(silent=True) or {}
+        entries = data.get('plans')
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'message': '"plans" must be a non-empty list'}), 400
+
+        by_month = {}
+        for entry in entries:
+            raw_month = entry.get('month') if isinstance(entry, dict) else None
+            try:
+                # Store the canonical 'YYYY-MM' the range reads query, not e.g. '2026-1'
+                month = month_range(raw_month, raw_month)[0]
+            except InvalidRange as e:
+                return jsonify({'message': str(e), 'month': raw_month}), 400
+            if month in by_month:
+                return jsonify({'message': 'Duplicate month in plans', 'month': month}), 400
+            by_month[month] = entry
+        if len(by_month) > MAX_MONTHS:
+            return jsonify({'message': f'At most {MAX_MONTHS} months per request'}), 400
+
+        plans = resolve_plans(user, list(by_month))
+        for month, entry in by_month.items():
+            monthly_plan = plans.get(month)
+            if monthly_plan is None:
+                monthly_plan = MonthlyPlan(
+                    user_id=user.user_id,
+                    family_id=user.family_id,
+                    month=month,
+                    expected_income=entry.get('expectedIncome', []),
+                    expected_expenses=entry.get('expectedExpenses', []),
+                    notes=entry.get('notes', '')
+                )
+                db.session.add(monthly_plan)
+                plans[month] = monthly_plan
+            else:
+                monthly_plan.expected_income = entry.get('expectedIncome', monthly_plan.expected_income)
+                monthly_plan.expected_expenses = entry.get('expectedExpenses', monthly_plan.expected_expenses)
+                monthly_plan.notes = entry.get('notes', monthly_plan.notes)
+
+        db.session.commit()
+        return jsonify({'plans': [plans[month].to_dict() for month in sorted(by_month)]})
+
+    except Exception as e:
+        logger.error(f"Error in save_monthly_plans: {str(e)}", exc_info=True)
+        db.session.rollback()
+        return jsonify({'message': 'Failed to save monthly plans', 'error': str(e)}), 500
+
 @monthly_plans_bp.route('/<month>', methods=['GET'])
 @jwt_required()
+@conditional_get(SCOPE_USER, SCOPE_FAMILY)
 def get_monthly_plan(month):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
         
         if not user:
             logger.error(f"User not found for ID: {user_id}")
             return jsonify({'message': 'User not found'}), 401
         
-        # First try to get user's personal monthly plan
-        monthly_plan = MonthlyPlan.query.filter_by(user_id=user_id, month=month).first()
-        
-        # If user has a family and no personal plan, try to get family plan
-        if not monthly_plan and user.family_id:
-            monthly_plan = MonthlyPlan.query.filter_by(family_id=user.family_id, month=month).first()
+        # User's personal monthly plan, else the family plan
+        monthly_plan = resolve_plans(user, [month]).get(month)
         
         if not monthly_plan:
             # Return empty plan structure if no plan exists
-            return jsonify({
-                'month': month,
-                'expectedIncome': [],
-                'expectedExpenses': [],
-                'notes': '',
-                'is_family_plan': user.family_id is not None
-            })
+            return jsonify(empty_plan(month, user))
         
         return jsonify(monthly_plan.to_dict())
         
@@ -47,7 +137,7 @@ def get_monthly_plan(month):
 def create_monthly_plan(month):
     try:
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
         
         if not user:
             logger.error(f"User not found for ID: {user_id}")
@@ -88,12 +178,12 @@ def update_monthly_plan(month):
         user_id = get_jwt_identity()
         logger.info(f"User ID: {user_id}")
         
-        user = User.query.get(user_id)
+        user = current_identity()
         if not user:
             logger.error(f"User not found for ID: {user_id}")
             return jsonify({'message': 'User not found'}), 401
             
-        logger.info(f"User found: {user.email}")
+        logger.info(f"User found, family ID: {user.family_id}")
         
         data = request.get_json()
         logger.info(f"Received data: {data}")
@@ -0,0 +1,259 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import jwt_required
+from datetime import date, datetime, timedelta
+from itertools import islice
+import logging
+
+from sqlalchemy import or_
+
+from models import db, RecurrenceRule, Transaction
+from utils.identity import current_identity
+from utils.lookups import resolve_category, resolve_family_member
+from utils.plans import MAX_MONTHS
+from utils.recurrence import (
+    FREQUENCIES, iter_occurrences, materialize_saved, remove_future_instances, rule_from_transaction, stop_recurrence
+)
+
+logger = logging.getLogger(__name__)
+recurrences_bp = Blueprint('recurrences', __name__)
+
+UPCOMING_LIMIT = 20
+
+def rule_to_dict(rule):
+    return {
+        'id': rule.id,
+        'type': rule.type,
+        'amount': rule.amount,
+        'category_id': rule.category_id,
+        'description': rule.description,
+        'family_member_id': rule.family_member_id,
+        'frequency': rule.frequency,
+        'interval': rule.interval,
+        'startDate': rule.start_date,
+        'endDate': rule.end_date,
+        'materializedThrough': rule.materialized_through,
+        'active': rule.active
+    }
+
+def _parse_date(value, field):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be in YYYY-MM-DD format')
+
+def _apply_schedule(rule, data):
+    """Validate and set frequency, interval and end date from the request body"""
+    rule.frequency = data.get('frequency', rule.frequency or 'monthly')
+    if rule.frequency not in FREQUENCIES:
+        raise ValueError(f'frequency must be one of {", ".join(FREQUENCIES)}')
+    try:
+        rule.interval = int(data.get('interval', rule.interval or 1))
+    except (TypeError, ValueError):
+        raise ValueError('interval must be an integer')
+    if rule.interval < 1:
+        raise ValueError('interval must be positive')
+    if 'endDate' in data:
+        rule.end_date = _parse_date(data['endDate'], 'endDate') if data['endDate'] else None
+    if rule.end_date is not None and rule.start_date is not None and rule.end_date < rule.start_date:
+        raise ValueError('endDate must not be before startDate')
+
+def _apply_template(rule, data, user):
+    """Validate and set the transaction fields from the request body"""
+    required_fields = ['type', 'amount', 'category', 'startDate']
+    if not all(field in data for field in required_fields):
+        raise ValueError('Missing required fields')
+    category = resolve_category(user, data['category'], data['type'])
+    if not category:
+        raise LookupError(f'Category with ID {data["category"]} not found')
+    family_member_id = None
+    if user.family_id and data.get('familyMember'):
+        family_member_id = resolve_family_member(user.family_id, data['familyMember'])
+        if family_member_id is None:
+            raise LookupError(f'Family member with ID {data["familyMember"]} not found in your family')
+    try:
+        rule.amount = float(data['amount'])
+    except (TypeError, ValueError):
+        raise ValueError('amount must be a number')
+    rule.type = data['type']
+    rule.category_id = category.id
+    rule.description = data.get('description', '')
+    rule.family_member_id = family_member_id
+    rule.start_date = _parse_date(data['startDate'], 'startDate')
+
+def _own_rule(rule_id, user):
+    return RecurrenceRule.query.filter_by(id=rule_id, user_id=user.user_id).first()
+
+@recurrences_bp.route('', methods=['GET'])
+@jwt_required()
+def get_recurrences():
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'message': 'User not found'}), 401
+        rules = RecurrenceRule.query.filter_by(user_id=user.user_id, active=True).order_by(RecurrenceRule.id).all()
+        return jsonify({'recurrences': [rule_to_dict(rule) for rule in rules]})
+    except Exception as e:
+        logger.error(f"Error in get_recurrences: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Failed to get recurrences', 'error': str(e)}), 500
+
+@recurrences_bp.route('', methods=['POST'])
+@jwt_required()
+def create_recurrence():
+    """
+    Create a rule from {"type", "amount", "category", "description", "familyMember",
+    "startDate", "frequency", "interval", "endDate"}, or repeat an existing
+    transaction with {"fromTransaction": id, "frequency", ...}.  Instances that
+    have already come due are generated straight away.
+    """
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'message': 'User not found'}), 401
+        data = request.get_json(silent=True) or {}
+
+        if 'fromTransaction' in data:
+            transaction = Transaction.query.filter_by(id=data['fromTransaction'], user_id=user.user_id).first()
+            if not transaction:
+                return jsonify({'message': 'Transaction not found'}), 404
+            if transaction.recurrence_id is not None:
+                return jsonify({'message': 'Transaction already repeats'}), 400
+            rule = rule_from_transaction(transaction)
+            _apply_schedule(rule, data)
+            db.session.add(rule)
+            db.session.flush()
+            transaction.recurrence_id = rule.id
+            transaction.is_recurring = True
+        else:
+            rule = RecurrenceRule(user_id=user.user_id, family_id=user.family_id)
+            _apply_template(rule, data, user)
+            _apply_schedule(rule, data)
+            db.session.add(rule)
+        db.session.commit()
+
+        materialize_saved(current_app, [rule.id])
+        return jsonify({'recurrence': rule_to_dict(db.session.get(RecurrenceRule, rule.id))}), 201
+
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 404
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in create_recurrence: {str(e)}", exc_info=True)
+        db.session.rollback()
+        return jsonify({'message': 'Failed to create recurrence', 'error': str(e)}), 500
+
+@recurrences_bp.route('/<int:rule_id>', methods=['PUT'])
+@jwt_required()
+def update_recurrence(rule_id):
+    """Change a rule from today on; instances after today are dropped and regenerated as they come due, earlier ones are kept"""
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'message': 'User not found'}), 401
+        rule = _own_rule(rule_id, user)
+        if not rule or not rule.active:
+            return jsonify({'message': 'Recurrence not found'}), 404
+        data = request.get_json(silent=True) or {}
+
+        _apply_template(rule, {
+            'type': rule.type, 'amount': rule.amount, 'category': rule.category_id,
+            'description': rule.description, 'familyMember': rule.family_member_id,
+            'startDate': rule.start_date.isoformat(), **data
+        }, user)
+        _apply_schedule(rule, data)
+        remove_future_instances(rule.id)
+        today = date.today()
+        rule.materialized_through = today if rule.start_date <= today else None
+        db.session.commit()
+
+        materialize_saved(current_app, [rule.id])
+        return jsonify({'recurrence': rule_to_dict(db.session.get(RecurrenceRule, rule.id))})
+
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 404
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in update_recurrence: {str(e)}", exc_info=True)
+        db.session.rollback()
+        return jsonify({'message': 'Failed to update recurrence', 'error': str(e)}), 500
+
+@recurrences_bp.route('/<int:rule_id>', methods=['DELETE'])
+@jwt_required()
+def delete_recurrence(rule_id):
+    """Stop a rule: instances after today are removed, past ones stay in the ledger"""
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'message': 'User not found'}), 401
+        rule = _own_rule(rule_id, user)
+        if not rule or not rule.active:
+            return jsonify({'message': 'Recurrence not found'}), 404
+
+        stop_recurrence(rule)
+        db.session.commit()
+        return jsonify({'message': 'Recurrence stopped'})
+
+    except Exception as e:
+        logger.error(f"Error in delete_recurrence: {str(e)}", exc_info=True)
+        db.session.rollback()
+        return jsonify({'message': 'Failed to delete recurrence', 'error': str(e)}), 500
+
+@recurrences_bp.route('/forecast', methods=['GET'])
+@jwt_required()
+def get_recurrence_forecast():
+    """
+    Committed income and expenses per month for the next ?months=N (default 3),
+    from the user's and family's active rules, plus the next occurrences.
+    Recurrences are expanded lazily; nothing is materialized.
+    """
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'message': 'User not found'}), 401
+        try:
+            months = int(request.args.get('months', 3))
+        except ValueError:
+            return jsonify({'message': 'months must be an integer'}), 400
+        if not 1 <= months <= MAX_MONTHS:
+            return jsonify({'message': f'months must be between 1 and {MAX_MONTHS}'}), 400
+
+        owner_filter = RecurrenceRule.user_id == user.user_id
+        if user.family_id:
+            owner_filter = or_(owner_filter, RecurrenceRule.family_id == user.family_id)
+        rules = RecurrenceRule.query.filter(owner_filter, RecurrenceRule.active == True).all()  # noqa: E712
+
+        today = date.today()
+        first = today.year * 12 + today.month - 1
+        labels = [f'{index // 12}-{index % 12 + 1:02d}' for index in range(first, first + months)]
+        until = date((first + months) // 12, (first + months) % 12 + 1, 1) - timedelta(days=1)
+
+        totals = {label: {'income': 0.0, 'expense': 0.0} for label in labels}
+        for day, rule in iter_occurrences(rules, after=today - timedelta(days=1), until=until):
+            month = totals[day.strftime('%Y-%m')]
+            month[rule.type] = month.get(rule.type, 0.0) + rule.amount
+        upcoming = islice(iter_occurrences(rules, after=today - timedelta(days=1)), UPCOMING_LIMIT)
+
+        return jsonify({
+            'months': [{
+                'month': month,
+                'income': round(values['income'], 2),
+                'expense': round(values['expense'], 2),
+                'net': round(values['income'] - values['expense'], 2)
+            } for month, values in totals.items()],
+            'upcoming': [{
+                'date': day,
+                'recurrence_id': rule.id,
+                'type': rule.type,
+                'amount': rule.amount,
+                'description': rule.description
+            } for day, rule in upcoming]
+        })
+
+    except Exception as e:
+        logger.error(f"Error in get_recurrence_forecast: {str(e)}", exc_info=True)
+        return jsonify({'message': 'Failed to forecast recurrences', 'error': str(e)}), 500
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+import pytest
+
+# Configuration is read at import time: point it at a scratch database and
+# keep the background workers from starting during tests
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+for _worker in ('OUTBOX_WORKER', 'NOTIFICATION_RETENTION', 'AI_BATCH', 'RECURRENCE', 'CATEGORIZER'):
+    os.environ[f'{_worker}_ENABLED'] = 'false'
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('ANALYTICS_PROCESSES', '0')
+
+from app import app as flask_app  # noqa: E402
+from models import db  # noqa: E402
+from utils.lookups import category_cache, member_cache  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        category_cache.clear()
+        member_cache.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+import pytest
+
+from ai.batch import _month_number, analyze_accounts, run_ai_batch
+from models import db, AIInsight, Category, Transaction, User
+
+
+def _user(email):
+    user = User(email=email, password=b'x', name=email)
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def _expense(user, category, amount, day):
+    db.session.add(Transaction(user_id=user.id, type='expense', amount=amount, category_id=category.id,
+                               date=day, description='groceries'))
+
+
+def test_future_transactions_stay_out_of_the_batch(app):
+    today = date.today()
+    next_month = date(today.year + today.month // 12, today.month % 12 + 1, 1)
+    first, second = _user('first@example.com'), _user('second@example.com')
+    for user in (first, second):
+        category = Category(name='Groceries', type='expense', icon='-', color='-', user_id=user.id)
+        db.session.add(category)
+        db.session.flush()
+        for offset in range(0, 90, 7):
+            _expense(user, category, 40.0, today - timedelta(days=offset))
+        # A scheduled instance for next month, as recurring rules can store
+        _expense(user, category, 5000.0, next_month + timedelta(days=3))
+    db.session.commit()
+
+    assert run_ai_batch(app) == 2
+    for insight in AIInsight.query.filter_by(type='alert'):
+        assert insight.data['count'] == 0
+    tips = {insight.user_id: insight.data for insight in AIInsight.query.filter_by(type='tip')}
+    assert tips[first.id]['total'] == tips[second.id]['total'] == pytest.approx(40.0 * 13)
+
+
+def test_analyze_accounts_rejects_rows_outside_the_months():
+    current_month = _month_number(date.today())
+    future = date.today() + timedelta(days=62)
+    rows = [(1, 'expense', 10.0, 'Groceries', date.today()), (2, 'expense', 10.0, 'Groceries', future)]
+    with pytest.raises(ValueError):
+        analyze_accounts([1, 2], rows, current_month - 12, current_month)
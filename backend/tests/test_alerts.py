@@ -0,0 +1,147 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import func, select
+
+from models import db, AINotification, Category, CategoryMonthTotal, MonthlyPlan, RecurrenceRule, Transaction, User
+from utils.recurrence import _add_months, materialize_recurrences
+
+
+def _user():
+    user = User(email='alerts@example.com', password=b'x', name='Alerts')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _category(user, name, limit=None):
+    category = Category(name=name, type='expense', icon='-', color='-', user_id=user.id, suggested_limit=limit)
+    db.session.add(category)
+    db.session.commit()
+    return category
+
+
+def _spend(user, category, amount, day, type='expense'):
+    transaction = Transaction(user_id=user.id, type=type, amount=amount, category_id=category.id, date=day)
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction
+
+
+def _totals():
+    return {(row.category_id, row.month): row.total for row in CategoryMonthTotal.query}
+
+
+def _naive(key):
+    category_id, month = key
+    return db.session.execute(
+        select(func.coalesce(func.sum(Transaction.amount), 0.0))
+        .where(Transaction.category_id == category_id, Transaction.type == 'expense',
+               func.strftime('%Y-%m', Transaction.date) == month)
+    ).scalar()
+
+
+def _assert_totals_match():
+    totals = _totals()
+    assert totals
+    for key, total in totals.items():
+        assert total == pytest.approx(_naive(key)), key
+
+
+def _alerts(user):
+    return sorted((n.kind, n.dedup_key) for n in AINotification.query.filter_by(user_id=user.id))
+
+
+def test_totals_follow_inserts_updates_and_deletes(app):
+    user = _user()
+    food, rent = _category(user, 'Food'), _category(user, 'Rent')
+
+    groceries = _spend(user, food, 40.0, date(2024, 1, 5))
+    _spend(user, food, 10.0, date(2024, 1, 20))
+    salary = _spend(user, food, 500.0, date(2024, 1, 25), type='income')
+    assert _totals() == {(food.id, '2024-01'): pytest.approx(50.0)}
+
+    # Moving to another month and category leaves the old total and enters the new one
+    groceries.date, groceries.category_id, groceries.amount = date(2024, 2, 3), rent.id, 45.0
+    db.session.commit()
+    assert _totals()[(food.id, '2024-01')] == pytest.approx(10.0)
+    assert _totals()[(rent.id, '2024-02')] == pytest.approx(45.0)
+
+    # Becoming an expense counts the amount; deleting takes it back out
+    salary.type = 'expense'
+    db.session.commit()
+    assert _totals()[(food.id, '2024-01')] == pytest.approx(510.0)
+    db.session.delete(salary)
+    db.session.commit()
+    assert _totals()[(food.id, '2024-01')] == pytest.approx(10.0)
+    _assert_totals_match()
+
+    db.session.delete(groceries)
+    db.session.commit()
+    assert _totals()[(rent.id, '2024-02')] == pytest.approx(0.0)
+    _assert_totals_match()
+
+
+def test_thresholds_alert_once_per_category_and_month(app):
+    user = _user()
+    food = _category(user, 'Food', limit=100.0)
+
+    _spend(user, food, 50.0, date(2024, 1, 3))
+    assert _alerts(user) == []
+    _spend(user, food, 30.0, date(2024, 1, 4))
+    assert _alerts(user) == [('approaching_budget_limit', f'approaching_budget_limit:{food.id}:2024-01')]
+    _spend(user, food, 5.0, date(2024, 1, 5))
+    assert len(_alerts(user)) == 1
+
+    _spend(user, food, 15.0, date(2024, 1, 6))
+    _spend(user, food, 25.0, date(2024, 1, 7))
+    assert _alerts(user) == [('approaching_budget_limit', f'approaching_budget_limit:{food.id}:2024-01'),
+                             ('budget_exceeded', f'budget_exceeded:{food.id}:2024-01')]
+
+    # Dismissed notifications are kept, so dropping back under and over again stays quiet
+    AINotification.query.filter_by(user_id=user.id).update({'dismissed': True})
+    db.session.commit()
+    big = _spend(user, food, 100.0, date(2024, 1, 8))
+    db.session.delete(big)
+    db.session.commit()
+    _spend(user, food, 1.0, date(2024, 1, 9))
+    assert len(_alerts(user)) == 2
+
+    # Another month starts over
+    _spend(user, food, 90.0, date(2024, 2, 1))
+    assert ('approaching_budget_limit', f'approaching_budget_limit:{food.id}:2024-02') in _alerts(user)
+
+
+def test_monthly_plan_overrides_suggested_limit(app):
+    user = _user()
+    food = _category(user, 'Food', limit=1000.0)
+    db.session.add(MonthlyPlan(user_id=user.id, month='2024-03',
+                               expected_expenses=[{'category': 'Food', 'amount': 100}]))
+    db.session.commit()
+
+    _spend(user, food, 120.0, date(2024, 3, 2))
+    _spend(user, food, 120.0, date(2024, 4, 2))
+    assert _alerts(user) == [('budget_exceeded', f'budget_exceeded:{food.id}:2024-03')]
+
+
+def test_materialized_recurrences_raise_alerts(app):
+    user = _user()
+    rent = _category(user, 'Rent', limit=100.0)
+    this_month = date.today().replace(day=1)
+    last_month = _add_months(this_month, -1)
+    _spend(user, rent, 20.0, this_month)
+    db.session.add(RecurrenceRule(user_id=user.id, type='expense', amount=85.0, category_id=rent.id,
+                                  description='rent', frequency='monthly', start_date=last_month))
+    db.session.commit()
+
+    assert materialize_recurrences(app) == 2
+    db.session.expire_all()
+    assert _totals() == {(rent.id, last_month.strftime('%Y-%m')): pytest.approx(85.0),
+                         (rent.id, this_month.strftime('%Y-%m')): pytest.approx(105.0)}
+    _assert_totals_match()
+    expected = [('approaching_budget_limit', f'approaching_budget_limit:{rent.id}:{last_month:%Y-%m}'),
+                ('budget_exceeded', f'budget_exceeded:{rent.id}:{this_month:%Y-%m}')]
+    assert _alerts(user) == expected
+
+    assert materialize_recurrences(app) == 0
+    assert _alerts(user) == expected
@@ -0,0 +1,74 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import case, func, select
+
+from analytics.balance import balance_series, series_points
+from models import db, Category, Family, Transaction, User
+from utils.identity import Identity
+from utils.versioning import SCOPE_FAMILY, SCOPE_USER
+
+START = date(2024, 1, 1)
+END = date(2024, 3, 31)
+
+
+def _naive(owner, points):
+    signed = case((Transaction.type == 'income', Transaction.amount),
+                  (Transaction.type == 'expense', -Transaction.amount), else_=0.0)
+    return [round(db.session.execute(select(func.coalesce(func.sum(signed), 0.0)).where(owner, Transaction.date <= point))
+                  .scalar(), 2) for point in points]
+
+
+def _assert_matches(user, family, step):
+    points = series_points(START, END, step)
+    identity = Identity(user.id, family.id, False)
+    assert balance_series(identity, SCOPE_USER, START, END, step)['balances'] == \
+        pytest.approx(_naive(Transaction.user_id == user.id, points))
+    assert balance_series(identity, SCOPE_FAMILY, START, END, step)['balances'] == \
+        pytest.approx(_naive(Transaction.family_id == family.id, points))
+
+
+def test_balances_follow_inserts_edits_owner_changes_and_deletes(app):
+    family = Family(name='Family')
+    db.session.add(family)
+    db.session.flush()
+    first = User(email='first@example.com', password=b'x', name='First', family_id=family.id)
+    second = User(email='second@example.com', password=b'x', name='Second', family_id=family.id)
+    db.session.add_all([first, second])
+    db.session.flush()
+    category = Category(name='Food', type='expense', icon='-', color='-', user_id=first.id)
+    db.session.add(category)
+    db.session.flush()
+
+    transactions = []
+    for offset in range(0, 90, 3):
+        user = first if offset % 2 else second
+        transactions.append(Transaction(
+            user_id=user.id, family_id=family.id if offset % 9 else None, category_id=category.id,
+            type='income' if offset % 15 == 0 else 'expense', amount=10.0 + offset, date=START + timedelta(days=offset)
+        ))
+    db.session.add_all(transactions)
+    db.session.commit()
+    for step in ('day', 'week', 'month'):
+        _assert_matches(first, family, step)
+
+    # Back-dated edit: move a late transaction to January and change its amount and type
+    transactions[-1].date = START + timedelta(days=2)
+    transactions[-1].amount = 500.0
+    transactions[-1].type = 'income'
+    db.session.commit()
+    _assert_matches(first, family, 'day')
+
+    # Owner change: to the other user and out of the family, and into the family
+    transactions[4].user_id = second.id if transactions[4].user_id == first.id else first.id
+    transactions[4].family_id = None
+    transactions[3].family_id = family.id
+    db.session.commit()
+    _assert_matches(first, family, 'day')
+    _assert_matches(second, family, 'day')
+
+    db.session.delete(transactions[10])
+    db.session.delete(transactions[11])
+    db.session.commit()
+    _assert_matches(first, family, 'day')
+    _assert_matches(second, family, 'week')
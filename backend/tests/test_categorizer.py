@@ -0,0 +1,169 @@
+import threading
+from collections import namedtuple
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from ai.categorizer import (
+    Categorizer, CategorizerBusy, CategorizerModel, CategorizerUnavailable, MicroBatcher, _encode, _training_rows,
+    description_features, normalize_description, quantize_net, torch
+)
+from models import db, Category, Transaction, User
+
+requires_torch = pytest.mark.skipif(torch is None, reason='torch is not installed')
+
+Identity = namedtuple('Identity', ['user_id', 'family_id'])
+
+SAMPLES = [
+    ('TESCO STORES 2231', 'expense', 'Food', 12),
+    ('tesco express', 'expense', 'Food', 8),
+    ('sainsburys local', 'expense', 'Food', 9),
+    ('pizza hut', 'expense', 'Food', 4),
+    ('netflix com', 'expense', 'Subscriptions', 10),
+    ('spotify premium', 'expense', 'Subscriptions', 10),
+    ('disney plus', 'expense', 'Subscriptions', 5),
+    ('uber trip', 'expense', 'Travel', 7),
+    ('british airways', 'expense', 'Travel', 3),
+    ('trainline tickets', 'expense', 'Travel', 6),
+    ('shell petrol station', 'expense', 'Travel', 5),
+    ('amazon marketplace', 'expense', 'Shopping', 11),
+    ('zara online', 'expense', 'Shopping', 4),
+    ('ikea store', 'expense', 'Household', 3),
+    ('british gas', 'expense', 'Household', 6),
+    ('thames water', 'expense', 'Household', 6),
+    ('landlord rent payment', 'expense', 'Rent', 12),
+    ('monthly rent flat', 'expense', 'Rent', 12),
+    ('payroll acme ltd', 'income', 'Salary', 12),
+    ('salary acme', 'income', 'Salary', 12),
+    ('upwork payout', 'income', 'Freelance', 5),
+    ('fiverr withdrawal', 'income', 'Freelance', 4),
+]
+
+
+def _user(email):
+    user = User(email=email, password=b'x', name=email)
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def _category(user, name, category_type='expense'):
+    category = Category(name=name, type=category_type, icon='-', color='-', user_id=user.id)
+    db.session.add(category)
+    db.session.flush()
+    return category
+
+
+def test_training_rows_only_use_shared_categories(app):
+    first, second = _user('first@example.com'), _user('second@example.com')
+    food, secret = _category(first, 'FOOD'), _category(second, 'Divorce lawyer')
+    for category, description in ((food, 'tesco express'), (secret, 'smith and partners retainer')):
+        for _ in range(5):
+            db.session.add(Transaction(user_id=category.user_id, type='expense', amount=10.0,
+                                       category_id=category.id, date=date.today(),
+                                       description=description))
+    db.session.commit()
+
+    assert _training_rows(100) == [('tesco express', 'expense', 'Food', 5)]
+
+
+def test_suggestions_never_offer_other_users_categories(app):
+    user = _user('user@example.com')
+    groceries = _category(user, 'food')
+    db.session.commit()
+    model = SimpleNamespace(by_type={'expense': {'food': 0, 'travel': 1}},
+                            labels=[('expense', 'Food'), ('expense', 'Travel')])
+    categorizer = Categorizer(model_path=None)
+
+    labels, choices = categorizer._choices(model, Identity(user.id, None), 'expense')
+    assert list(labels) == [0, 1]
+    assert choices == [(0, groceries.id, 'food')]
+
+    newcomer = _user('newcomer@example.com')
+    db.session.commit()
+    _, choices = categorizer._choices(model, Identity(newcomer.id, None), 'expense')
+    assert choices == [(0, None, 'Food'), (1, None, 'Travel')]
+
+
+@pytest.fixture
+def model():
+    trained = CategorizerModel.train(SAMPLES, watermark=(len(SAMPLES), 99), epochs=30)
+    assert trained is not None
+    return trained
+
+
+def _predict(model, text):
+    labels = model.labels
+    return labels[int(model.logits([description_features(normalize_description(text))])[0].argmax())]
+
+
+@requires_torch
+def test_training_learns_the_shared_categories(model):
+    assert sorted(model.labels) == sorted({(kind, name) for _, kind, name, _ in SAMPLES})
+    assert _predict(model, 'TESCO EXPRESS 0042') == ('expense', 'Food')
+    assert _predict(model, 'Spotify Premium') == ('expense', 'Subscriptions')
+    assert _predict(model, 'ACME payroll') == ('income', 'Salary')
+
+
+@requires_torch
+def test_quantized_model_agrees_with_the_float_model(model):
+    features = [description_features(normalize_description(text)) for text, _, _, _ in SAMPLES]
+    quantized = quantize_net(model.net)
+    with torch.inference_mode():
+        exact = model.net(*_encode(features)).numpy()
+        approximate = quantized(*_encode(features)).numpy()
+    assert (exact.argmax(axis=1) == approximate.argmax(axis=1)).mean() >= 0.9
+
+
+@requires_torch
+def test_save_and_load_round_trip(model, tmp_path):
+    path = str(tmp_path / 'categorizer.pt')
+    model.save(path)
+    loaded = CategorizerModel.load(path)
+
+    assert loaded.labels == model.labels
+    assert loaded.watermark == model.watermark
+    features = [description_features('netflix com'), description_features('uber trip')]
+    np.testing.assert_allclose(loaded.logits(features), model.logits(features), rtol=1e-5, atol=1e-6)
+
+
+@requires_torch
+def test_micro_batcher_runs_concurrent_requests_in_one_pass(model):
+    calls = []
+
+    def forward(batch_model, feature_lists):
+        calls.append(len(feature_lists))
+        return batch_model.logits(feature_lists)
+
+    batcher = MicroBatcher(forward, max_batch=64, max_wait=0.2)
+    texts = [normalize_description(text) for text, _, _, _ in SAMPLES[:8]]
+    results = [None] * len(texts)
+    barrier = threading.Barrier(len(texts))
+
+    def request(i):
+        barrier.wait()
+        results[i] = batcher.submit(model, [description_features(texts[i])]).result(timeout=5)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(calls) == len(texts) and len(calls) < len(texts)
+    expected = model.logits([description_features(text) for text in texts])
+    np.testing.assert_allclose(np.concatenate(results), expected, rtol=1e-5, atol=1e-6)
+
+
+def test_a_slow_batch_reports_busy():
+    release = threading.Event()
+    model = SimpleNamespace(version=1, logits=lambda features: release.wait() and np.zeros((len(features), 2)))
+    categorizer = Categorizer('unused', max_batch=256, max_wait=0.001, timeout=0.05)
+    try:
+        with pytest.raises(CategorizerBusy):
+            categorizer._scores(model, ['netflix'])
+    finally:
+        release.set()
+    assert isinstance(CategorizerBusy(), CategorizerUnavailable)
@@ -0,0 +1,67 @@
+import json
+from datetime import date
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from models import db, Category, ReportJob, Transaction, User
+from utils.columnar import ARROW_MIMETYPE, epoch_day, transaction_columns
+
+pytest.importorskip('pyarrow')
+
+
+def _headers():
+    user = User(email='columns@example.com', password=b'x', name='Columns')
+    db.session.add(user)
+    db.session.flush()
+    category = Category(name='Groceries', type='expense', icon='-', color='-', user_id=user.id)
+    db.session.add(category)
+    db.session.flush()
+    db.session.add(Transaction(user_id=user.id, type='expense', amount=12.5, category_id=category.id,
+                               date=date(2024, 3, 1), description='groceries'))
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+
+def test_transaction_columns_use_epoch_days():
+    payload = transaction_columns([(1, date(1970, 1, 11), 5.0, 'expense', None, None, None, None)])
+    assert payload['columns']['date'] == [epoch_day(date(1970, 1, 11))] == [10]
+
+
+def test_arrow_and_json_bodies_have_their_own_etags(client):
+    headers = _headers()
+    as_json = client.get('/api/transactions?layout=columnar', headers=headers)
+    as_arrow = client.get('/api/transactions?layout=columnar', headers={**headers, 'Accept': ARROW_MIMETYPE})
+    assert as_arrow.mimetype == ARROW_MIMETYPE
+    assert as_json.headers['ETag'] != as_arrow.headers['ETag']
+    assert 'Accept' in as_json.vary and 'Accept' in as_arrow.vary
+
+    # An ETag of one representation does not validate the other
+    stale = client.get('/api/transactions?layout=columnar',
+                       headers={**headers, 'If-None-Match': as_json.headers['ETag'], 'Accept': ARROW_MIMETYPE})
+    assert stale.status_code == 200 and stale.mimetype == ARROW_MIMETYPE
+    fresh = client.get('/api/transactions?layout=columnar',
+                       headers={**headers, 'If-None-Match': as_arrow.headers['ETag'], 'Accept': ARROW_MIMETYPE})
+    assert fresh.status_code == 304 and 'Accept' in fresh.vary
+
+
+def test_report_transactions_pivot_to_columns(client):
+    headers = _headers()
+    user_id = User.query.one().id
+    rows = [{'id': 7, 'type': 'expense', 'amount': 400.0, 'category': 'Travel', 'description': 'flight',
+             'date': '1970-01-03'},
+            {'id': 9, 'type': 'expense', 'amount': 350.0, 'category': 'Travel', 'description': None,
+             'date': '1970-01-05'}]
+    report = {'spending_patterns': {'total_spent': 750.0, 'unusual_transactions': rows}, 'predictions': {}}
+    db.session.add(ReportJob(id='columnar', user_id=user_id, kind='ai_report', params={}, status='done',
+                             progress=100, result=json.dumps(report)))
+    db.session.commit()
+
+    plain = client.get('/api/ai/report-jobs/columnar', headers=headers).get_json()
+    assert plain['report']['spending_patterns']['unusual_transactions'] == rows
+    columnar = client.get('/api/ai/report-jobs/columnar?layout=columnar', headers=headers).get_json()
+    unusual = columnar['report']['spending_patterns']['unusual_transactions']
+    assert unusual['columns'] == {'id': [7, 9], 'date': [2, 4], 'amount': [400.0, 350.0], 'type': [0, 0],
+                                  'category': [0, 0], 'description': ['flight', None]}
+    assert unusual['dictionaries'] == {'type': ['expense'], 'category': ['Travel']}
+    assert columnar['report']['spending_patterns']['total_spent'] == 750.0
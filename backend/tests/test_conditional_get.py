@@ -0,0 +1,46 @@
+from datetime import date
+
+from flask_jwt_extended import create_access_token
+
+from models import db, Category, Family, FamilyMember, Transaction, User
+
+
+def _family_ledger():
+    family = Family(name='Family')
+    db.session.add(family)
+    db.session.flush()
+    user = User(email='etag@example.com', password=b'x', name='Etag', family_id=family.id)
+    db.session.add(user)
+    db.session.flush()
+    member = FamilyMember(family_id=family.id, name='Bob', role='child')
+    category = Category(name='Food', type='expense', icon='-', color='-', user_id=user.id)
+    db.session.add_all([member, category])
+    db.session.flush()
+    db.session.add(Transaction(user_id=user.id, family_id=family.id, family_member_id=member.id,
+                               category_id=category.id, type='expense',
+                               amount=9.0, date=date(2024, 5, 2), description='lunch'))
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}, member.id
+
+
+def test_unchanged_transactions_answer_304(client):
+    headers, _ = _family_ledger()
+    first = client.get('/api/transactions', headers=headers)
+    assert first.status_code == 200
+    again = client.get('/api/transactions', headers={**headers, 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+
+
+def test_renaming_a_family_member_moves_the_transactions_etag(client):
+    headers, member_id = _family_ledger()
+    first = client.get('/api/transactions', headers=headers)
+    assert first.get_json()[0]['familyMember'] == 'Bob'
+
+    db.session.get(FamilyMember, member_id).name = 'Renamed'
+    db.session.commit()
+
+    after = client.get('/api/transactions', headers={**headers, 'If-None-Match': first.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != first.headers['ETag']
+    assert after.get_json()[0]['familyMember'] == 'Renamed'
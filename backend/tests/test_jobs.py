@@ -0,0 +1,81 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from models import db, ReportJob, User
+from utils.jobs import STATUS_DONE, STATUS_FAILED, STATUS_RUNNING, job_key, register_job
+
+
+def _user():
+    user = User(email='jobs@example.com', password=b'x', name='Jobs')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _orphan(user, kind, params, seconds_ago):
+    """An active job row left behind by a process that is gone."""
+    job = ReportJob(id=f'orphan{seconds_ago}', user_id=user.id, kind=kind, params=params,
+                    active_key=job_key(user.id, kind, params), status=STATUS_RUNNING,
+                    updated_at=datetime.utcnow() - timedelta(seconds=seconds_ago))
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_orphaned_job_is_replaced_after_missed_heartbeats(app):
+    register_job('test_echo', lambda params, progress: params)
+    runner = app.extensions['jobs']
+    user = _user()
+    params = {'n': 1}
+    orphan_id = _orphan(user, 'test_echo', params, app.config['JOB_STALE_AFTER'] + 5)
+
+    job, created = runner.submit(user.id, 'test_echo', params)
+    assert created and job.id != orphan_id
+    assert db.session.get(ReportJob, orphan_id).status == STATUS_FAILED
+    runner.wait(job.id, 5)
+    db.session.expire_all()
+    assert db.session.get(ReportJob, job.id).status == STATUS_DONE
+
+
+def test_wait_polls_jobs_running_elsewhere(app):
+    runner = app.extensions['jobs']
+    user = _user()
+    job_id = _orphan(user, 'test_echo', {'n': 2}, 0)
+
+    def finish():
+        time.sleep(0.3)
+        with app.app_context():
+            ReportJob.query.filter_by(id=job_id).update({'status': STATUS_DONE, 'active_key': None})
+            db.session.commit()
+
+    thread = threading.Thread(target=finish)
+    thread.start()
+    start = time.monotonic()
+    runner.wait(job_id, 5)
+    thread.join()
+    assert 0.2 < time.monotonic() - start < 2
+
+
+def test_wait_gives_up_after_timeout(app):
+    runner = app.extensions['jobs']
+    job_id = _orphan(_user(), 'test_echo', {'n': 3}, 0)
+    start = time.monotonic()
+    runner.wait(job_id, 0.4)
+    assert 0.35 < time.monotonic() - start < 1.5
+
+
+def test_status_poll_fails_only_the_polled_stale_job(client):
+    app = client.application
+    user = _user()
+    stale = app.config['JOB_STALE_AFTER'] + 5
+    polled, other = _orphan(user, 'test_echo', {'n': 4}, stale), _orphan(user, 'test_echo', {'n': 5}, stale + 1)
+    live = _orphan(user, 'test_echo', {'n': 6}, 0)
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+    assert client.get(f'/api/ai/report-jobs/{polled}', headers=headers).get_json()['job']['status'] == STATUS_FAILED
+    assert client.get(f'/api/ai/report-jobs/{live}', headers=headers).get_json()['job']['status'] == STATUS_RUNNING
+    db.session.expire_all()
+    assert db.session.get(ReportJob, other).status == STATUS_RUNNING
@@ -0,0 +1,31 @@
+import os
+import signal
+
+from ai.kernels import AnalyticsPool, encode_transactions
+
+
+def test_forked_process_does_not_reuse_the_inherited_pool():
+    """A child forked after the pool started (a pre-forking server) gets its own workers."""
+    arrays = encode_transactions([10.0, 20.0, 500.0], ['Food', 'Food', 'Rent'], ['2024-01-02', '2024-01-09', '2024-02-01'])
+    pool = AnalyticsPool(1)
+    pool.warm()
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        status = 1
+        try:
+            signal.alarm(10)  # a reused executor never completes the future
+            result = pool.run('spending', arrays, threshold=2.0)
+            status = 0 if result['category_totals'] == [30.0, 500.0] and pool._pid == os.getpid() else 2
+            pool.shutdown()
+        finally:
+            os.write(write_end, bytes([status]))
+            os._exit(0)
+    os.close(write_end)
+    try:
+        assert os.read(read_end, 1) == b'\x00'
+    finally:
+        os.close(read_end)
+        os.waitpid(pid, 0)
+        pool.shutdown()
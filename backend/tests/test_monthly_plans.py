@@ -0,0 +1,29 @@
+from flask_jwt_extended import create_access_token
+
+from models import db, MonthlyPlan, User
+
+
+def _headers():
+    user = User(email='plans@example.com', password=b'x', name='Plans')
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+
+def test_saved_months_are_normalized(client):
+    headers = _headers()
+    saved = client.put('/api/monthly-plans', headers=headers, json={'plans': [
+        {'month': '2026-1', 'expectedExpenses': [{'category': 'Rent', 'amount': 900}]}
+    ]})
+    assert saved.status_code == 200
+    assert [plan.month for plan in MonthlyPlan.query] == ['2026-01']
+
+    plans = client.get('/api/monthly-plans?from=2026-01&to=2026-02', headers=headers).get_json()['plans']
+    assert plans[0]['month'] == '2026-01' and plans[0]['expectedExpenses'][0]['amount'] == 900
+
+
+def test_spellings_of_one_month_are_duplicates(client):
+    response = client.put('/api/monthly-plans', headers=_headers(), json={'plans': [
+        {'month': '2026-1'}, {'month': '2026-01'}
+    ]})
+    assert response.status_code == 400 and response.get_json()['month'] == '2026-01'
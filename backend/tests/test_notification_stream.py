@@ -0,0 +1,40 @@
+from flask_jwt_extended import create_access_token
+
+from models import db, AINotification, User
+from utils.notifications import broker
+
+
+def _events(body):
+    """(id, data) of each notification event in an SSE body."""
+    events = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+        if fields.get('event') == 'notification':
+            events.append((int(fields['id']) if 'id' in fields else None, fields['data']))
+    return events
+
+
+def test_reconnect_skips_only_replayed_ids(client):
+    app = client.application
+    app.config.update(NOTIFICATION_STREAM_HEARTBEAT=0.05, NOTIFICATION_STREAM_MAX_AGE=0.2)
+    user = User(email='stream@example.com', password=b'x', name='Stream')
+    db.session.add(user)
+    db.session.commit()
+    # Commit the notifications without publishing them: these ids are what the backlog replays
+    ids = db.session.execute(AINotification.__table__.insert().returning(AINotification.id), [
+        {'user_id': user.id, 'type': 'info', 'message': f'n{i}', 'dismissed': False} for i in range(3)
+    ]).scalars().all()
+    db.session.commit()
+    token = create_access_token(identity=str(user.id))
+
+    response = client.get(f'/api/ai/notifications/stream?jwt={token}', buffered=False,
+                          headers={'Last-Event-ID': str(ids[1])})
+    broker.publish(user.id, (ids[2], '"replayed"'))
+    broker.publish(user.id, (ids[0] - 1, '"committed late"'))
+    broker.publish(user.id, (ids[2] + 1, '"new"'))
+    body = b''.join(response.response).decode()
+    response.close()
+
+    events = _events(body)
+    assert events[0][0] == ids[2]
+    assert events[1:] == [(None, '"committed late"'), (ids[2] + 1, '"new"')]
@@ -0,0 +1,37 @@
+import threading
+
+import bcrypt
+import pytest
+
+from models import db, User
+from utils.passwords import PasswordHasher, PasswordHasherBusy, password_hasher
+
+
+def test_a_hash_that_times_out_reports_busy():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, timeout=0.05)
+    release = threading.Event()
+    blocker = hasher._executor.submit(release.wait)
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash('secret')
+    finally:
+        release.set()
+        blocker.result()
+    assert hasher.verify('secret', bcrypt.hashpw(b'secret', bcrypt.gensalt(4)))
+
+
+def test_login_succeeds_when_the_rehash_is_busy(client, monkeypatch):
+    rounds = password_hasher.rounds + 1
+    db.session.add(User(email='rehash@example.com', password=bcrypt.hashpw(b'secret', bcrypt.gensalt(rounds)),
+                        name='Rehash'))
+    db.session.commit()
+
+    def busy(password):
+        raise PasswordHasherBusy()
+
+    monkeypatch.setattr(password_hasher, 'hash', busy)
+    response = client.post('/api/login', json={'email': 'rehash@example.com', 'password': 'secret'})
+    assert response.status_code == 200 and response.get_json()['token']
+    db.session.expire_all()
+    assert password_hasher.needs_rehash(User.query.filter_by(email='rehash@example.com').one().password)
+
@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+
+from ai.kernels import add_commitments
+from analytics.balance import balance_series
+from models import (db, AINotification, Category, CategoryMonthTotal, DataVersion, RecurrenceRule, SpendingSketch,
+                    Transaction, User)
+from utils.recurrence import _add_months, _insert_instances, committed_amounts, materialize_recurrences, occurrences
+from utils.identity import Identity
+from utils.versioning import SCOPE_USER
+
+
+def _ledger(limit=None):
+    user = User(email='rules@example.com', password=b'x', name='Rules')
+    db.session.add(user)
+    db.session.flush()
+    category = Category(name='Rent', type='expense', icon='-', color='-', user_id=user.id, suggested_limit=limit)
+    db.session.add(category)
+    db.session.commit()
+    return user, category
+
+
+def _rule(user, category, start, amount=100.0, frequency='monthly'):
+    rule = RecurrenceRule(user_id=user.id, type='expense', amount=amount, category_id=category.id,
+                          description='rent', frequency=frequency, start_date=start)
+    db.session.add(rule)
+    db.session.commit()
+    return rule
+
+
+def test_add_months_clamps_to_month_end():
+    assert _add_months(date(2024, 1, 31), 1) == date(2024, 2, 29)
+    assert _add_months(date(2023, 1, 31), 1) == date(2023, 2, 28)
+    assert _add_months(date(2024, 3, 31), -1) == date(2024, 2, 29)
+    assert _add_months(date(2024, 11, 30), 3) == date(2025, 2, 28)
+    assert _add_months(date(2024, 2, 29), 12) == date(2025, 2, 28)
+
+
+def test_monthly_rule_keeps_its_day_after_a_short_month():
+    rule = RecurrenceRule(frequency='monthly', interval=1, start_date=date(2024, 1, 31), end_date=date(2024, 5, 31))
+    assert list(occurrences(rule)) == [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31),
+                                       date(2024, 4, 30), date(2024, 5, 31)]
+
+
+def test_materialization_is_idempotent(app):
+    user, category = _ledger()
+    today = date.today()
+    rule = _rule(user, category, today - timedelta(days=20), frequency='weekly')
+
+    created = materialize_recurrences(app)
+    assert created == 3
+    assert materialize_recurrences(app) == 0
+
+    # Re-running from scratch (e.g. after a crash before materialized_through was saved) adds nothing
+    rule.materialized_through = None
+    db.session.commit()
+    assert materialize_recurrences(app) == 0
+    rows = [{'user_id': user.id, 'type': 'expense', 'amount': 100.0, 'category_id': category.id,
+             'date': rule.start_date, 'recurrence_id': rule.id, 'is_recurring': True}]
+    assert _insert_instances(db.session.connection(), rows) == []
+    db.session.rollback()
+
+    days = [day for day, in db.session.query(Transaction.date).filter_by(recurrence_id=rule.id)]
+    assert len(days) == len(set(days)) == created
+    assert max(days) <= today
+
+
+def test_bulk_insert_updates_derived_data(app):
+    user, category = _ledger(limit=250.0)
+    today = date.today()
+    start = today.replace(day=1)
+    version_before = db.session.get(DataVersion, (SCOPE_USER, user.id)).version
+    rule = _rule(user, category, start, amount=100.0, frequency='daily')
+    rule.interval = 7 if today.day > 21 else 1
+    db.session.commit()
+
+    assert materialize_recurrences(app) > 0
+    instances = Transaction.query.filter_by(recurrence_id=rule.id).all()
+    spent = sum(t.amount for t in instances)
+
+    assert db.session.get(DataVersion, (SCOPE_USER, user.id)).version > version_before
+    if app.extensions.get('transaction_search'):
+        indexed = db.session.execute(text('SELECT rowid FROM transaction_search')).scalars().all()
+        assert {t.id for t in instances} <= set(indexed)
+    sketch = db.session.get(SpendingSketch, (user.id, 0, category.id))
+    assert sketch.count == len(instances) and abs(sketch.total - spent) < 1e-6
+    balances = balance_series(Identity(user.id, None, False), SCOPE_USER, start, today)['balances']
+    assert balances[-1] == -round(spent, 2)
+    total = db.session.get(CategoryMonthTotal, (category.id, today.strftime('%Y-%m')))
+    assert abs(total.total - spent) < 1e-6
+    kinds = {n.kind for n in AINotification.query.filter_by(user_id=user.id)}
+    assert kinds == ({'approaching_budget_limit'} if 200.0 <= spent < 250.0 else
+                     {'budget_exceeded'} if spent >= 250.0 else set())
+
+
+def test_editing_an_instance_without_is_recurring_keeps_the_rule(client):
+    user, category = _ledger()
+    rule = _rule(user, category, date.today() - timedelta(days=3), frequency='weekly')
+    materialize_recurrences(client.application)
+    instance = Transaction.query.filter_by(recurrence_id=rule.id).first()
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+    body = {'type': 'expense', 'amount': 120.0, 'category': category.id, 'date': instance.date.isoformat(),
+            'description': 'rent', 'familyMember': None}
+
+    assert client.put(f'/api/transactions/{instance.id}', json=body, headers=headers).status_code == 200
+    assert db.session.get(RecurrenceRule, rule.id).active
+
+    body['isRecurring'] = False
+    assert client.put(f'/api/transactions/{instance.id}', json=body, headers=headers).status_code == 200
+    db.session.expire_all()
+    assert not db.session.get(RecurrenceRule, rule.id).active
+
+
+def test_committed_amounts_raise_predictions(app):
+    user, category = _ledger()
+    this_month = date.today().replace(day=1)
+    _rule(user, category, _add_months(this_month, 1).replace(day=5), amount=900.0)
+
+    committed = committed_amounts(user.id, None, 3)
+    assert committed == {'Rent': [900.0, 900.0, 900.0]}
+
+    predictions = {'Rent': {'current_monthly': 800.0, 'trend': 50.0, 'predicted_next_months': [850.0, 900.0, 950.0]}}
+    merged = add_commitments(predictions, committed)
+    assert merged['Rent']['predicted_next_months'] == [900.0, 900.0, 950.0]
+    assert add_commitments({}, committed)['Rent']['predicted_next_months'] == [900.0, 900.0, 900.0]
@@ -0,0 +1,226 @@
+"""
+Budget alerts evaluated incrementally on every transaction write.
+
+``category_month_total`` keeps a running month-to-date expense total per
+(category, month).  An ``after_flush`` hook turns each inserted, updated or
+deleted transaction into +/- deltas on the totals it leaves and enters.  It
+then checks the new total against the category's limit for that month.  That
+limit is the amount the owner's monthly plan expects for the category,
+falling back to ``Category.suggested_limit``.  Each write costs a handful of
+primary-key and index lookups and never rescans the month.
+
+A total that doesn't exist yet is seeded from the month's transactions the
+first time it is touched (after the flush, so the seed already includes the
+write).  Rows inserted around the ORM go through ``update_alerts()``, which
+applies and evaluates them like the hook does.  ``invalidate_totals()`` drops
+totals that can no longer be adjusted, so their months are re-seeded.
+
+Crossing a threshold in ``BUDGET_ALERT_THRESHOLDS`` emits one AINotification
+per user, category, month and threshold.  The unique ``(user_id, dedup_key)``
+index drops repeats, so raising a total that is already over the limit sends
+nothing new.  New notifications are pushed to open streams on commit.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, delete, event, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ai.config import NOTIFICATION_PRIORITIES
+from models import db, AINotification, Category, CategoryMonthTotal, MonthlyPlan, Transaction
+from .flush_history import flush_values
+from .notifications import publish_after_commit
+
+EXPENSE = 'expense'
+NOTIFICATION_TYPES = {'budget_exceeded': 'alert', 'approaching_budget_limit': 'warning'}
+
+# Fields whose pre-flush value is needed to compute the delta
+_TRACKED_FIELDS = ('type', 'amount', 'category_id', 'date')
+
+
+def priority_of(kind):
+    """Notification priority for ``kind`` from NOTIFICATION_PRIORITIES."""
+    for priority, kinds in NOTIFICATION_PRIORITIES.items():
+        if kind in kinds:
+            return priority
+    return 'normal'
+
+
+def _month_bounds(month):
+    year, number = map(int, month.split('-'))
+    start = date(year, number, 1)
+    end = date(year + 1, 1, 1) if number == 12 else date(year, number + 1, 1)
+    return start, end
+
+
+def _contribution(values):
+    if values['type'] != EXPENSE or values['category_id'] is None or values['date'] is None:
+        return None
+    return (values['category_id'], values['date'].strftime('%Y-%m')), float(values['amount'] or 0)
+
+
+def _collect_deltas(session):
+    deltas, writers = defaultdict(float), defaultdict(set)
+    for obj in session.new | session.dirty | session.deleted:
+        if not isinstance(obj, Transaction):
+            continue
+        before, after = flush_values(obj, _TRACKED_FIELDS)
+        old = None if obj in session.new else _contribution(before)
+        new = None if obj in session.deleted else _contribution(after)
+        if old == new:
+            continue
+        if old:
+            deltas[old[0]] -= old[1]
+        if new:
+            deltas[new[0]] += new[1]
+            writers[new[0]].add(obj.user_id)
+    return deltas, writers
+
+
+def _apply_delta(connection, key, delta):
+    """Add ``delta`` to a running total, seeding it on first touch. Returns the new total."""
+    category_id, month = key
+    table = CategoryMonthTotal.__table__
+    now = datetime.utcnow()
+    row = connection.execute(
+        table.update()
+        .where(and_(table.c.category_id == category_id, table.c.month == month))
+        .values(total=table.c.total + delta, updated_at=now)
+        .returning(table.c.total)
+    ).first()
+    if row is not None:
+        return row[0]
+
+    start, end = _month_bounds(month)
+    seed = connection.execute(
+        select(func.coalesce(func.sum(Transaction.amount), 0.0))
+        .where(Transaction.category_id == category_id, Transaction.type == EXPENSE,
+               Transaction.date >= start, Transaction.date < end)
+    ).scalar()
+    connection.execute(table.insert().values(category_id=category_id, month=month, total=seed, updated_at=now))
+    return seed
+
+
+def _planned_amount(connection, category, month):
+    """What the owner's plan for ``month`` expects for the category, or None."""
+    owner_filter = MonthlyPlan.user_id == category.user_id
+    if category.family_id:
+        owner_filter = or_(owner_filter, MonthlyPlan.family_id == category.family_id)
+    # Personal plan first, else the family's oldest (as utils.plans.resolve_plans)
+    expenses = connection.execute(
+        select(MonthlyPlan.expected_expenses)
+        .where(owner_filter, MonthlyPlan.month == month)
+        .order_by((MonthlyPlan.user_id == category.user_id).desc(), MonthlyPlan.id)
+        .limit(1)
+    ).scalar()
+
+    amounts = []
+    for entry in expenses or []:
+        if isinstance(entry, dict) and entry.get('category') == category.name:
+            try:
+                amounts.append(float(entry.get('amount') or 0))
+            except (TypeError, ValueError):
+                continue
+    return sum(amounts) if amounts else None
+
+
+def _insert_ignoring_duplicates(connection, rows):
+    """Insert notifications, skipping existing dedup keys. Returns the rows inserted."""
+    insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    table = AINotification.__table__
+    inserted = []
+    for row in rows:
+        inserted.extend(connection.execute(insert(table).on_conflict_do_nothing().returning(*table.c), row))
+    return inserted
+
+
+def _evaluate(connection, key, total, recipients):
+    category_id, month = key
+    category = connection.execute(
+        select(Category.name, Category.suggested_limit, Category.user_id, Category.family_id)
+        .where(Category.id == category_id)
+    ).first()
+    if category is None:
+        return []
+
+    limit = _planned_amount(connection, category, month) or category.suggested_limit
+    if not limit or limit <= 0:
+        return []
+
+    share = total / limit
+    for threshold, kind in current_app.config['BUDGET_ALERT_THRESHOLDS']:
+        if share >= threshold:
+            break
+    else:
+        return []
+
+    if kind == 'budget_exceeded':
+        message = f'You have exceeded your {category.name} budget for {month}: {total:.2f} of {limit:.2f} spent.'
+    else:
+        message = f'You have used {share:.0%} of your {category.name} budget for {month} ({total:.2f} of {limit:.2f}).'
+    now = datetime.utcnow()
+    return _insert_ignoring_duplicates(connection, [{
+        'user_id': user_id,
+        'type': NOTIFICATION_TYPES.get(kind, 'alert'),
+        'kind': kind,
+        'message': message,
+        'priority': priority_of(kind),
+        'read': False,
+        'created_at': now,
+        'dedup_key': f'{kind}:{category_id}:{month}'
+    } for user_id in sorted(recipients | {category.user_id})])
+
+
+def invalidate_totals(connection, category_ids=None):
+    """Drop running totals (all, or for ``category_ids``) so they are re-seeded on next use."""
+    statement = delete(CategoryMonthTotal.__table__)
+    if category_ids is not None:
+        statement = statement.where(CategoryMonthTotal.category_id.in_(list(category_ids)))
+    connection.execute(statement)
+
+
+def _apply_and_evaluate(session, deltas, writers, removed_categories=()):
+    """Apply ``deltas`` to the running totals and publish the alerts the increases trigger."""
+    connection = session.connection()
+    created = []
+    for key, delta in sorted(deltas.items()):
+        if key[0] in removed_categories or delta == 0:
+            continue
+        total = _apply_delta(connection, key, delta)
+        if delta > 0:
+            created.extend(_evaluate(connection, key, total, writers[key]))
+    if created:
+        publish_after_commit(session, created)
+
+
+def update_alerts(session, transactions):
+    """
+    Apply and evaluate transactions inserted around the ORM (objects or rows
+    with type, amount, category_id, date and user_id) that are already written.
+    """
+    if not current_app.config.get('BUDGET_ALERTS_ENABLED'):
+        return
+    deltas, writers = defaultdict(float), defaultdict(set)
+    for transaction in transactions:
+        contribution = _contribution({field: getattr(transaction, field) for field in _TRACKED_FIELDS})
+        if contribution:
+            deltas[contribution[0]] += contribution[1]
+            writers[contribution[0]].add(transaction.user_id)
+    if deltas:
+        _apply_and_evaluate(session, deltas, writers)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _evaluate_alerts_after_flush(session, flush_context):
+    if not has_app_context() or not current_app.config.get('BUDGET_ALERTS_ENABLED'):
+        return
+
+    deltas, writers = _collect_deltas(session)
+    removed_categories = {obj.id for obj in session.deleted if isinstance(obj, Category)}
+    if not (deltas or removed_categories):
+        return
+
+    if removed_categories:
+        invalidate_totals(session.connection(), removed_categories)
+    _apply_and_evaluate(session, deltas, writers, removed_categories)
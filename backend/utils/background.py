@@ -0,0 +1,61 @@
+"""
+Background threads for work that should not run inside a request.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """
+    Run ``task(app)`` inside an app context every ``interval`` seconds on a
+    daemon thread.  ``wake()`` runs it early, e.g. right after a request
+    queued new work.  The thread is started lazily by ``ensure_started()``
+    so it only ever runs in the process that serves requests (not in the
+    reloader's parent process or in scripts that merely import the app).
+    A disabled worker never starts; ``run_once()`` still works, e.g. from a
+    separate process or a script.
+    """
+
+    def __init__(self, app, name, task, interval, enabled=True):
+        self.app = app
+        self.enabled = enabled
+        self.name = name
+        self.task = task
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None or not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.ensure_started()
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        with self.app.app_context():
+            return self.task(self.app)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('%s worker iteration failed', self.name)
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
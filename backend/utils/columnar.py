@@ -0,0 +1,179 @@
+"""
+Columnar ("struct of arrays") wire format for large row sets.
+
+Instead of one JSON object per row, the payload carries one array per field,
+dates as integer days since 1970-01-01 and repeating strings as small integer
+codes into a dictionary.  Columns are filled straight from DB result tuples,
+no per-row dicts are built.
+
+Clients opt in with ``?layout=columnar``; ``&format=arrow`` (or an
+``Accept: application/vnd.apache.arrow.stream`` header) returns the same
+columns as an Arrow IPC stream when pyarrow is installed.  Both bodies can
+come from the same URL, so views pass ``representation`` as the
+``conditional_get`` key and vary on ``Accept``.
+
+``/api/transactions`` and the AI report jobs take the layout; a report is
+nested, so its transaction lists come as columnar JSON only.  The analytics endpoints already answer with parallel arrays or
+per-category aggregates, and ``/api/ai/analyze`` only echoes back a few of
+the rows the client posted, so they have no row lists to pivot.
+"""
+from datetime import date
+
+from flask import current_app, jsonify, request
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional
+    pa = None
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+def wants_columnar():
+    return request.args.get('layout') == 'columnar'
+
+
+def wants_arrow():
+    return request.args.get('format') == 'arrow' or \
+        request.accept_mimetypes.best == ARROW_MIMETYPE
+
+
+def representation():
+    """ETag suffix that tells an Arrow body apart from the JSON body of the same URL."""
+    return 'arrow' if wants_columnar() and wants_arrow() else None
+
+
+def epoch_day(value):
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+class DictionaryEncoder:
+    """Assign dense integer codes to repeating values; None is encoded as -1."""
+
+    def __init__(self):
+        self.index = {}
+        self.ids = []
+        self.names = []
+
+    def encode(self, key, name=None):
+        if key is None:
+            return -1
+        code = self.index.get(key)
+        if code is None:
+            code = self.index[key] = len(self.ids)
+            self.ids.append(key)
+            self.names.append(name)
+        return code
+
+    def to_dict(self):
+        return {'id': self.ids, 'name': self.names}
+
+
+def transaction_columns(rows):
+    """
+    Build columns from ``(id, date, amount, type, category_id, category_name,
+    family_member_id, family_member_name)`` result tuples.
+    """
+    ids, days, amounts, types, categories, members = [], [], [], [], [], []
+    type_codes = DictionaryEncoder()
+    category_codes = DictionaryEncoder()
+    member_codes = DictionaryEncoder()
+
+    for row_id, row_date, amount, row_type, category_id, category_name, member_id, member_name in rows:
+        ids.append(row_id)
+        days.append(epoch_day(row_date))
+        amounts.append(amount)
+        types.append(type_codes.encode(row_type, row_type))
+        categories.append(category_codes.encode(category_id, category_name))
+        members.append(member_codes.encode(member_id, member_name))
+
+    return {
+        'layout': 'columnar',
+        'length': len(ids),
+        'date_unit': 'days_since_epoch',
+        'columns': {
+            'id': ids,
+            'date': days,
+            'amount': amounts,
+            'type': types,
+            'category': categories,
+            'member': members
+        },
+        'dictionaries': {
+            'type': type_codes.names,
+            'category': category_codes.to_dict(),
+            'member': member_codes.to_dict()
+        }
+    }
+
+
+def record_columns(records):
+    """
+    Build columns from transaction dicts as stored in reports (``id``, ``type``,
+    ``amount``, ``category``, ``description``, ``date`` as a date or ISO string).
+    """
+    ids, days, amounts, types, categories, descriptions = [], [], [], [], [], []
+    type_codes = DictionaryEncoder()
+    category_codes = DictionaryEncoder()
+
+    for record in records:
+        day = record['date']
+        if isinstance(day, str):
+            day = date.fromisoformat(day[:10])
+        ids.append(record['id'])
+        days.append(epoch_day(day))
+        amounts.append(record['amount'])
+        types.append(type_codes.encode(record['type'], record['type']))
+        categories.append(category_codes.encode(record['category'], record['category']))
+        descriptions.append(record.get('description'))
+
+    return {
+        'layout': 'columnar',
+        'length': len(ids),
+        'date_unit': 'days_since_epoch',
+        'columns': {
+            'id': ids,
+            'date': days,
+            'amount': amounts,
+            'type': types,
+            'category': categories,
+            'description': descriptions
+        },
+        'dictionaries': {
+            'type': type_codes.names,
+            'category': category_codes.names
+        }
+    }
+
+
+def _arrow_column(name, values, dictionaries):
+    if name == 'date':
+        return pa.array(values, type=pa.int32()).cast(pa.date32())
+    if name in dictionaries:
+        dictionary = dictionaries[name]
+        labels = dictionary['name'] if isinstance(dictionary, dict) else dictionary
+        indices = pa.array([None if code < 0 else code for code in values], type=pa.int32())
+        return pa.DictionaryArray.from_arrays(indices, pa.array(labels, type=pa.string()))
+    return pa.array(values)
+
+
+def _arrow_response(payload):
+    columns = payload['columns']
+    table = pa.table({
+        name: _arrow_column(name, values, payload['dictionaries'])
+        for name, values in columns.items()
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return current_app.response_class(sink.getvalue().to_pybytes(), mimetype=ARROW_MIMETYPE)
+
+
+def columnar_response(payload):
+    """Return the columns as JSON, or as Arrow IPC when the client asked for it."""
+    if wants_arrow():
+        if pa is None:
+            return jsonify({'message': 'Arrow output requires pyarrow on the server'}), 406
+        return _arrow_response(payload)
+    return jsonify(payload)
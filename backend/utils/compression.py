@@ -0,0 +1,62 @@
+"""
+Response compression negotiated from the client's Accept-Encoding.
+
+Only responses above ``COMPRESS_MIN_SIZE`` bytes are compressed; small
+bodies are cheaper to send as-is than to deflate.  Brotli is preferred when
+the ``brotli`` package is installed, otherwise gzip is used.
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/csv',
+    'application/javascript'
+}
+
+
+def _negotiate_encoding():
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def _compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'])
+
+
+def init_compression(app):
+    """Register an after_request hook that compresses large responses."""
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code >= 300
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = _negotiate_encoding()
+        if not encoding:
+            return response
+
+        response.set_data(_compress(data, encoding, app.config))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    return compress_response
@@ -0,0 +1,66 @@
+"""
+Engine setup for the configured database backend.
+"""
+import sqlite3
+
+from sqlalchemy import event, inspect
+from sqlalchemy.schema import CreateColumn
+
+from models import db
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_database(app):
+    """Apply per-connection tuning to the app's engine. Call after db.init_app()."""
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+
+    with app.app_context():
+        engine = db.engine
+
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, sqlite3.Connection):
+            apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+
+def ensure_indexes(app):
+    """
+    Create indexes declared on the models that an existing database is
+    missing (``db.create_all()`` only creates them with new tables).
+    """
+    with app.app_context():
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+
+
+def ensure_columns(app):
+    """
+    Add nullable columns declared on the models to existing tables that
+    predate them (``db.create_all()`` never alters a table).
+    """
+    with app.app_context():
+        engine = db.engine
+        existing_tables = set(inspect(engine).get_table_names())
+        with engine.begin() as connection:
+            for table in db.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                present = {c['name'] for c in inspect(connection).get_columns(table.name)}
+                table_name = engine.dialect.identifier_preparer.format_table(table)
+                for column in table.columns:
+                    if column.name in present or not column.nullable:
+                        continue
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {ddl}')
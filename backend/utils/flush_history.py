@@ -0,0 +1,34 @@
+"""
+Pre- and post-flush values of transactions, for ``after_flush`` hooks that
+turn each write into deltas (running totals, daily balances, sketches).
+
+A delta subtracts what a transaction used to contribute, so the old value
+of every field a hook reads must be in the attribute history.  The ORM only
+records it when the attribute was loaded before the assignment.  The
+listener below loads it on assignment even if the attribute was expired.
+"""
+from sqlalchemy import event, inspect
+
+from models import Transaction
+
+TRACKED_FIELDS = ('type', 'amount', 'date', 'category_id', 'user_id', 'family_id')
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+for _field in TRACKED_FIELDS:
+    event.listen(getattr(Transaction, _field), 'set', _load_previous_value, active_history=True)
+
+
+def flush_values(obj, fields):
+    """Pre- and post-flush values of ``fields`` (a subset of TRACKED_FIELDS) as two dicts."""
+    state = inspect(obj)
+    before, after = {}, {}
+    for field in fields:
+        history = state.attrs[field].history
+        unchanged = history.unchanged[0] if history.unchanged else None
+        before[field] = history.deleted[0] if history.deleted else unchanged
+        after[field] = history.added[0] if history.added else unchanged
+    return before, after
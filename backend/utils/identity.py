@@ -0,0 +1,95 @@
+"""
+Request identity resolved from JWT claims instead of a ``User`` lookup.
+
+Access tokens carry the user's ``family_id`` and ``is_family_admin`` as
+signed claims.  Resolved identities are kept in a small TTL/LRU cache, and
+routes that change family membership call :func:`invalidate_identity` so
+claims in tokens issued before the change are no longer trusted.
+
+The cache is per process: with several workers, a membership change is only
+guaranteed to be seen by the worker that made it until the cache TTL (or the
+token) expires on the others.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity
+
+from config import Config
+from models import db, User
+from .cache import TTLCache
+
+Identity = namedtuple('Identity', ['user_id', 'family_id', 'is_family_admin'])
+
+identity_cache = TTLCache(maxsize=Config.IDENTITY_CACHE_SIZE, ttl=Config.IDENTITY_CACHE_TTL)
+
+# user_id -> wall-clock time of the last membership change.  Tokens issued
+# before that moment carry stale claims and must fall back to the database.
+_changed_at = {}
+_changed_lock = threading.Lock()
+
+
+def identity_of(user):
+    return Identity(user.id, user.family_id, bool(user.is_family_admin))
+
+
+def create_user_token(identity):
+    """Create an access token carrying the user's family claims."""
+    return create_access_token(identity=str(identity.user_id), additional_claims={
+        'family_id': identity.family_id,
+        'is_family_admin': identity.is_family_admin
+    })
+
+
+def _claims_are_stale(user_id, issued_at):
+    with _changed_lock:
+        changed_at = _changed_at.get(user_id)
+    return changed_at is not None and (issued_at is None or issued_at <= changed_at)
+
+
+def _load_identity(user_id):
+    row = db.session.query(User.family_id, User.is_family_admin).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    return Identity(user_id, row[0], bool(row[1]))
+
+
+def current_identity():
+    """
+    Return the ``Identity`` of the authenticated user, or None if the user no
+    longer exists.  Must be called inside a ``jwt_required`` view.
+    """
+    user_id = int(get_jwt_identity())
+    identity = identity_cache.get(user_id)
+    if identity is not None:
+        return identity
+
+    claims = get_jwt()
+    if 'family_id' in claims and not _claims_are_stale(user_id, claims.get('iat')):
+        identity = Identity(user_id, claims['family_id'], bool(claims.get('is_family_admin')))
+    else:
+        identity = _load_identity(user_id)
+        if identity is None:
+            return None
+
+    identity_cache.set(user_id, identity)
+    return identity
+
+
+def invalidate_identity(*user_ids):
+    """Drop cached identities after a family join, leave or role change."""
+    now = time.time()
+    max_age = current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()
+    with _changed_lock:
+        for user_id in user_ids:
+            if user_id is None:
+                continue
+            user_id = int(user_id)
+            identity_cache.pop(user_id)
+            _changed_at[user_id] = now
+        # Marks older than the token lifetime can no longer match any token
+        for user_id, changed_at in list(_changed_at.items()):
+            if now - changed_at > max_age:
+                del _changed_at[user_id]
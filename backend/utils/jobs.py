@@ -0,0 +1,220 @@
+"""
+Background jobs for reports too slow to compute inside a request.
+
+``JobRunner.submit`` records a ``ReportJob`` row and hands it to a local
+thread pool; the request returns the job id straight away.  Handlers
+registered with ``register_job`` receive the job's params and a
+``progress(percent)`` callback, and return a JSON-serializable result that is
+stored on the row.  Everything lives in the app database, so no broker or
+separate worker process is needed.
+
+Submitting the same (user, kind, params) while an identical job is still
+pending or running returns that job instead of starting another.  A unique
+index on ``active_key`` enforces this across requests and processes.
+While a process has jobs queued or running, a heartbeat thread touches
+their rows every ``JOB_HEARTBEAT_INTERVAL``.  Active jobs whose row has not
+been touched for ``JOB_STALE_AFTER`` lost their process (e.g. to a restart):
+they are marked failed and release their ``active_key``, so the next
+identical submission starts a fresh job instead of joining the dead one.
+The sweep runs on the heartbeat tick and before each submission; a status
+poll only checks the one job it reads.
+Finished jobs are deleted after ``JOB_RESULT_TTL``.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ReportJob
+from utils.background import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+_handlers = {}
+
+
+def register_job(kind, handler):
+    """Register ``handler(params, progress)`` for jobs of ``kind``."""
+    _handlers[kind] = handler
+
+
+def job_key(user_id, kind, params):
+    raw = json.dumps([user_id, kind, params], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at
+    }
+
+
+class JobRunner:
+    def __init__(self, app, max_workers):
+        self.app = app
+        self.max_workers = max_workers
+        self._executor = None
+        self._finished = {}  # job id -> Event, for jobs running in this process
+        self._lock = threading.Lock()
+        self._heartbeat = PeriodicWorker(app, 'report-job-heartbeat', self._tick, app.config['JOB_HEARTBEAT_INTERVAL'])
+
+    def _submit_to_pool(self, job_id):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='report-job')
+            self._finished[job_id] = threading.Event()
+        self._heartbeat.ensure_started()
+        self._executor.submit(self._run, job_id)
+
+    def _tick(self, app):
+        self.heartbeat()
+        self.expire(datetime.utcnow())
+
+    def heartbeat(self):
+        """Touch the rows of the jobs queued or running in this process so they don't count as stale."""
+        with self._lock:
+            local = list(self._finished)
+        if not local:
+            return
+        ReportJob.query.filter(ReportJob.id.in_(local), ReportJob.status.in_(ACTIVE_STATUSES)) \
+            .update({'updated_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+    def submit(self, user_id, kind, params):
+        """Start a job, or join the identical one in flight. Returns ``(job, created)``."""
+        if kind not in _handlers:
+            raise ValueError(f'Unknown job kind: {kind}')
+        key = job_key(user_id, kind, params)
+        self.expire(datetime.utcnow())
+
+        existing = ReportJob.query.filter_by(active_key=key).first()
+        if existing is not None:
+            return existing, False
+
+        job = ReportJob(id=uuid.uuid4().hex, user_id=user_id, kind=kind, params=params,
+                        active_key=key, status=STATUS_PENDING)
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Lost the race to an identical submission
+            db.session.rollback()
+            return ReportJob.query.filter_by(active_key=key).first(), False
+
+        self._submit_to_pool(job.id)
+        return job, True
+
+    def wait(self, job_id, timeout):
+        """
+        Block until the job finishes or ``timeout`` seconds pass.  A job running
+        in this process signals its event; one running elsewhere is polled
+        every ``JOB_POLL_INTERVAL``.
+        """
+        with self._lock:
+            finished = self._finished.get(job_id)
+        if finished is not None:
+            finished.wait(timeout)
+            return
+
+        interval = current_app.config['JOB_POLL_INTERVAL']
+        deadline = time.monotonic() + timeout
+        while True:
+            row = db.session.query(ReportJob.status, ReportJob.updated_at).filter_by(id=job_id).first()
+            db.session.rollback()  # end the read transaction so the next poll sees new commits
+            remaining = deadline - time.monotonic()
+            if row is None or row.status not in ACTIVE_STATUSES or remaining <= 0:
+                return
+            if self.expire_job(job_id, row.updated_at, datetime.utcnow()):
+                return
+            time.sleep(min(interval, remaining))
+
+    def expire_job(self, job_id, updated_at, now):
+        """
+        Fail one job last touched at ``updated_at`` if its process stopped
+        sending heartbeats.  Returns whether it did; a live job costs no write.
+        """
+        cutoff = now - timedelta(seconds=current_app.config['JOB_STALE_AFTER'])
+        with self._lock:
+            local = job_id in self._finished
+        if local or updated_at is None or updated_at >= cutoff:
+            return False
+        expired = ReportJob.query.filter(
+            ReportJob.id == job_id, ReportJob.status.in_(ACTIVE_STATUSES), ReportJob.updated_at < cutoff
+        ).update({'status': STATUS_FAILED, 'error': 'Interrupted', 'active_key': None, 'finished_at': now},
+                 synchronize_session=False)
+        db.session.commit()
+        return bool(expired)
+
+    def expire(self, now):
+        """Fail jobs whose process stopped sending heartbeats and delete old finished ones."""
+        config = current_app.config
+        with self._lock:
+            local = list(self._finished)
+        stale = ReportJob.query.filter(
+            ReportJob.status.in_(ACTIVE_STATUSES),
+            ReportJob.updated_at < now - timedelta(seconds=config['JOB_STALE_AFTER'])
+        )
+        if local:
+            stale = stale.filter(ReportJob.id.notin_(local))
+        stale.update({'status': STATUS_FAILED, 'error': 'Interrupted', 'active_key': None, 'finished_at': now},
+                     synchronize_session=False)
+        ReportJob.query.filter(
+            ReportJob.status.in_((STATUS_DONE, STATUS_FAILED)),
+            ReportJob.finished_at < now - timedelta(seconds=config['JOB_RESULT_TTL'])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def _set(self, job_id, **values):
+        values['updated_at'] = datetime.utcnow()
+        ReportJob.query.filter_by(id=job_id).update(values, synchronize_session=False)
+        db.session.commit()
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            try:
+                job = db.session.get(ReportJob, job_id)
+                kind, params = job.kind, job.params
+                self._set(job_id, status=STATUS_RUNNING)
+
+                def progress(percent):
+                    self._set(job_id, progress=max(0, min(99, int(percent))))
+
+                result = _handlers[kind](params, progress)
+                self._set(job_id, status=STATUS_DONE, progress=100, result=current_app.json.dumps(result),
+                          active_key=None, finished_at=datetime.utcnow())
+            except Exception as e:
+                logger.exception('Job %s failed', job_id)
+                db.session.rollback()
+                self._set(job_id, status=STATUS_FAILED, error=str(e)[:255], active_key=None,
+                          finished_at=datetime.utcnow())
+            finally:
+                with self._lock:
+                    finished = self._finished.pop(job_id, None)
+                if finished is not None:
+                    finished.set()
+
+
+def init_jobs(app):
+    """Create the app's job runner; its threads start with the first job."""
+    runner = JobRunner(app, app.config['JOB_WORKERS'])
+    app.extensions['jobs'] = runner
+    return runner
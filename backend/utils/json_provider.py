@@ -0,0 +1,56 @@
+"""
+orjson-backed JSON provider for Flask.
+
+Dates and datetimes are serialized natively by orjson (ISO 8601), so models
+can hand raw column values to ``jsonify`` instead of formatting every field
+with ``strftime``.  The stdlib fallback (``JSON_PROVIDER=default``) writes
+them the same way rather than as Flask's HTTP dates.
+"""
+from datetime import date, datetime
+
+import orjson
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+
+class ORJSONProvider(JSONProvider):
+    mimetype = 'application/json'
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_OMIT_MICROSECONDS
+
+    @staticmethod
+    def default(o):
+        # Decimal, UUID, dataclasses and friends, same as Flask's default provider
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self.option
+        if self._app.debug:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option),
+            mimetype=self.mimetype
+        )
+
+
+class ISODateJSONProvider(DefaultJSONProvider):
+    """Flask's stdlib provider with dates and datetimes in ISO 8601, as orjson writes them."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            return o.replace(microsecond=0).isoformat()
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+JSON_PROVIDERS = {
+    'default': ISODateJSONProvider,
+    'orjson': ORJSONProvider
+}
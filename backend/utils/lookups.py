@@ -0,0 +1,162 @@
+"""
+Per-user category and per-family member resolution for the transaction
+write path.
+
+Transactions reference categories and family members either by id or by
+name.  Both maps are cached in-process (bounded LRU with TTL) so a write in
+the common case needs no lookup queries at all.  On a cache miss the
+database is consulted before anything is auto-created, so a stale cache
+never produces duplicates.  The category and member CRUD routes invalidate
+the affected entries.
+"""
+from collections import namedtuple
+
+from config import Config
+from models import db, Category, FamilyMember
+from .cache import TTLCache
+
+CategoryRef = namedtuple('CategoryRef', ['id', 'name'])
+
+category_cache = TTLCache(maxsize=Config.LOOKUP_CACHE_SIZE, ttl=Config.LOOKUP_CACHE_TTL)
+member_cache = TTLCache(maxsize=Config.LOOKUP_CACHE_SIZE, ttl=Config.LOOKUP_CACHE_TTL)
+
+
+class CategoryMap:
+    """A user's categories keyed by id and by (name, type)."""
+
+    def __init__(self, rows):
+        self.by_id = {}
+        self.by_name = {}
+        for category_id, name, category_type in rows:
+            self.add(category_id, name, category_type)
+
+    def add(self, category_id, name, category_type):
+        self.by_id[category_id] = name
+        self.by_name[(name, category_type)] = category_id
+
+
+class MemberMap:
+    """A family's members keyed by id and by name."""
+
+    def __init__(self, rows):
+        self.ids = set()
+        self.by_name = {}
+        for member_id, name in rows:
+            self.add(member_id, name)
+
+    def add(self, member_id, name):
+        self.ids.add(member_id)
+        self.by_name.setdefault(name, member_id)
+
+
+def _is_id(value):
+    return isinstance(value, int) or (isinstance(value, str) and value.isdigit())
+
+
+def _category_map(user_id):
+    categories = category_cache.get(user_id)
+    if categories is None:
+        rows = db.session.query(Category.id, Category.name, Category.type).filter(
+            Category.user_id == user_id
+        ).all()
+        categories = CategoryMap(rows)
+        category_cache.set(user_id, categories)
+    return categories
+
+
+def _member_map(family_id):
+    members = member_cache.get(family_id)
+    if members is None:
+        rows = db.session.query(FamilyMember.id, FamilyMember.name).filter(
+            FamilyMember.family_id == family_id
+        ).all()
+        members = MemberMap(rows)
+        member_cache.set(family_id, members)
+    return members
+
+
+def resolve_category(identity, value, category_type):
+    """
+    Resolve a category id or name to a ``CategoryRef``, auto-creating named
+    categories like the transaction routes always have.  Returns None when an
+    id does not exist.
+    """
+    categories = _category_map(identity.user_id)
+
+    if _is_id(value):
+        category_id = int(value)
+        name = categories.by_id.get(category_id)
+        if name is None:
+            category = db.session.get(Category, category_id)
+            if not category:
+                return None
+            name = categories.by_id[category_id] = category.name
+        return CategoryRef(category_id, name)
+
+    category_id = categories.by_name.get((value, category_type))
+    if category_id is not None:
+        return CategoryRef(category_id, value)
+
+    category = Category.query.filter_by(name=value, user_id=identity.user_id, type=category_type).first()
+    if not category:
+        category = Category(
+            name=value,
+            type=category_type,
+            icon='📊',  # Default icon
+            color='#94A3B8',  # Default color
+            description=f'Auto-created {category_type} category',
+            user_id=identity.user_id,
+            family_id=identity.family_id
+        )
+        db.session.add(category)
+        db.session.flush()  # Get the ID without committing
+        # Not cached yet: the caller may still roll back
+        return CategoryRef(category.id, category.name)
+
+    categories.add(category.id, category.name, category.type)
+    return CategoryRef(category.id, category.name)
+
+
+def resolve_family_member(family_id, value):
+    """
+    Resolve a family member id or name within a family, auto-creating named
+    members.  Returns None when an id does not belong to the family.
+    """
+    members = _member_map(family_id)
+
+    if _is_id(value):
+        member_id = int(value)
+        if member_id in members.ids:
+            return member_id
+        member = db.session.get(FamilyMember, member_id)
+        if not member or member.family_id != family_id:
+            return None
+        members.add(member.id, member.name)
+        return member_id
+
+    member_id = members.by_name.get(value)
+    if member_id is not None:
+        return member_id
+
+    member = FamilyMember.query.filter_by(name=value, family_id=family_id).first()
+    if not member:
+        member = FamilyMember(
+            name=value,
+            role='Member',  # Default role
+            family_id=family_id
+        )
+        db.session.add(member)
+        db.session.flush()  # Get the ID without committing
+        return member.id
+
+    members.add(member.id, member.name)
+    return member.id
+
+
+def invalidate_categories(user_id):
+    category_cache.pop(int(user_id))
+
+
+def invalidate_family_members(family_id):
+    if family_id is not None:
+        member_cache.pop(int(family_id))
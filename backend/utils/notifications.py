@@ -0,0 +1,174 @@
+"""
+Push delivery of AINotifications over server-sent events.
+
+``broker`` is an in-process publish/subscribe hub: every open
+``/api/ai/notifications/stream`` holds a bounded queue subscribed to its
+user.  Notifications are published only once the transaction that inserted
+them commits, whether they were added through the ORM or inserted in bulk
+(see ``publish_after_commit``), so a client never sees a row that was rolled
+back.
+
+The broker lives in one process.  With several workers, a client only hears
+about notifications created by the worker it is connected to.  Streams are
+closed after ``NOTIFICATION_STREAM_MAX_AGE`` and the reconnect replays
+anything newer than the browser's ``Last-Event-ID``, so nothing is lost,
+only delayed.
+
+``purge_notifications`` is the retention job: it deletes read notifications
+older than ``NOTIFICATION_RETENTION_DAYS``, a short chunk per transaction, so
+request writers never wait long on the database lock.  It seeks the
+``(read, created_at)`` index straight to the expired rows.  Budget alerts
+are kept until the month they are about has ended, since their
+``dedup_key`` is what stops a still-exceeded budget from alerting again.
+"""
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, tuple_
+
+from config import Config
+from models import db, AINotification
+from .background import PeriodicWorker
+
+# Put on a subscriber's queue when it overflowed; the client reloads instead
+RESYNC = object()
+
+_PENDING_KEY = 'notifications_to_publish'
+
+
+def notification_to_dict(notification):
+    """Response shape of an AINotification (ORM object or row)."""
+    return {
+        'id': notification.id,
+        'type': notification.type,
+        'kind': notification.kind,
+        'message': notification.message,
+        'priority': notification.priority,
+        'read': bool(notification.read),
+        'timestamp': notification.created_at
+    }
+
+
+class NotificationBroker:
+    """Fan out published notifications to the queues subscribed to each user."""
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, user_id, message):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(message)
+            except queue.Full:
+                # Slow client: drop its backlog and tell it to reload the first page
+                with subscription.mutex:
+                    subscription.queue.clear()
+                subscription.put_nowait(RESYNC)
+
+
+broker = NotificationBroker(Config.NOTIFICATION_STREAM_QUEUE)
+
+
+def _encode(payload):
+    if has_app_context():
+        return current_app.json.dumps(payload)
+    return json.dumps(payload, default=str)
+
+
+def publish_after_commit(session, notifications):
+    """Publish ``notifications`` (rows or objects) once ``session`` commits."""
+    pending = session.info.setdefault(_PENDING_KEY, [])
+    pending.extend((int(n.user_id), n.id, _encode(notification_to_dict(n))) for n in notifications)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_new_notifications(session, flush_context):
+    added = [obj for obj in session.new if isinstance(obj, AINotification)]
+    if added:
+        publish_after_commit(session, added)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_committed(session):
+    for user_id, notification_id, data in session.info.pop(_PENDING_KEY, ()):
+        broker.publish(user_id, (notification_id, data))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _guards_alert(kind, dedup_key, alert_kinds, current_month):
+    """Whether a notification still deduplicates a budget alert (``kind:category:YYYY-MM``) for a month not over yet."""
+    return kind in alert_kinds and bool(dedup_key) and dedup_key.rsplit(':', 1)[-1] >= current_month
+
+
+def purge_notifications(app):
+    """Delete expired read notifications in chunks. Returns the number deleted."""
+    config = app.config
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=config['NOTIFICATION_RETENTION_DAYS'])
+    current_month = now.strftime('%Y-%m')
+    alert_kinds = {kind for _, kind in config['BUDGET_ALERT_THRESHOLDS']}
+    chunk = config['NOTIFICATION_PURGE_CHUNK']
+    table = AINotification.__table__
+    position, deleted = None, 0
+
+    while True:
+        # Seek the (read, created_at) index; kept alerts are stepped over rather than scanned again
+        query = select(table.c.id, table.c.created_at, table.c.kind, table.c.dedup_key).where(
+            table.c.read == True, table.c.created_at < cutoff  # noqa: E712
+        )
+        if position is not None:
+            query = query.where(tuple_(table.c.created_at, table.c.id) > position)
+        rows = db.session.execute(query.order_by(table.c.created_at, table.c.id).limit(chunk)).all()
+        if rows:
+            position = (rows[-1].created_at, rows[-1].id)
+        expired = [row.id for row in rows
+                   if not _guards_alert(row.kind, row.dedup_key, alert_kinds, current_month)]
+        if expired:
+            db.session.execute(table.delete().where(table.c.id.in_(expired)))
+            deleted += len(expired)
+        db.session.commit()
+
+        if len(rows) < chunk:
+            return deleted
+        time.sleep(config['NOTIFICATION_PURGE_PAUSE'])
+
+
+def init_notification_retention(app):
+    """Create the retention worker; it starts with the first request."""
+    worker = PeriodicWorker(app, 'notification-retention', purge_notifications,
+                            app.config['NOTIFICATION_PURGE_INTERVAL'],
+                            enabled=app.config['NOTIFICATION_RETENTION_ENABLED'])
+    app.before_request(worker.ensure_started)
+    return worker
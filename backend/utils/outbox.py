@@ -0,0 +1,127 @@
+"""
+Transactional email outbox.
+
+Routes call ``queue_email()`` before committing, so the message is stored
+atomically with whatever triggered it (e.g. an Invitation) and the request
+returns without talking to SMTP.  A background worker claims due messages in
+batches and sends each batch over a single SMTP connection.  Failures are
+retried with exponential backoff until ``OUTBOX_MAX_ATTEMPTS`` is reached.
+
+Claiming sets ``next_attempt_at`` a lease into the future, so a message whose
+worker died mid-send is picked up again once the lease expires.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta
+from smtplib import SMTPServerDisconnected
+
+from flask_mail import Message
+
+from models import db, EmailOutbox
+from .background import PeriodicWorker
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+
+def queue_email(recipient, subject, body):
+    """Add a message to the outbox in the current session; the caller commits."""
+    message = EmailOutbox(recipient=recipient, subject=subject, body=body)
+    db.session.add(message)
+    return message
+
+
+def retry_delay(config, attempts):
+    delay = config['OUTBOX_RETRY_BASE'] * (2 ** (attempts - 1))
+    return timedelta(seconds=min(delay, config['OUTBOX_RETRY_MAX']))
+
+
+def _claim_batch(config, now):
+    due = db.session.query(EmailOutbox.id).filter(
+        EmailOutbox.status == STATUS_PENDING,
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(config['OUTBOX_BATCH_SIZE'])
+
+    claim = uuid.uuid4().hex
+    claimed = EmailOutbox.query.filter(
+        EmailOutbox.id.in_(due.scalar_subquery()),
+        EmailOutbox.status == STATUS_PENDING,
+        EmailOutbox.next_attempt_at <= now
+    ).update({
+        'claimed_by': claim,
+        'next_attempt_at': now + timedelta(seconds=config['OUTBOX_LEASE'])
+    }, synchronize_session=False)
+    db.session.commit()
+
+    if not claimed:
+        return []
+    return EmailOutbox.query.filter_by(claimed_by=claim).order_by(EmailOutbox.id).all()
+
+
+def _record_failure(config, message, error, now):
+    message.attempts += 1
+    message.last_error = str(error)[:255]
+    message.claimed_by = None
+    if message.attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+        message.status = STATUS_FAILED
+        logger.error('Giving up on email %s to %s: %s', message.id, message.recipient, error)
+    else:
+        message.next_attempt_at = now + retry_delay(config, message.attempts)
+        logger.warning('Email %s to %s failed (attempt %s): %s',
+                       message.id, message.recipient, message.attempts, error)
+
+
+def send_pending(app):
+    """Send every due message, one SMTP connection per batch. Returns the number sent."""
+    config = app.config
+    mail = app.extensions['mail']
+    sender = config['MAIL_DEFAULT_SENDER']
+    total = 0
+
+    while True:
+        batch = _claim_batch(config, datetime.utcnow())
+        if not batch:
+            return total
+
+        sent = 0
+        try:
+            with mail.connect() as connection:
+                for message in batch:
+                    try:
+                        connection.send(Message(
+                            message.subject,
+                            sender=sender,
+                            recipients=[message.recipient],
+                            body=message.body
+                        ))
+                    except SMTPServerDisconnected:
+                        raise
+                    except Exception as e:
+                        _record_failure(config, message, e, datetime.utcnow())
+                        continue
+                    message.status = STATUS_SENT
+                    message.sent_at = datetime.utcnow()
+                    message.claimed_by = None
+                    sent += 1
+        except Exception as e:
+            # Could not connect, or the connection dropped: retry whatever is left
+            now = datetime.utcnow()
+            for message in batch:
+                if message.claimed_by is not None:
+                    _record_failure(config, message, e, now)
+        db.session.commit()
+
+        total += sent
+        if sent == 0 or len(batch) < config['OUTBOX_BATCH_SIZE']:
+            return total
+
+
+def init_outbox(app):
+    """Create the outbox worker; it starts with the first request."""
+    worker = PeriodicWorker(app, 'email-outbox', send_pending, app.config['OUTBOX_POLL_INTERVAL'],
+                            enabled=app.config['OUTBOX_WORKER_ENABLED'])
+    app.before_request(worker.ensure_started)
+    return worker
@@ -0,0 +1,70 @@
+"""
+Password hashing and verification on a bounded worker pool.
+
+bcrypt is deliberately slow.  Running it inline lets a burst of logins take
+every CPU core away from the rest of the API.  Hashing is instead capped at
+``PASSWORD_HASH_WORKERS`` concurrent operations.  Up to
+``PASSWORD_HASH_QUEUE`` more may wait, and anything beyond that is rejected
+right away with :class:`PasswordHasherBusy`, so clients can retry.  A call
+that waits longer than ``PASSWORD_HASH_TIMEOUT`` raises the same exception.
+bcrypt releases the GIL, so the workers run truly in parallel.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from config import Config
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full or a hash didn't finish in time."""
+
+
+class PasswordHasher:
+    def __init__(self, rounds=12, workers=2, max_pending=32, timeout=10):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()  # drop it if it is still queued; a running hash finishes and frees its slot
+            raise PasswordHasherBusy() from None
+
+    def hash(self, password):
+        """Return a bcrypt hash (bytes) using the configured cost."""
+        return self._run(self._hash, password.encode('utf-8'), self.rounds)
+
+    def verify(self, password, hashed):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        """True when a stored hash was made with a different cost factor."""
+        try:
+            return int(hashed.split(b'$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return False
+
+    @staticmethod
+    def _hash(password, rounds):
+        return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+password_hasher = PasswordHasher(
+    rounds=Config.BCRYPT_LOG_ROUNDS,
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_QUEUE,
+    timeout=Config.PASSWORD_HASH_TIMEOUT
+)
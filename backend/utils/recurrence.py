@@ -0,0 +1,262 @@
+"""
+Recurring transactions.
+
+A ``RecurrenceRule`` describes a repeating transaction (rent, a salary, a
+subscription).  ``occurrences`` expands one rule lazily, and
+``iter_occurrences`` merges many rules into a single date-ordered stream.
+Forecasts can then walk any horizon without materializing future rows:
+``committed_amounts`` feeds the report predictions and
+``/api/recurrences/forecast`` lists the months ahead.
+
+``materialize_recurrences`` is the scheduler job.  It walks active rules in
+chunks and creates each rule's instances that have come due (up to today),
+so they show up in the ledger, analytics and alerts like any other
+transaction.  Occurrences after today are never stored: the ledger,
+budgets and analytics only see money that has actually moved, and
+forecasts expand the rules instead.  Each chunk is one set-based INSERT: ``ON CONFLICT DO NOTHING``
+on the unique ``(recurrence_id, date)`` index makes re-runs and overlapping
+runs harmless.  ``materialized_through`` then records how far each rule got.
+The inserts bypass the ORM, so the job itself re-indexes the new rows for
+search, adds them to the spending sketches and daily balances, runs them
+through the budget alerts and bumps the data versions.
+"""
+import calendar
+import heapq
+import logging
+from datetime import date, timedelta
+from itertools import count
+
+from flask import current_app
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from analytics.balance import update_balances
+from analytics.sketches import update_sketches
+from models import db, Category, RecurrenceRule, Transaction
+from .alerts import update_alerts
+from .background import PeriodicWorker
+from .transaction_search import index_transactions
+from .versioning import SCOPE_FAMILY, SCOPE_USER, bump_version, family_month_scope, user_month_scope
+
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+
+_RULE_COLUMNS = (
+    RecurrenceRule.id, RecurrenceRule.user_id, RecurrenceRule.family_id, RecurrenceRule.type,
+    RecurrenceRule.amount, RecurrenceRule.category_id, RecurrenceRule.description,
+    RecurrenceRule.family_member_id, RecurrenceRule.frequency, RecurrenceRule.interval,
+    RecurrenceRule.start_date, RecurrenceRule.end_date, RecurrenceRule.materialized_through
+)
+
+
+def _add_months(start, months):
+    """``start`` moved by ``months``, clamped to the end of shorter months."""
+    index = start.year * 12 + start.month - 1 + months
+    year, month = divmod(index, 12)
+    return date(year, month + 1, min(start.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def _nth(rule, n):
+    step = n * (rule.interval or 1)
+    if rule.frequency == 'daily':
+        return rule.start_date + timedelta(days=step)
+    if rule.frequency == 'weekly':
+        return rule.start_date + timedelta(weeks=step)
+    if rule.frequency == 'monthly':
+        return _add_months(rule.start_date, step)
+    if rule.frequency == 'yearly':
+        return _add_months(rule.start_date, 12 * step)
+    raise ValueError(f'Unknown frequency: {rule.frequency}')
+
+
+def _first_index_after(rule, after):
+    """A lower bound on the index of the first occurrence after ``after``."""
+    if after is None or after < rule.start_date:
+        return 0
+    interval = rule.interval or 1
+    if rule.frequency in ('daily', 'weekly'):
+        days = 1 if rule.frequency == 'daily' else 7
+        return (after - rule.start_date).days // (days * interval)
+    months = (after.year - rule.start_date.year) * 12 + after.month - rule.start_date.month
+    return max(0, months // (interval * (12 if rule.frequency == 'yearly' else 1)) - 1)
+
+
+def occurrences(rule, after=None, until=None):
+    """Dates of ``rule`` (ORM object or row) after ``after`` and up to ``until``, generated lazily."""
+    last = rule.end_date
+    if until is not None and (last is None or until < last):
+        last = until
+    for n in count(_first_index_after(rule, after)):
+        day = _nth(rule, n)
+        if last is not None and day > last:
+            return
+        if after is None or day > after:
+            yield day
+
+
+def iter_occurrences(rules, after=None, until=None):
+    """``(date, rule)`` for every occurrence of ``rules``, merged in date order, generated lazily."""
+    def stream(index, rule):
+        for day in occurrences(rule, after, until):
+            yield day, index, rule
+
+    for day, _, rule in heapq.merge(*(stream(index, rule) for index, rule in enumerate(rules))):
+        yield day, rule
+
+
+def committed_amounts(user_id, family_id, months_ahead, transaction_type='expense'):
+    """
+    ``{category name: [amount per month]}`` the user's and family's active
+    rules will post in each of the ``months_ahead`` months after this one,
+    expanded lazily.
+    """
+    owner_filter = RecurrenceRule.user_id == user_id
+    if family_id:
+        owner_filter = or_(owner_filter, RecurrenceRule.family_id == family_id)
+    rows = db.session.query(RecurrenceRule, Category.name).join(
+        Category, RecurrenceRule.category_id == Category.id
+    ).filter(owner_filter, RecurrenceRule.active == True, RecurrenceRule.type == transaction_type).all()  # noqa: E712
+    if not rows:
+        return {}
+
+    this_month = date.today().replace(day=1)
+    after = this_month + timedelta(days=calendar.monthrange(this_month.year, this_month.month)[1] - 1)
+    until = _add_months(this_month, months_ahead + 1) - timedelta(days=1)
+    names = {rule.id: name for rule, name in rows}
+    committed = {}
+    for day, rule in iter_occurrences([rule for rule, _ in rows], after=after, until=until):
+        index = (day.year - after.year) * 12 + day.month - after.month - 1
+        committed.setdefault(names[rule.id], [0.0] * months_ahead)[index] += rule.amount
+    return committed
+
+
+def rule_from_transaction(transaction, frequency='monthly', interval=1):
+    """
+    A rule repeating ``transaction``, which becomes its first instance.  It
+    repeats from now on: periods between a past-dated transaction and today
+    are not backfilled.
+    """
+    return RecurrenceRule(
+        user_id=transaction.user_id, family_id=transaction.family_id, type=transaction.type,
+        amount=transaction.amount, category_id=transaction.category_id, description=transaction.description,
+        family_member_id=transaction.family_member_id, frequency=frequency, interval=interval,
+        start_date=transaction.date, materialized_through=max(transaction.date, date.today())
+    )
+
+
+def remove_future_instances(rule_id, keep=None):
+    """Delete instances after today (but ``keep``) through the ORM, so search, totals and versions follow."""
+    query = Transaction.query.filter(Transaction.recurrence_id == rule_id, Transaction.date > date.today())
+    if keep is not None:
+        query = query.filter(Transaction.id != keep)
+    for transaction in query.all():
+        db.session.delete(transaction)
+
+
+def stop_recurrence(rule, keep=None):
+    """Deactivate ``rule``; instances after today other than ``keep`` are removed, past ones stay in the ledger."""
+    rule.active = False
+    remove_future_instances(rule.id, keep)
+
+
+def _insert_instances(connection, rows):
+    """Insert generated transactions, skipping ones that already exist. Returns the inserted rows."""
+    insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+    table = Transaction.__table__
+    statement = insert(table).on_conflict_do_nothing(index_elements=['recurrence_id', 'date']).returning(
+        table.c.id, table.c.user_id, table.c.family_id, table.c.type, table.c.category_id, table.c.date,
+        table.c.amount, table.c.description
+    )
+    return connection.execute(statement, rows).all()
+
+
+def _after_bulk_insert(connection, inserted):
+    """What the ORM flush hooks would have done for ``inserted`` transactions."""
+    if current_app.extensions.get('transaction_search'):
+        index_transactions(connection, [row.id for row in inserted])
+    update_sketches(connection, inserted)
+    update_balances(connection, inserted)
+    update_alerts(db.session, inserted)
+
+    scopes = set()
+    for row in inserted:
+        month = row.date.strftime('%Y-%m')
+        scopes.update({(SCOPE_USER, row.user_id), (user_month_scope(month), row.user_id)})
+        if row.family_id:
+            scopes.update({(SCOPE_FAMILY, row.family_id), (family_month_scope(month), row.family_id)})
+    for scope, scope_id in sorted(scopes):
+        bump_version(connection, scope, scope_id)
+
+
+def materialize_recurrences(app, through=None, rule_ids=None):
+    """Create instances of active rules up to ``through`` (default: today). Returns how many."""
+    config = app.config
+    through = through or date.today()
+    after_id, created = 0, 0
+
+    while True:
+        query = select(*_RULE_COLUMNS).where(
+            RecurrenceRule.active == True,  # noqa: E712
+            RecurrenceRule.id > after_id,
+            or_(RecurrenceRule.materialized_through.is_(None), RecurrenceRule.materialized_through < through)
+        )
+        if rule_ids is not None:
+            query = query.where(RecurrenceRule.id.in_(list(rule_ids)))
+        rules = db.session.execute(query.order_by(RecurrenceRule.id).limit(config['RECURRENCE_CHUNK'])).all()
+        if not rules:
+            break
+
+        rows = [{
+            'user_id': rule.user_id,
+            'family_id': rule.family_id,
+            'type': rule.type,
+            'amount': rule.amount,
+            'category_id': rule.category_id,
+            'description': rule.description,
+            'date': day,
+            'family_member_id': rule.family_member_id,
+            'is_recurring': True,
+            'recurrence_id': rule.id
+        } for rule in rules for day in occurrences(rule, rule.materialized_through, through)]
+
+        connection = db.session.connection()
+        if rows:
+            inserted = _insert_instances(connection, rows)
+            if inserted:
+                _after_bulk_insert(connection, inserted)
+            created += len(inserted)
+        connection.execute(
+            update(RecurrenceRule)
+            .where(RecurrenceRule.id.in_([rule.id for rule in rules]))
+            .values(materialized_through=through)
+        )
+        db.session.commit()
+        after_id = rules[-1].id
+
+    if created:
+        logger.info('Materialized %d recurring transactions through %s', created, through)
+    return created
+
+
+def materialize_saved(app, rule_ids):
+    """
+    Generate the due instances of just-committed rules.  A failure is logged
+    and left to the next scheduler run rather than failing the request that
+    saved the rule.
+    """
+    try:
+        return materialize_recurrences(app, rule_ids=rule_ids)
+    except Exception:
+        logger.exception('Materializing recurrences %s failed; the scheduler will retry', rule_ids)
+        db.session.rollback()
+        return 0
+
+
+def init_recurrence_scheduler(app):
+    """Create the materialization worker; it starts with the first request."""
+    worker = PeriodicWorker(app, 'recurrences', materialize_recurrences, app.config['RECURRENCE_INTERVAL'],
+                            enabled=app.config['RECURRENCE_ENABLED'])
+    app.extensions['recurrences'] = worker
+    app.before_request(worker.ensure_started)
+    return worker
@@ -0,0 +1,162 @@
+"""
+User search for the family invite dialog.
+
+On SQLite, a ``user_search`` FTS5 table with the trigram tokenizer indexes
+user emails and names for substring matching.  It uses external content (the
+``user`` table itself), and triggers keep it current on every insert, update
+and delete.  Queries shorter than a trigram use indexed prefix range scans on
+``lower(email)`` / ``lower(name)`` instead.  Other backends, or SQLite builds
+without FTS5 trigram support, fall back to the old ``ILIKE`` scan.
+
+Results are ranked: email prefix matches first, then name prefix matches,
+then other substring matches by how early the match starts and how short the
+email is.  (FTS5's bm25 ``rank`` is not used: it needs statistics over every
+match and is 20x slower for common trigrams such as a mail domain.)  Results
+are cached briefly, because the dialog searches on every keystroke.
+"""
+import logging
+
+from flask import current_app
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+from models import db, User
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM = 3
+search_cache = TTLCache(maxsize=Config.USER_SEARCH_CACHE_SIZE, ttl=Config.USER_SEARCH_CACHE_TTL)
+
+USER_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+        email, name, content='user', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON "user" BEGIN
+        INSERT INTO user_search(rowid, email, name) VALUES (new.id, new.email, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON "user" BEGIN
+        INSERT INTO user_search(user_search, rowid, email, name) VALUES ('delete', old.id, old.email, old.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF email, name ON "user" BEGIN
+        INSERT INTO user_search(user_search, rowid, email, name) VALUES ('delete', old.id, old.email, old.name);
+        INSERT INTO user_search(rowid, email, name) VALUES (new.id, new.email, new.name);
+    END""",
+    'CREATE INDEX IF NOT EXISTS ix_user_email_lower ON "user" (lower(email))',
+    'CREATE INDEX IF NOT EXISTS ix_user_name_lower ON "user" (lower(name))',
+]
+
+
+def install_fts(name, ddl, populate):
+    """
+    Run ``ddl`` and, when the FTS table ``name`` is new, ``populate(connection)``
+    to index the rows that existed before it.  Needs an app context.  Returns
+    False when this SQLite build cannot create the table.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with db.engine.begin() as connection:
+            exists = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+            ).first()
+            for statement in ddl:
+                connection.exec_driver_sql(statement)
+            if not exists:
+                populate(connection)
+    except OperationalError as e:
+        logger.warning('FTS5 table %s unavailable, falling back to LIKE: %s', name, e)
+        return False
+    return True
+
+
+def _rebuild_user_search(connection):
+    connection.exec_driver_sql("INSERT INTO user_search(user_search) VALUES ('rebuild')")
+
+
+def init_user_search(app):
+    """Create the user search index and triggers. Call after db.create_all()."""
+    with app.app_context():
+        app.extensions['user_search'] = install_fts('user_search', USER_SEARCH_DDL, _rebuild_user_search)
+
+
+def _fts_phrase(query):
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _prefix_upper_bound(prefix):
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _prefix_ids(column, query, limit):
+    lowered = func.lower(column)
+    rows = db.session.query(User.id).filter(
+        lowered >= query, lowered < _prefix_upper_bound(query)
+    ).order_by(lowered).limit(limit)
+    return [row.id for row in rows]
+
+
+def _substring_ids(query, limit):
+    rows = db.session.execute(text(
+        'SELECT rowid FROM user_search WHERE user_search MATCH :phrase LIMIT :limit'
+    ), {'phrase': _fts_phrase(query), 'limit': limit})
+    return [row.rowid for row in rows]
+
+
+def _serialize(user):
+    return {
+        'id': user.id,
+        'email': user.email,
+        'name': user.name,
+        'profile_image': user.profile_image
+    }
+
+
+def _rank(user, query):
+    email = user.email.lower()
+    name = (user.name or '').lower()
+    if email.startswith(query):
+        tier, position = 0, 0
+    elif name.startswith(query) or f' {query}' in name:
+        tier, position = 1, 0
+    else:
+        tier, position = 2, email.find(query) % (len(email) + 1)
+    return tier, position, len(email), user.id
+
+
+def _indexed_search(query, limit):
+    candidates = set(_prefix_ids(User.email, query, limit))
+    candidates.update(_prefix_ids(User.name, query, limit))
+    if len(query) >= TRIGRAM:
+        candidates.update(_substring_ids(query, Config.USER_SEARCH_CANDIDATES))
+    if not candidates:
+        return []
+
+    users = db.session.query(User.id, User.email, User.name, User.profile_image).filter(
+        User.id.in_(candidates)
+    ).all()
+    users.sort(key=lambda user: _rank(user, query))
+    return [_serialize(user) for user in users[:limit]]
+
+
+def _scan_search(query, limit):
+    users = User.query.filter(User.email.ilike(f'%{query}%')).limit(limit).all()
+    return [_serialize(user) for user in users]
+
+
+def find_users(query, limit=5):
+    """Return up to ``limit`` users whose email or name contains ``query``."""
+    query = query.strip().lower()
+    if not query:
+        return []
+
+    key = (query, limit)
+    results = search_cache.get(key)
+    if results is None:
+        if current_app.extensions.get('user_search'):
+            results = _indexed_search(query, limit)
+        else:
+            results = _scan_search(query, limit)
+        search_cache.set(key, results)
+    return results
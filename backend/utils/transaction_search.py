@@ -0,0 +1,280 @@
+"""
+Full-text search over transaction descriptions and category names.
+
+The ``transaction_search`` FTS5 table holds one row per transaction (rowid =
+transaction id).  Every word is indexed once per owner that may search it,
+prefixed with the owner: ``u<user_id>_coffee`` and, for family transactions,
+``f<family_id>_coffee``.  A query therefore only touches the doclists of its
+own scope.  Prefix matching and bm25 ranking cost the same for one user's
+ledger whether the table holds a thousand rows or millions.  With a single
+shared vocabulary, every query would have to intersect the whole table's
+doclist for a common word.
+
+Scoped terms can't be produced by an SQL trigger, so the index is maintained
+from an ``after_flush`` hook (like the data versions) for every ORM write to
+a transaction, and re-indexes a category's transactions when it is renamed.
+Rows written around the ORM can be re-indexed with ``index_transactions()``.
+
+Results are ordered by bm25 relevance, or by date, and paginated with an
+opaque keyset cursor.  Without FTS5 the search falls back to ``ILIKE`` over
+the scope's rows (date order only).
+"""
+import base64
+import json
+import re
+import unicodedata
+from datetime import date
+
+from flask import current_app, has_app_context
+from sqlalchemy import and_, column, event, inspect, or_, select, table, text
+
+from models import db, Transaction, Category, FamilyMember
+from .search import install_fts
+
+WORD_RE = re.compile(r'\w+')
+SORT_RELEVANCE = 'relevance'
+SORT_DATE = 'date'
+INDEX_CHUNK = 1000
+
+# Only fields that change the indexed document trigger a re-index
+_INDEXED_FIELDS = ('user_id', 'family_id', 'description', 'category_id')
+
+TRANSACTION_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS transaction_search USING fts5(
+        description, category, tokenize="unicode61 tokenchars '_'"
+    )""",
+]
+
+transaction_search = table('transaction_search', column('rowid'), column('rank'))
+
+TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.type,
+    Transaction.amount,
+    Category.name,
+    Transaction.description,
+    Transaction.date,
+    FamilyMember.name,
+    Transaction.is_recurring
+)
+
+
+class InvalidCursor(ValueError):
+    """Raised for a malformed pagination cursor or one from a different sort order."""
+
+
+def words(value):
+    """Lower-cased, accent-folded word tokens of ``value``."""
+    folded = unicodedata.normalize('NFKD', (value or '').lower())
+    return WORD_RE.findall(''.join(ch for ch in folded if not unicodedata.combining(ch)))
+
+
+def _owners(user_id, family_id):
+    return [f'u{user_id}'] + ([f'f{family_id}'] if family_id else [])
+
+
+def _scoped(owners, value):
+    tokens = words(value)
+    return ' '.join(f'{owner}_{token}' for owner in owners for token in tokens)
+
+
+def index_transactions(connection, transaction_ids):
+    """(Re)build the search rows of ``transaction_ids`` on ``connection``."""
+    transaction_ids = sorted(set(transaction_ids))
+    for start in range(0, len(transaction_ids), INDEX_CHUNK):
+        chunk = transaction_ids[start:start + INDEX_CHUNK]
+        connection.execute(text('DELETE FROM transaction_search WHERE rowid = :id'), [{'id': i} for i in chunk])
+        rows = connection.execute(
+            select(Transaction.id, Transaction.user_id, Transaction.family_id, Transaction.description, Category.name)
+            .outerjoin(Category, Transaction.category_id == Category.id)
+            .where(Transaction.id.in_(chunk))
+        ).all()
+        _insert_documents(connection, rows)
+
+
+def _insert_documents(connection, rows):
+    documents = []
+    for row_id, user_id, family_id, description, category in rows:
+        owners = _owners(user_id, family_id)
+        documents.append({
+            'id': row_id,
+            'description': _scoped(owners, description),
+            'category': _scoped(owners, category)
+        })
+    if documents:
+        connection.execute(text(
+            'INSERT INTO transaction_search(rowid, description, category) VALUES (:id, :description, :category)'
+        ), documents)
+
+
+def _index_all(connection):
+    """Index every existing transaction; used when the table is first created."""
+    result = connection.execution_options(yield_per=INDEX_CHUNK).execute(
+        select(Transaction.id, Transaction.user_id, Transaction.family_id, Transaction.description, Category.name)
+        .outerjoin(Category, Transaction.category_id == Category.id)
+    )
+    for rows in result.partitions():
+        _insert_documents(connection, rows)
+
+
+def init_transaction_search(app):
+    """Create the transaction search index. Call after db.create_all()."""
+    with app.app_context():
+        app.extensions['transaction_search'] = install_fts(
+            'transaction_search', TRANSACTION_SEARCH_DDL, _index_all
+        )
+
+
+@event.listens_for(db.session, 'after_flush')
+def _index_transactions_after_flush(session, flush_context):
+    if not has_app_context() or not current_app.extensions.get('transaction_search'):
+        return
+
+    changed, removed, renamed_categories = set(), set(), set()
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Transaction):
+            state = inspect(obj)
+            if obj in session.new or any(state.attrs[f].history.has_changes() for f in _INDEXED_FIELDS):
+                changed.add(obj.id)
+        elif isinstance(obj, Category) and obj not in session.new:
+            if inspect(obj).attrs.name.history.has_changes():
+                renamed_categories.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Transaction):
+            removed.add(obj.id)
+
+    if not (changed or removed or renamed_categories):
+        return
+    connection = session.connection()
+    if renamed_categories:
+        changed.update(connection.execute(
+            select(Transaction.id).where(Transaction.category_id.in_(renamed_categories))
+        ).scalars())
+    if removed:
+        connection.execute(text('DELETE FROM transaction_search WHERE rowid = :id'), [{'id': i} for i in removed])
+    index_transactions(connection, changed - removed)
+
+
+def encode_cursor(sort, key, row_id):
+    raw = json.dumps([sort, key, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, key, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if cursor_sort != sort:
+        raise InvalidCursor('Cursor does not match the sort order')
+    try:
+        key = date.fromisoformat(key) if sort == SORT_DATE else float(key)
+        return key, int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def _match_expression(owner, tokens):
+    # Every word matches as a prefix, so results update while the user types
+    return ' '.join(f'"{owner}_{token}"*' for token in tokens)
+
+
+def _page_by_date(query, after):
+    if after:
+        day, row_id = after
+        query = query.filter(or_(
+            Transaction.date < day,
+            and_(Transaction.date == day, Transaction.id < row_id)
+        ))
+    return query.order_by(Transaction.date.desc(), Transaction.id.desc())
+
+
+def _fts_transactions(owner, scope_filter, tokens, sort, after, limit):
+    matches = db.session.query(
+        transaction_search.c.rowid.label('id'), transaction_search.c.rank.label('rank')
+    ).filter(text('transaction_search MATCH :match'))
+
+    if sort == SORT_RELEVANCE:
+        # Rank and page inside the FTS table so only one page is joined
+        rank = transaction_search.c.rank
+        if after:
+            score, row_id = after
+            matches = matches.filter(or_(rank > score, and_(rank == score, transaction_search.c.rowid > row_id)))
+        matches = matches.order_by(rank, transaction_search.c.rowid).limit(limit)
+    matches = matches.subquery()
+
+    query = db.session.query(*TRANSACTION_COLUMNS, matches.c.rank).select_from(matches).join(
+        Transaction, Transaction.id == matches.c.id
+    ).outerjoin(
+        Category, Transaction.category_id == Category.id
+    ).outerjoin(
+        FamilyMember, Transaction.family_member_id == FamilyMember.id
+    ).filter(scope_filter).params(match=_match_expression(owner, tokens))
+
+    if sort == SORT_DATE:
+        query = _page_by_date(query, after)
+    else:
+        query = query.order_by(matches.c.rank, matches.c.id)
+    return query.limit(limit).all()
+
+
+def _scan_transactions(scope_filter, tokens, after, limit):
+    query = db.session.query(*TRANSACTION_COLUMNS).outerjoin(
+        Category, Transaction.category_id == Category.id
+    ).outerjoin(
+        FamilyMember, Transaction.family_member_id == FamilyMember.id
+    ).filter(scope_filter)
+    for token in tokens:
+        pattern = f'%{token}%'
+        query = query.filter(or_(Transaction.description.ilike(pattern), Category.name.ilike(pattern)))
+    return _page_by_date(query, after).limit(limit).all()
+
+
+def find_transactions(identity, query, scope='user', sort=SORT_RELEVANCE, cursor=None, limit=20):
+    """
+    Search descriptions and category names within the user's (or family's)
+    transactions.  Returns ``(results, next_cursor)``; ``next_cursor`` is None
+    on the last page.
+    """
+    tokens = words(query)
+    if not tokens:
+        return [], None
+
+    if scope == 'family':
+        owner = f'f{identity.family_id}'
+        scope_filter = Transaction.family_id == identity.family_id
+    else:
+        owner = f'u{identity.user_id}'
+        scope_filter = Transaction.user_id == identity.user_id
+
+    indexed = current_app.extensions.get('transaction_search')
+    if not indexed:
+        sort = SORT_DATE  # no relevance scores without the index
+    after = decode_cursor(cursor, sort) if cursor else None
+
+    if indexed:
+        rows = _fts_transactions(owner, scope_filter, tokens, sort, after, limit + 1)
+    else:
+        rows = _scan_transactions(scope_filter, tokens, after, limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if sort == SORT_DATE:
+            next_cursor = encode_cursor(sort, last[5].isoformat(), last[0])
+        else:
+            next_cursor = encode_cursor(sort, last[8], last[0])
+
+    results = [{
+        'id': row[0],
+        'type': row[1],
+        'amount': row[2],
+        'category': row[3],
+        'description': row[4],
+        'date': row[5],
+        'familyMember': row[6],
+        'isRecurring': row[7]
+    } for row in rows]
+    return results, next_cursor
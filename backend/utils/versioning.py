@@ -0,0 +1,197 @@
+"""
+Per-scope data versions and conditional GET support.
+
+Every flush that touches user or family data bumps a counter in the
+``data_version`` table.  Read endpoints derive a weak ETag from those
+counters, so a repeat request is answered with a single primary-key lookup
+and no body hashing.
+
+Finer-grained counters are kept for month-level aggregates: a change to a
+transaction or monthly plan also bumps ``user_month:YYYY-MM`` /
+``family_month:YYYY-MM`` for the month(s) it falls in, and category changes
+bump ``user_categories`` / ``family_categories``.  Caches of per-month
+results compare against these so one new transaction only invalidates its
+own month.
+"""
+from collections import namedtuple
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import and_, event, inspect, or_
+from sqlalchemy.orm import aliased
+
+from models import db, DataVersion, User, Transaction, Category, FamilyMember, MonthlyPlan
+
+SCOPE_USER = 'user'
+SCOPE_FAMILY = 'family'
+SCOPE_USER_CATEGORIES = 'user_categories'
+SCOPE_FAMILY_CATEGORIES = 'family_categories'
+
+
+def user_month_scope(month):
+    return f'user_month:{month}'
+
+
+def family_month_scope(month):
+    return f'family_month:{month}'
+
+# Models whose rows carry user_id/family_id columns that feed read endpoints
+_SCOPED_MODELS = (Transaction, Category, FamilyMember, MonthlyPlan)
+
+
+def _column_values(obj, column):
+    """Current and pre-flush values of a column on a flushed object."""
+    history = inspect(obj).attrs[column].history
+    values = set(history.added or ()) | set(history.unchanged or ()) | set(history.deleted or ())
+    return {int(v) for v in values if v is not None}
+
+
+def _months(obj, column):
+    """Months (YYYY-MM) of the current and pre-flush values of a date/month column."""
+    history = inspect(obj).attrs[column].history
+    values = set(history.added or ()) | set(history.unchanged or ()) | set(history.deleted or ())
+    return {v.strftime('%Y-%m') if hasattr(v, 'strftime') else str(v)[:7] for v in values if v is not None}
+
+
+def _month_scopes(obj, months):
+    scopes = set()
+    for month in months:
+        scopes.update((user_month_scope(month), v) for v in _column_values(obj, 'user_id'))
+        scopes.update((family_month_scope(month), v) for v in _column_values(obj, 'family_id'))
+    return scopes
+
+
+def _touched_scopes(session):
+    scopes = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+
+        if isinstance(obj, _SCOPED_MODELS):
+            scopes.update((SCOPE_USER, v) for v in _column_values(obj, 'user_id'))
+            scopes.update((SCOPE_FAMILY, v) for v in _column_values(obj, 'family_id'))
+            if isinstance(obj, Transaction):
+                scopes.update(_month_scopes(obj, _months(obj, 'date')))
+            elif isinstance(obj, MonthlyPlan):
+                scopes.update(_month_scopes(obj, _months(obj, 'month')))
+            elif isinstance(obj, Category):
+                scopes.update((SCOPE_USER_CATEGORIES, v) for v in _column_values(obj, 'user_id'))
+                scopes.update((SCOPE_FAMILY_CATEGORIES, v) for v in _column_values(obj, 'family_id'))
+        elif isinstance(obj, User):
+            # Joining/leaving a family changes what every family-scoped read returns
+            family_ids = _column_values(obj, 'family_id')
+            if obj in session.new or len(family_ids) > 1 or inspect(obj).attrs.is_family_admin.history.has_changes():
+                scopes.add((SCOPE_USER, obj.id))
+                scopes.update((SCOPE_FAMILY, v) for v in family_ids)
+    return scopes
+
+
+def bump_version(connection, scope, scope_id):
+    """Increment the version of a scope inside the caller's transaction."""
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    result = connection.execute(
+        table.update()
+        .where(and_(table.c.scope == scope, table.c.scope_id == scope_id))
+        .values(version=table.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(scope=scope, scope_id=scope_id, version=1, updated_at=now))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_versions_after_flush(session, flush_context):
+    scopes = _touched_scopes(session)
+    if not scopes:
+        return
+    connection = session.connection()
+    for scope, scope_id in sorted(scopes):
+        bump_version(connection, scope, scope_id)
+
+
+class ScopeVersions(namedtuple('ScopeVersions', ['user_id', 'family_id', 'user_version', 'family_version'])):
+    def etag(self, scopes):
+        parts = []
+        if SCOPE_USER in scopes:
+            parts.append(f'u{self.user_id}.{self.user_version or 0}')
+        if SCOPE_FAMILY in scopes:
+            parts.append(f'f{self.family_id or 0}.{self.family_version or 0}')
+        return '-'.join(parts)
+
+
+def load_versions(user_id):
+    """Fetch the user's family id and both scope versions in one indexed query."""
+    user_version = aliased(DataVersion)
+    family_version = aliased(DataVersion)
+    row = db.session.query(
+        User.family_id, user_version.version, family_version.version
+    ).outerjoin(
+        user_version, and_(user_version.scope == SCOPE_USER, user_version.scope_id == User.id)
+    ).outerjoin(
+        family_version, and_(family_version.scope == SCOPE_FAMILY, family_version.scope_id == User.family_id)
+    ).filter(User.id == int(user_id)).first()
+
+    if row is None:
+        return None
+    return ScopeVersions(int(user_id), row[0], row[1], row[2])
+
+
+def conditional_get(*scopes, key=None, vary=()):
+    """
+    Answer GET requests with 304 when the client's ETag is still current.
+
+    Must be applied below ``jwt_required`` so the identity is available.  The
+    wrapped view only runs when the data version has moved on, or when
+    ``key()`` (for views whose response depends on more than the data, such
+    as a range ending today by default) returns something new.  ``vary``
+    names request headers besides Authorization that select the response.
+    """
+    scopes = scopes or (SCOPE_USER,)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            versions = load_versions(get_jwt_identity())
+            if versions is None:
+                return f(*args, **kwargs)
+
+            etag = versions.etag(scopes)
+            extra = key() if key is not None else None
+            if extra:
+                etag = f'{etag}-{extra}'
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Authorization')
+            for header in vary:
+                response.vary.add(header)
+            return response
+        return decorated_function
+    return decorator
+
+
+def load_scope_versions(keys):
+    """Current versions of ``(scope, scope_id)`` pairs; missing scopes are 0."""
+    keys = [(scope, scope_id) for scope, scope_id in keys if scope_id is not None]
+    versions = dict.fromkeys(keys, 0)
+    by_id = {}
+    for scope, scope_id in keys:
+        by_id.setdefault(scope_id, []).append(scope)
+    if not by_id:
+        return versions
+
+    rows = db.session.query(DataVersion.scope, DataVersion.scope_id, DataVersion.version).filter(or_(*(
+        and_(DataVersion.scope_id == scope_id, DataVersion.scope.in_(scopes))
+        for scope_id, scopes in by_id.items()
+    )))
+    for scope, scope_id, version in rows:
+        versions[(scope, scope_id)] = version
+    return versions
@@ -6,34 +6,74 @@ const AINotificationSystem = () => {
     const [notifications, setNotifications] = useState([]);
     const [showNotifications, setShowNotifications] = useState(false);
     const [hasUnread, setHasUnread] = useState(false);
+    const [nextBefore, setNextBefore] = useState(null);
 
-    // Fetch notifications on component mount
+    // Load the first page once, then let the server push new notifications
     useEffect(() => {
         fetchNotifications();
-        
-        // Set up polling to check for new notifications
-        const interval = setInterval(fetchNotifications, 60000); // Check every minute
-        
-        return () => clearInterval(interval);
+
+        let source = null;
+        let reconnectTimer = null;
+        let closed = false;
+
+        const connect = () => {
+            source = new EventSource(api.ai.notificationStreamUrl());
+
+            source.addEventListener('unread', (event) => {
+                setHasUnread(JSON.parse(event.data).unread > 0);
+            });
+
+            source.addEventListener('notification', (event) => {
+                const notification = JSON.parse(event.data);
+                setNotifications(prev => (
+                    prev.some(n => n.id === notification.id) ? prev : [notification, ...prev]
+                ));
+                setHasUnread(true);
+                if (notification.priority === 'high') {
+                    showBrowserNotification(notification);
+                }
+            });
+
+            // The stream fell too far behind: reload the first page
+            source.addEventListener('resync', () => fetchNotifications());
+
+            source.onerror = () => {
+                // EventSource retries dropped connections by itself; it gives up on
+                // an error status (e.g. an expired token), so refresh and reconnect
+                if (source.readyState === EventSource.CLOSED && !closed) {
+                    reconnectTimer = setTimeout(async () => {
+                        try {
+                            await api.ai.getUnreadNotificationCount(); // refreshes the token on 401
+                        } catch (err) {
+                            console.error('Notification stream reconnect failed:', err);
+                        }
+                        if (!closed) connect();
+                    }, 5000);
+                }
+            };
+        };
+        connect();
+
+        return () => {
+            closed = true;
+            clearTimeout(reconnectTimer);
+            if (source) source.close();
+        };
     }, []);
 
-    const fetchNotifications = async () => {
+    const fetchNotifications = async (before = null) => {
         try {
-            const response = await api.get('/ai/notifications');
-            
-            // Check if there are any new notifications compared to what we have
-            const newNotifications = response.data.notifications;
-            if (newNotifications.length > notifications.length) {
+            const response = await api.ai.getNotifications(before ? { before } : {});
+            const page = response.data.notifications;
+            setNotifications(prev => {
+                if (!before) return page;
+                const seen = new Set(prev.map(n => n.id));
+                return [...prev, ...page.filter(n => !seen.has(n.id))];
+            });
+            setNextBefore(response.data.next_before);
+            if (!before && page.some(n => !n.read)) {
                 setHasUnread(true);
-                
-                // If there are any critical alerts, show notification
-                const criticalAlerts = newNotifications.filter(n => n.priority === 'high' && !n.read);
-                if (criticalAlerts.length > 0) {
-                    showBrowserNotification(criticalAlerts[0]);
-                }
             }
-            
-            setNotifications(newNotifications);
         } catch (err) {
             console.error('Error fetching notifications:', err);
         }
@@ -79,7 +119,17 @@ const AINotificationSystem = () => {
         }
     };
 
-    const dismissNotification = (id) => {
+    const markAllAsRead = async () => {
+        try {
+            await api.ai.markNotificationsRead({ before: new Date().toISOString() });
+            setNotifications(prev => prev.map(notification => ({ ...notification, read: true })));
+            setHasUnread(false);
+        } catch (err) {
+            console.error('Error marking notifications as read:', err);
+        }
+    };
+
+    const dismissNotification = async (id) => {
         setNotifications(prevNotifications => 
             prevNotifications.filter(notification => notification.id !== id)
         );
@@ -87,6 +137,12 @@ const AINotificationSystem = () => {
         // Check if there are any unread notifications left
         const unreadNotifications = notifications.filter(n => !n.read && n.id !== id);
         setHasUnread(unreadNotifications.length > 0);
+
+        try {
+            await api.ai.dismissNotifications({ ids: [id] });
+        } catch (err) {
+            console.error('Error dismissing notification:', err);
+        }
     };
 
     const getNotificationColor = (type) => {
@@ -123,12 +179,22 @@ const AINotificationSystem = () => {
                 <div className="absolute right-0 mt-2 w-80 bg-white rounded-xl shadow-lg z-50 border border-gray-200 overflow-hidden">
                     <div className="p-3 border-b border-gray-200 flex justify-between items-center">
                         <h3 className="font-medium text-gray-800">Notifications</h3>
-                        <button
-                            onClick={() => setShowNotifications(false)}
-                            className="p-1 hover:bg-gray-100 rounded-full"
-                        >
-                            <X className="w-4 h-4 text-gray-500" />
-                        </button>
+                        <div className="flex items-center gap-2">
+                            {notifications.some(n => !n.read) && (
+                                <button
+                                    onClick={markAllAsRead}
+                                    className="text-xs text-blue-600 hover:text-blue-800"
+                                >
+                                    Mark all as read
+                                </button>
+                            )}
+                            <button
+                                onClick={() => setShowNotifications(false)}
+                                className="p-1 hover:bg-gray-100 rounded-full"
+                            >
+                                <X className="w-4 h-4 text-gray-500" />
+                            </button>
+                        </div>
                     </div>
 
                     <div className="max-h-96 overflow-y-auto">
@@ -168,6 +234,14 @@ const AINotificationSystem = () => {
                                         </div>
                                     </div>
                                 ))}
+                                {nextBefore && (
+                                    <button
+                                        onClick={() => fetchNotifications(nextBefore)}
+                                        className="w-full p-2 text-xs text-blue-600 hover:bg-gray-50"
+                                    >
+                                        Load older notifications
+                                    </button>
+                                )}
                             </div>
                         )}
                     </div>
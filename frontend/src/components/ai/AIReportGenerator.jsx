@@ -6,18 +6,16 @@ const AIReportGenerator = ({ startDate, endDate, transactionData }) => {
     const [report, setReport] = useState(null);
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState(null);
+    const [progress, setProgress] = useState(0);
 
     const generateReport = async () => {
         setLoading(true);
         setError(null);
+        setProgress(0);
         
         try {
-            const response = await api.post('/ai/generate-report', {
-                startDate,
-                endDate,
-                transactionData
-            });
-            setReport(response.data.report);
+            // The report is computed in a background job; this resolves when it is done
+            setReport(await api.ai.runReport(startDate, endDate, setProgress));
         } catch (err) {
             console.error('Error generating AI report:', err);
             setError('Failed to generate AI report');
@@ -58,7 +56,7 @@ const AIReportGenerator = ({ startDate, endDate, transactionData }) => {
                         {loading ? (
                             <>
                                 <RefreshCw className="w-5 h-5 animate-spin" />
-                                Generating...
+                                {progress > 0 ? `Generating... ${progress}%` : 'Generating...'}
                             </>
                         ) : (
                             <>
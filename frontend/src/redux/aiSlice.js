@@ -37,8 +37,7 @@ export const getBudgetRecommendations = createAsyncThunk(
 export const generateAIReport = createAsyncThunk(
     'ai/generateReport',
     async ({ startDate, endDate }) => {
-        const response = await api.ai.generateReport(startDate, endDate);
-        return response.data.report;
+        return await api.ai.runReport(startDate, endDate);
     }
 );
 
@@ -10,6 +10,9 @@ export const login = createAsyncThunk('auth/login', async (credentials, { reject
       throw new Error('No token received');
     }
     localStorage.setItem('token', token);
+    if (response.data.refresh_token) {
+      localStorage.setItem('refreshToken', response.data.refresh_token);
+    }
     api.defaults.headers.common['Authorization'] = `Bearer ${token}`;
     
     // Fetch user profile after successful login
@@ -17,6 +20,7 @@ export const login = createAsyncThunk('auth/login', async (credentials, { reject
     return { ...response.data, profile: profileResponse.data };
   } catch (error) {
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     delete api.defaults.headers.common['Authorization'];
     return rejectWithValue(error.response?.data?.message || 'Login failed');
   }
@@ -110,6 +114,7 @@ const authSlice = createSlice({
         error: null
       };
       localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
       delete api.defaults.headers.common['Authorization'];
     },
     clearError: (state) => {
@@ -53,6 +53,23 @@ api.interceptors.response.use(
     console.error('Response error:', error.response || error);
     
     if (error.response) {
+      // Access tokens are short-lived: swap an expired one for a new one and retry once
+      const originalRequest = error.config;
+      const refreshToken = localStorage.getItem('refreshToken');
+      if (error.response.status === 401 && refreshToken && originalRequest && !originalRequest._retry) {
+        originalRequest._retry = true;
+        try {
+          const { data } = await axios.post(`${api.defaults.baseURL}token/refresh`, null, {
+            headers: { Authorization: `Bearer ${refreshToken}` }
+          });
+          localStorage.setItem('token', data.token);
+          originalRequest.headers.Authorization = `Bearer ${data.token}`;
+          return api(originalRequest);
+        } catch (refreshError) {
+          console.log('Token refresh failed:', refreshError.response || refreshError);
+        }
+      }
+
       // Handle 401 (Unauthorized), 403 (Forbidden), and 422 (Unprocessable Entity - Invalid Token)
       if (error.response.status === 401 || error.response.status === 422) {
         console.log('Token error detected, logging out...');
@@ -133,28 +150,69 @@ const aiApi = {
   // Get AI insights
   getInsights: (transactions) => api.post('/ai/analyze', { transactions }),
   
+  // Insights precomputed by the nightly batch ({ insights, computed_at, stale })
+  getStoredInsights: () => api.get('/ai/insights'),
+
   // Get budget recommendations
-  getBudgetRecommendations: (currentBudget, monthlyIncome) => 
+  getBudgetRecommendations: (currentBudget, monthlyIncome) =>
     api.post('/ai/budget/recommendations', { currentBudget, monthlyIncome }),
+
+  // This month's precomputed recommendations ({ recommendations, month, applied, computed_at, stale })
+  getStoredBudgetRecommendations: () => api.get('/ai/budget/recommendations'),
   
-  // Generate AI report
+  // Queue an AI report; returns the job ({ id, status, progress })
   generateReport: (startDate, endDate) => 
     api.post('/ai/generate-report', { startDate, endDate }),
+
+  // Long-polls until the job finishes (or `wait` seconds pass)
+  getReportJob: (jobId, wait = 25) =>
+    api.get(`/ai/report-jobs/${jobId}`, { params: { wait } }),
+
+  // Queue a report and resolve with it once the background job is done
+  runReport: async (startDate, endDate, onProgress = () => {}) => {
+    let { data } = await api.post('/ai/generate-report', { startDate, endDate });
+    while (data.job.status === 'pending' || data.job.status === 'running') {
+      onProgress(data.job.progress);
+      ({ data } = await api.get(`/ai/report-jobs/${data.job.id}`, { params: { wait: 25 } }));
+    }
+    if (data.job.status !== 'done') {
+      throw new Error(data.job.error || 'Report generation failed');
+    }
+    onProgress(100);
+    return data.report;
+  },
   
   // Get savings plan
   getSavingsPlan: (goal, targetDate = null) => 
     api.post('/ai/savings-plan', { goal, targetDate }),
+
+  // Same plan plus a Monte Carlo simulation over the user's monthly net cash flow
+  // (plan.simulation: probability_of_reaching_goal, months_to_goal, bands per month)
+  simulateSavingsPlan: (goal, targetDate = null) =>
+    api.post('/ai/savings-plan', { goal, targetDate, mode: 'simulation' }),
+
+  // Optimize family budget over members x categories; familyMembers defaults to the
+  // whole family, categoryMinimums is { categoryName: amount }. What-if calls are cheap.
+  optimizeFamilyBudget: (familyMembers, totalBudget, categoryMinimums = {}) =>
+    api.post('/ai/family/optimize-budget', { familyMembers, totalBudget, categoryMinimums }),
   
-  // Optimize family budget
-  optimizeFamilyBudget: (familyMembers, totalBudget) => 
-    api.post('/ai/family/optimize-budget', { familyMembers, totalBudget }),
-  
-  // Get AI notifications
-  getNotifications: () => api.get('/ai/notifications'),
+  // Get AI notifications, newest first ({ limit, before } pages further back)
+  getNotifications: (params = {}) => api.get('/ai/notifications', { params }),
+
+  getUnreadNotificationCount: () => api.get('/ai/notifications/unread-count'),
+
+  // EventSource can't send an Authorization header, so the token goes in the URL
+  notificationStreamUrl: () =>
+    `${api.defaults.baseURL}ai/notifications/stream?jwt=${encodeURIComponent(localStorage.getItem('token') || '')}`,
   
   // Mark notification as read
   markNotificationRead: (notificationId) => 
-    api.put(`/ai/notifications/${notificationId}/read`)
+    api.put(`/ai/notifications/${notificationId}/read`),
+
+  // Bulk operations take { ids: [...] } and/or { before: ISO timestamp }
+  markNotificationsRead: (selection) => api.put('/ai/notifications/read', selection),
+
+  dismissNotifications: (selection) => api.put('/ai/notifications/dismiss', selection)
 };
 
 // Monthly Plans API calls
@@ -170,7 +228,27 @@ const monthlyPlansApi = {
       throw error;
     }
   },
-  
+
+  // Every month from..to (YYYY-MM, inclusive) in one request
+  getMonthlyPlans: async (from, to) => {
+    try {
+      return await api.get('/monthly-plans', { params: { from, to } });
+    } catch (error) {
+      console.error('Error fetching monthly plans:', error.response?.data || error);
+      throw error;
+    }
+  },
+
+  // Create or update several months in one request
+  saveMonthlyPlans: async (plans) => {
+    try {
+      return await api.put('/monthly-plans', { plans });
+    } catch (error) {
+      console.error('Error saving monthly plans:', error.response?.data || error);
+      throw error;
+    }
+  },
+
   createMonthlyPlan: async (month, data) => {
     console.log('Creating monthly plan for:', month, 'with data:', data);
     if (!data.expectedIncome || !data.expectedExpenses) {
@@ -238,13 +316,52 @@ const monthlyPlansApi = {
   }
 };
 
+// Transaction categorization (suggestions come from the on-box model; 503 while it is unavailable)
+const transactionsApi = {
+  // One list of { category, category_id, confidence } per description, best first;
+  // send a whole import at once. Posting a transaction without a category auto-assigns one.
+  categorize: (descriptions, type = 'expense', top = 3) =>
+    api.post('/transactions/categorize', { descriptions, type, top }),
+};
+
+// Analytics API calls
+const analyticsApi = {
+  // Per category and overall: count, mean, std, quantiles ({ p50, p90 }) and top_merchants.
+  // params: { scope: 'user' | 'family', type: 'expense' | 'income', percentiles: '50,90,99', top }
+  getSpendingDistribution: (params = {}) => api.get('/analytics/spending-distribution', { params }),
+
+  // Running balance at the end of each step: { dates: [...], balances: [...] }
+  // from/to are YYYY-MM-DD (default: this month so far); step is 'day' | 'week' | 'month'
+  getBalance: (from, to, step = 'day', scope = 'user') =>
+    api.get('/analytics/balance', { params: { from, to, step, scope } }),
+
+  // Gap-filled series: { periods: [...], series: { key: { amount, rolling_average, change } } }
+  // params: { from, to, bucket: 'day' | 'week' | 'month', group: 'type' | 'category', type, window, scope }
+  getCashflow: (params = {}) => api.get('/analytics/cashflow', { params }),
+};
+
+// Recurring transaction API calls
+const recurrencesApi = {
+  getRecurrences: () => api.get('/recurrences'),
+  // { type, amount, category, description, familyMember, startDate, frequency, interval, endDate }
+  // or { fromTransaction: id, frequency, interval, endDate }
+  createRecurrence: (data) => api.post('/recurrences', data),
+  updateRecurrence: (id, data) => api.put(`/recurrences/${id}`, data),
+  deleteRecurrence: (id) => api.delete(`/recurrences/${id}`),
+  // Committed income/expenses per month for the next `months` months
+  getForecast: (months = 3) => api.get('/recurrences/forecast', { params: { months } }),
+};
+
 // Extend the api object with the new endpoints
 Object.assign(api, {
   family: familyApi,
   user: userApi,
   categories: categoriesApi,
   ai: aiApi,
-  monthlyPlans: monthlyPlansApi
+  monthlyPlans: monthlyPlansApi,
+  transactions: transactionsApi,
+  analytics: analyticsApi,
+  recurrences: recurrencesApi
 });
 
 // Initialize headers if token exists